@@ -0,0 +1,352 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Pluggable caches for BJJAIAdvisor responses
+
+# Seconds a SQLite cache row's LRU access time may lag behind its reads; hits inside it are pure reads
+ACCESS_RESOLUTION_SECONDS = 60.0
+
+
+def make_cache_key(
+    kind: str, injuries: Any, model: str, prompt_version: str, params: Dict[str, Any], context: Optional[str] = None
+) -> str:
+    """
+    Build a process-stable cache key from the full request content
+
+    Unlike ``hash()``, a sha256 over canonical JSON is identical across workers,
+    cold starts and PYTHONHASHSEED values. ``context`` (e.g. the knowledge-base
+    version the prompt's technique lists came from) is only part of the key when given.
+    """
+    fields = {
+        "kind": kind,
+        "injuries": injuries,
+        "model": model,
+        "prompt_version": prompt_version,
+        "params": params,
+    }
+    if context is not None:
+        fields["context"] = context
+    material = json.dumps(
+        fields,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return f"{kind}_{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+
+
+class CacheStats:
+    def __init__(self):
+        """Hit/miss/eviction counters so cache size can be tuned"""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale_hits": self.stale_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class MemoryCache:
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 24 * 3600, stale_ttl: float = 7 * 24 * 3600):
+        """
+        In-process LRU cache with a size cap and per-entry TTL
+
+        Entries past ``ttl`` are misses for get() but stay available to
+        get_stale() for another ``stale_ttl`` seconds.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats_counters = CacheStats()
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.stats_counters.incr("misses")
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                if time.time() - stored_at > self.ttl + self.stale_ttl:
+                    del self._data[key]
+                self.stats_counters.incr("expirations")
+                self.stats_counters.incr("misses")
+                return None
+            self._data.move_to_end(key)
+            self.stats_counters.incr("hits")
+            return value
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Return an expired entry still inside its stale window (fresh entries are left to get())"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self.ttl is None:
+                return None
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age <= self.ttl or age > self.ttl + self.stale_ttl:
+                return None
+            self.stats_counters.incr("stale_hits")
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.stats_counters.incr("evictions")
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.stats_counters.as_dict()
+        stats.update({"backend": "memory", "size": len(self), "max_entries": self.max_entries})
+        return stats
+
+
+class SQLiteCache:
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        stale_ttl: float = 7 * 24 * 3600,
+        access_resolution: float = ACCESS_RESOLUTION_SECONDS,
+    ):
+        """
+        On-disk LRU + TTL cache shared by every worker process on the host
+
+        Counters are per process; size is read from the shared table. Expired
+        rows stay readable through get_stale() for ``stale_ttl`` seconds. A hit
+        only writes the row's access time when it is more than
+        ``access_resolution`` seconds old, so hot keys are read without
+        taking the database write lock; eviction order is LRU to that resolution.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.access_resolution = access_resolution
+        self.stats_counters = CacheStats()
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ai_cache_accessed ON ai_cache (accessed)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache_leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.commit()
+        self._owner = uuid.uuid4().hex
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread, reopened after fork (e.g. gunicorn --preload)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        conn = self._conn()
+        row = conn.execute("SELECT value, created, accessed FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.stats_counters.incr("misses")
+            return None
+        value, created, accessed = row
+        now = time.time()
+        if self.ttl is not None and now - created > self.ttl:
+            if now - created > self.ttl + self.stale_ttl:
+                conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                conn.commit()
+            self.stats_counters.incr("expirations")
+            self.stats_counters.incr("misses")
+            return None
+        if now - accessed > self.access_resolution:
+            # Other workers may have bumped it meanwhile; the condition keeps their write
+            conn.execute(
+                "UPDATE ai_cache SET accessed = ? WHERE key = ? AND accessed < ?",
+                (now, key, now - self.access_resolution),
+            )
+            conn.commit()
+        self.stats_counters.incr("hits")
+        return json.loads(value)
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Return an expired row still inside its stale window (fresh rows are left to get())"""
+        if self.ttl is None:
+            return None
+        row = self._conn().execute("SELECT value, created FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        age = time.time() - row[1]
+        if age <= self.ttl or age > self.ttl + self.stale_ttl:
+            return None
+        self.stats_counters.incr("stale_hits")
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now),
+        )
+        (size,) = conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()
+        overflow = size - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY accessed LIMIT ?)",
+                (overflow,),
+            )
+            self.stats_counters.incr("evictions", overflow)
+        conn.commit()
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        """Claim the right to compute ``key`` across processes; expired leases are taken over"""
+        conn = self._conn()
+        now = time.time()
+        owner = f"{self._owner}:{os.getpid()}:{threading.get_ident()}"
+        conn.execute("DELETE FROM ai_cache_leases WHERE key = ? AND expires < ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO ai_cache_leases (key, owner, expires) VALUES (?, ?, ?)", (key, owner, now + ttl)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+    def release_lease(self, key: str):
+        conn = self._conn()
+        owner = f"{self._owner}:{os.getpid()}:{threading.get_ident()}"
+        conn.execute("DELETE FROM ai_cache_leases WHERE key = ? AND owner = ?", (key, owner))
+        conn.commit()
+
+    def __contains__(self, key: str) -> bool:
+        row = self._conn().execute("SELECT 1 FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        (size,) = self._conn().execute("SELECT COUNT(*) FROM ai_cache").fetchone()
+        return size
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM ai_cache")
+        conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.stats_counters.as_dict()
+        stats.update({"backend": "sqlite", "path": self.path, "size": len(self), "max_entries": self.max_entries})
+        return stats
+
+
+class PrewarmedCache:
+    def __init__(self, cache, entries: Dict[str, Any]):
+        """
+        Read-only layer of pre-generated answers in front of a live cache
+
+        ``entries`` come from an offline pre-warm artifact (see prewarm.py) and
+        never expire or get evicted; misses fall through to ``cache``, which
+        still receives every write.
+        """
+        self.cache = cache
+        self.entries = dict(entries)
+        self.prewarmed_hits = 0
+        self._lock = threading.Lock()
+        if hasattr(cache, "acquire_lease"):
+            self.acquire_lease = cache.acquire_lease
+            self.release_lease = cache.release_lease
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.entries.get(key)
+        if value is not None:
+            self.cache.stats_counters.incr("hits")
+            with self._lock:
+                self.prewarmed_hits += 1
+            return value
+        return self.cache.get(key)
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        # Artifact entries never expire, so only the live cache can hold stale ones
+        return self.cache.get_stale(key)
+
+    def set(self, key: str, value: Any):
+        self.cache.set(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries or key in self.cache
+
+    def __len__(self) -> int:
+        return len(self.entries) + len(self.cache)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats.update({"prewarmed": len(self.entries), "prewarmed_hits": self.prewarmed_hits})
+        return stats
+
+
+def create_cache():
+    """
+    Build the advisor cache from environment settings
+
+    BJJ_CACHE_BACKEND: "memory" (default) or "sqlite"
+    BJJ_CACHE_PATH: SQLite file path (default: /tmp/bjj_ai_cache.sqlite3)
+    BJJ_CACHE_MAX_ENTRIES / BJJ_CACHE_TTL: size cap and TTL in seconds
+    BJJ_CACHE_STALE_TTL: how long past the TTL an entry may still be served while it is refreshed
+    """
+    backend = os.getenv("BJJ_CACHE_BACKEND", "memory").lower()
+    max_entries = os.getenv("BJJ_CACHE_MAX_ENTRIES")
+    ttl = os.getenv("BJJ_CACHE_TTL")
+    stale_ttl = os.getenv("BJJ_CACHE_STALE_TTL")
+    kwargs: Dict[str, Any] = {}
+    if max_entries:
+        kwargs["max_entries"] = int(max_entries)
+    if ttl:
+        kwargs["ttl"] = float(ttl)
+    if stale_ttl:
+        kwargs["stale_ttl"] = float(stale_ttl)
+
+    if backend == "sqlite":
+        path = os.getenv("BJJ_CACHE_PATH", "/tmp/bjj_ai_cache.sqlite3")
+        return SQLiteCache(path, **kwargs)
+    return MemoryCache(**kwargs)
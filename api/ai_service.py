@@ -1,88 +1,138 @@
-import os
-import requests
+import threading
 import time
-from typing import List, Dict, Any
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from ai_cache import create_cache, make_cache_key
+from circuit_breaker import CircuitOpen
+from llm_backends import DEFAULT_API_URL, MODEL_NAME, TASK_CHAT, TASK_RECOMMENDATIONS, TASK_RECOVERY, LLMCall
+from llm_router import create_router
+from metrics import metrics
+from rate_limiter import PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_RECOMMENDATIONS, AdmissionRejected
+from singleflight import FlightTimeout, SingleFlight
 
 # AI service for BJJ injury recommendations
 
-class BJJAIAdvisor:
-    def __init__(self):
-        """Initialize the AI advisor with NVIDIA Cloud API"""
-        self.api_key = os.getenv('NVIDIA_API_KEY')
-        self.api_url = "https://integrate.api.nvidia.com/v1/chat/completions"
-        self.model_name = "nvidia/nvidia-nemotron-nano-9b-v2"
-        self.cache = {} 
-    
-    def chat_completion(self, messages: List[Dict[str, str]], max_tokens: int = 600, temperature: float = 0.1) -> str:
-        """Run a chat completion with a list of messages [{role, content}]."""
-        if not self.api_key:
-            return "AI service not configured. Please set NVIDIA_API_KEY environment variable."
-
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "top_p": 0.8,
-            "frequency_penalty": 0.2,
-            "presence_penalty": 0.2,
-            "extra_body": {
-                "min_thinking_tokens": 0,
-                "max_thinking_tokens": 2000
-            }
-        }
+# Bump whenever the recommendation/recovery prompt templates change so cached answers are not reused
+PROMPT_TEMPLATE_VERSION = "2"
 
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+# Sampling parameters for the long-form recommendation and recovery reports
+REPORT_PARAMS = {
+    "max_tokens": 1200,
+    "temperature": 0.1,
+    "top_p": 0.8,
+    "frequency_penalty": 0.2,
+    "presence_penalty": 0.2,
+}
 
-        response = self._post_with_retry(self.api_url, payload, headers, max_retries=5, backoff=1.5, timeout=25)
+# Reply when no backend can answer a call (no API key and the template fallback disabled)
+NOT_CONFIGURED_MESSAGE = "AI service not configured. Please set NVIDIA_API_KEY environment variable."
 
-        # Log raw response for debugging
-        try:
-            print("[NVIDIA API] status:", response.status_code)
-            preview = response.text[:500]
-            print("[NVIDIA API] body preview:", preview)
-        except Exception:
-            pass
+# Degraded reply when admission control turns a call away instead of queueing it past its deadline
+BUSY_MESSAGE = "The AI coach is handling a lot of requests right now. Please try again in a moment."
 
-        response.raise_for_status()
+# Degraded reply while the circuit breaker is open and no cached answer exists
+UNAVAILABLE_MESSAGE = "The AI coach is temporarily unavailable. Please try again shortly."
 
-        try:
-            result = response.json()
-        except Exception as e:
-            print("[NVIDIA API] JSON parse error:", e)
-            raise
+# Deadline (seconds) for background refreshes of stale cached answers
+REVALIDATE_DEADLINE_SECONDS = 120
 
-        try:
-            choices = result.get("choices", [])
-            first = choices[0] if choices else {}
-            message = first.get("message", {}) or {}
-
-            candidates = [
-                message.get("content"),
-                message.get("reasoning_content"),
-                first.get("text"),
-                (first.get("delta") or {}).get("content"),
-                (result.get("output") or {}).get("text"),
-            ]
-
-            for c in candidates:
-                if isinstance(c, str) and c.strip():
-                    return self._clean_response(c.strip())
-
-            print("[NVIDIA API] Unrecognized content structure keys:", {
-                "message_keys": list(message.keys()) if isinstance(message, dict) else type(message),
-                "first_keys": list(first.keys()) if isinstance(first, dict) else type(first),
-            })
-            return "AI response received but content was empty."
-        except Exception as e:
-            print("[NVIDIA API] Parse error:", e)
-            return "AI response received but could not be parsed."
+class BJJAIAdvisor:
+    def __init__(
+        self,
+        cache=None,
+        similarity=None,
+        knowledge_version=None,
+        router=None,
+        workers: int = 64,
+        background_workers: int = 4,
+        api_url: Optional[str] = None,
+    ):
+        """
+        Initialize the AI advisor; completions go through a BackendRouter (NVIDIA Cloud API by default)
 
-    def get_ai_recommendations(self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str]) -> Dict[str, str]:
+        Without a ``router``, one is built from the environment, with ``api_url``
+        (e.g. a local stand-in for the NVIDIA API) replacing NVIDIA_API_URL.
+
+        Each request's recommendation and recovery calls run on a pool of
+        ``workers`` threads, which should cover two per concurrent request the
+        server handles. Background refreshes and chat summaries get their own
+        ``background_workers`` threads so they never hold up a request.
+        """
+        self.cache = cache if cache is not None else create_cache()
+        # Picks the completion backend per call: task routes, failover, latency hedging and the local fallback
+        self.router = router if router is not None else create_router(api_url=api_url)
+        # Cache keys name the primary model; answers from any cacheable backend share them
+        self.model_name = self.router.model_name
+        # Optional TechniqueSimilarityIndex supplying safe alternatives for the prompt
+        self.similarity = similarity
+        # Optional callable returning the knowledge-base version; answers are cached per version
+        self.knowledge_version = knowledge_version
+        # Concurrent misses for the same key share one upstream call
+        self.inflight = SingleFlight(self.cache)
+        # Runs the recommendation and recovery calls side by side
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bjj-ai")
+        # Stale-while-revalidate refreshes and chat summaries; nobody waits on them
+        self._background = ThreadPoolExecutor(max_workers=background_workers, thread_name_prefix="bjj-ai-bg")
+        # Keys with a background refresh already scheduled
+        self._revalidating = set()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, kind: str, injuries: List[str]) -> str:
+        """Stable cache key covering injuries, model, prompt version, sampling params and knowledge base"""
+        return make_cache_key(
+            kind, sorted(injuries), self.model_name, PROMPT_TEMPLATE_VERSION, REPORT_PARAMS,
+            self.knowledge_version() if self.knowledge_version else None,
+        )
+
+    def configured(self, task: str = TASK_CHAT) -> bool:
+        """A model backend (not only the template fallback) can answer ``task``"""
+        return self.router.configured(task)
+
+    def upstream_stats(self) -> Dict[str, Any]:
+        """Stats of the primary remote backend (upstream, admission, circuit), empty parts without one"""
+        primary = self.router.primary
+        return primary.stats() if primary is not None else {"upstream": {}, "admission": {}, "circuit": {}}
+    
+    def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 600,
+        temperature: float = 0.1,
+        deadline: Optional[float] = None,
+        priority: int = PRIORITY_CHAT,
+        task: str = TASK_CHAT,
+    ) -> str:
+        """Run a chat completion with a list of messages [{role, content}]; ``deadline`` is a time.monotonic() value."""
+        if not self.router.available(task):
+            return NOT_CONFIGURED_MESSAGE
+
+        call = LLMCall(task, messages, chat_params(max_tokens, temperature))
+        return self.router.complete(call, deadline, priority).text
+
+    def _recommendation_call(self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str]) -> LLMCall:
+        """Report call whose prompt includes the safe techniques most similar to the unsafe ones"""
+        similar = self._similar_techniques(unsafe_moves)
+        prompt = self._create_recommendation_prompt(injuries, safe_moves, unsafe_moves, similar)
+        context = {
+            "injuries": injuries,
+            "safe_moves": safe_moves,
+            "unsafe_moves": unsafe_moves,
+            "similar": [t["metadata"]["technique"] for t in similar or []],
+        }
+        return LLMCall(TASK_RECOMMENDATIONS, [{"role": "user", "content": prompt}], REPORT_PARAMS, context)
+
+    def _recovery_call(self, injuries: List[str]) -> LLMCall:
+        prompt = self._create_recovery_prompt(injuries)
+        return LLMCall(TASK_RECOVERY, [{"role": "user", "content": prompt}], REPORT_PARAMS, {"injuries": injuries})
+
+    def get_ai_recommendations(
+        self,
+        injuries: List[str],
+        safe_moves: List[str],
+        unsafe_moves: List[str],
+        deadline: Optional[float] = None,
+        priority: int = PRIORITY_RECOMMENDATIONS,
+    ) -> Dict[str, str]:
         """
         Get AI-powered recommendations for BJJ training with injuries
         
@@ -90,226 +140,253 @@ class BJJAIAdvisor:
             injuries: List of user's injuries
             safe_moves: List of safe techniques
             unsafe_moves: List of unsafe techniques
+            deadline: Optional time.monotonic() value bounding upstream retries
+            priority: Admission priority for the upstream call (see rate_limiter)
             
         Returns:
             Dictionary with AI recommendations and recovery advice
         """
-        if not self.api_key:
+        if not self.router.available(TASK_RECOMMENDATIONS):
             return {
-                "recommendations": "AI service not configured. Please set NVIDIA_API_KEY environment variable.",
+                "recommendations": NOT_CONFIGURED_MESSAGE,
                 "recovery_advice": "Consult with a healthcare professional for personalized recovery advice."
             }
         
-        # Check cache first
-        cache_key = f"rec_{hash(tuple(sorted(injuries)))}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
-        
-        # Build prompt without vector-based context
-        prompt = self._create_recommendation_prompt(injuries, safe_moves, unsafe_moves, None)
+        cache_key = self._cache_key("rec", injuries)
         
-        try:
-            # Get AI response from NVIDIA Cloud API
-            ai_response = self._call_nvidia_api(prompt)
+        def fetch(call_deadline=deadline, call_priority=priority):
+            completion = self.router.complete(
+                self._recommendation_call(injuries, safe_moves, unsafe_moves), call_deadline, call_priority
+            )
             
             # Parse the response into structured recommendations
-            result = self._parse_ai_response(ai_response)
+            result = self._parse_ai_response(completion.text)
             
-            # Cache the result
-            self.cache[cache_key] = result
+            # Cache model answers; a fallback answer is served once and the next request asks a model again
+            if completion.cacheable:
+                self.cache.set(cache_key, result)
             return result
-            
+        
+        # Check cache first
+        cached = self._cached(cache_key, fetch)
+        if cached is not None:
+            return cached
+        
+        try:
+            return self.inflight.do(cache_key, fetch, deadline)
         except Exception as e:
-            print(f"Error calling NVIDIA Cloud API: {e}")
-            return {
-                "recommendations": "Unable to get AI recommendations at this time. Please check your API key and internet connection.",
-                "recovery_advice": "Please consult with a healthcare professional for personalized advice."
-            }
+            return recommendations_fallback(e)
+    
+    def _similar_techniques(self, unsafe_moves: List[str]) -> Optional[List[Dict]]:
+        """Safe techniques closest to the unsafe ones, in the similar_techniques prompt format"""
+        if self.similarity is None:
+            return None
+        return self.similarity.similar_alternatives(unsafe_moves, k=3)
+
+    def submit(self, fn, *args) -> Future:
+        """Run an advisor call for a waiting request on the worker pool"""
+        return self._executor.submit(fn, *args)
+
+    def submit_background(self, fn, *args) -> Future:
+        """Run work no request waits on (refreshes, summaries) on the background pool"""
+        return self._background.submit(fn, *args)
+
+    def _cached(self, cache_key: str, fetch) -> Optional[Any]:
+        """
+        Fresh cached value, else an expired one (stale-while-revalidate)
+
+        A stale hit is returned immediately while ``fetch`` refreshes the entry
+        in the background at background priority with its own deadline.
+        """
+        with metrics.span("cache_lookup"):
+            cached = self.cache.get(cache_key)
+            result = "hit"
+            if cached is None:
+                cached = self.cache.get_stale(cache_key)
+                result = "stale" if cached is not None else "miss"
+        metrics.inc("bjj_cache_lookups_total", result=result)
+        if result == "stale":
+            self._revalidate(cache_key, fetch)
+        return cached
+
+    def _revalidate(self, cache_key: str, fetch):
+        with self._lock:
+            if cache_key in self._revalidating:
+                return
+            self._revalidating.add(cache_key)
+
+        def refresh():
+            deadline = time.monotonic() + REVALIDATE_DEADLINE_SECONDS
+            try:
+                self.inflight.do(cache_key, lambda: fetch(deadline, PRIORITY_BACKGROUND), deadline)
+            except Exception as e:
+                print(f"Background refresh failed, keeping the stale answer: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(cache_key)
+
+        self.submit_background(refresh)
+
+    def get_full_advice(
+        self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str], timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Get recommendations and recovery advice concurrently under one shared deadline
+        
+        Args:
+            injuries: List of user's injuries
+            safe_moves: List of safe techniques
+            unsafe_moves: List of unsafe techniques
+            timeout: Overall deadline in seconds for both calls (None waits for both)
+            
+        Returns:
+            Dictionary with ai_recommendations, recovery_advice and the names of any
+            parts still pending when the deadline passed
+        """
+        return self.get_batch_advice([(injuries, safe_moves, unsafe_moves)], timeout)[0]
+
+    def get_batch_advice(
+        self,
+        profiles: List[Tuple[List[str], List[str], List[str]]],
+        timeout: Optional[float] = None,
+        max_concurrency: int = 1,
+    ) -> List[Dict[str, Any]]:
+        """
+        get_full_advice for many (injuries, safe_moves, unsafe_moves) profiles under one overall deadline
+
+        At most ``max_concurrency`` profiles have calls in flight at once; the
+        next profile starts as soon as one finishes. Parts still running at the
+        deadline keep going and fill the cache, and profiles never started are
+        reported with both parts pending.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        started: List[Dict[str, Future]] = []
+        active = set()
+        while True:
+            while len(started) < len(profiles) and len(active) < max_concurrency and not expired(deadline):
+                injuries, safe_moves, unsafe_moves = profiles[len(started)]
+                active.add(len(started))
+                started.append({
+                    "ai_recommendations": self.submit(
+                        self.get_ai_recommendations, injuries, safe_moves, unsafe_moves, deadline
+                    ),
+                    "recovery_advice": self.submit(self.get_recovery_advice, injuries, deadline),
+                })
+            if not active or expired(deadline):
+                break
+            running = [future for i in active for future in started[i].values() if not future.done()]
+            wait(running, timeout=remaining(deadline), return_when=FIRST_COMPLETED)
+            active = {i for i in active if not all(future.done() for future in started[i].values())}
+
+        not_started = {"ai_recommendations": None, "recovery_advice": None}
+        return [full_advice(futures) for futures in started] + [full_advice(not_started)] * (len(profiles) - len(started))
     
-    def get_recovery_advice(self, injuries: List[str]) -> str:
+    def get_recovery_advice(
+        self, injuries: List[str], deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> str:
         """
         Get AI-powered recovery advice for specific injuries
         
         Args:
             injuries: List of user's injuries
+            deadline: Optional time.monotonic() value bounding upstream retries
+            priority: Admission priority for the upstream call (see rate_limiter)
             
         Returns:
             Recovery advice string
         """
-        if not self.api_key:
+        if not self.router.available(TASK_RECOVERY):
             return "AI service not configured. Please consult with a healthcare professional."
         
-        # Check cache first
-        cache_key = f"recov_{hash(tuple(sorted(injuries)))}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        cache_key = self._cache_key("recov", injuries)
+        call = self._recovery_call(injuries)
         
-        prompt = self._create_recovery_prompt(injuries)
+        def fetch(call_deadline=deadline, call_priority=priority):
+            completion = self.router.complete(call, call_deadline, call_priority)
+            # Cache model answers only
+            if completion.cacheable:
+                self.cache.set(cache_key, completion.text)
+            return completion.text
         
-        try:
-            result = self._call_nvidia_api(prompt)
-            # Cache the result
-            self.cache[cache_key] = result
-            return result
-        except Exception as e:
-            print(f"Error getting recovery advice: {e}")
-            return "Unable to get recovery advice at this time. Please check your API key and internet connection."
-    
-    def _call_nvidia_api(self, prompt: str) -> str:
-        """Call the NVIDIA Cloud API with a prompt"""
-        payload = {
-            "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 1200,
-            "temperature": 0.1,
-            "top_p": 0.8,
-            "frequency_penalty": 0.2,
-            "presence_penalty": 0.2,
-            "extra_body": {
-                "min_thinking_tokens": 0,
-                "max_thinking_tokens": 2000
-            }
-        }
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
-        try:
-            response = self._post_with_retry(self.api_url, payload, headers, max_retries=5, backoff=1.5, timeout=25)
-        except Exception as first_exc:
-            # Give up fast if retries already failed
-            raise first_exc
-        # Log raw response for debugging
-        try:
-            print("[NVIDIA API] status:", response.status_code)
-            preview = response.text[:500]
-            print("[NVIDIA API] body preview:", preview)
-        except Exception:
-            pass
-
-        response.raise_for_status()
+        # Check cache first
+        cached = self._cached(cache_key, fetch)
+        if cached is not None:
+            return cached
         
         try:
-            result = response.json()
+            return self.inflight.do(cache_key, fetch, deadline)
         except Exception as e:
-            print("[NVIDIA API] JSON parse error:", e)
-            raise
-
-        try:
-            choices = result.get("choices", [])
-            first = choices[0] if choices else {}
-            message = first.get("message", {}) or {}
-
-            # Candidate fields in order of preference
-            candidates = [
-                message.get("content"),
-                message.get("reasoning_content"),
-                first.get("text"),
-                (first.get("delta") or {}).get("content"),
-                (result.get("output") or {}).get("text"),
-            ]
-
-            for c in candidates:
-                if isinstance(c, str) and c.strip():
-                    return self._clean_response(c.strip())
-
-            # Last-resort: dump minimal info for debugging
-            print("[NVIDIA API] Unrecognized content structure keys:", {
-                "message_keys": list(message.keys()) if isinstance(message, dict) else type(message),
-                "first_keys": list(first.keys()) if isinstance(first, dict) else type(first),
-            })
-            return "AI response received but content was empty."
-        except Exception as e:
-            print("[NVIDIA API] Parse error:", e)
-            return "AI response received but could not be parsed."
+            return recovery_fallback(e)
     
-    def _clean_response(self, response: str) -> str:
-        """Clean up reasoning model responses to remove internal thinking"""
-        # Remove common reasoning patterns
-        lines = response.split('\n')
-        cleaned_lines = []
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 600,
+        temperature: float = 0.1,
+        deadline: Optional[float] = None,
+        priority: int = PRIORITY_CHAT,
+    ) -> Iterator[str]:
+        """Streaming variant of chat_completion yielding cleaned text chunks."""
+        if not self.router.available(TASK_CHAT):
+            yield NOT_CONFIGURED_MESSAGE
+            return
         
-        for line in lines:
-            line = line.strip()
-            # Skip internal reasoning patterns
-            if (line.startswith("The user asks") or 
-                line.startswith("We can do:") or 
-                line.startswith("Let me") and ("think" in line.lower() or "analyze" in line.lower()) or
-                line.startswith("I need to") and ("recall" in line.lower() or "consider" in line.lower()) or
-                line.startswith("First,") and "need to" in line.lower() or
-                line.startswith("Okay,") and "tackle" in line.lower() or
-                line.startswith("Let's") and "produce" in line.lower() or
-                line.startswith("I'll") and ("think" in line.lower() or "analyze" in line.lower()) or
-                line.startswith("Now,") and ("let me" in line.lower() or "I'll" in line.lower()) or
-                "internal" in line.lower() and "reasoning" in line.lower() or
-                line.startswith("Based on") and "I can" in line.lower() or
-                line.startswith("To answer") and "I'll" in line.lower() or
-                line.startswith("I should") and ("think" in line.lower() or "consider" in line.lower()) or
-                "let me think" in line.lower() or
-                "I need to think" in line.lower() or
-                "let me analyze" in line.lower()):
-                continue
-            
-            # Skip lines that are clearly internal planning
-            if (line.startswith("**") and "final answer" in line.lower() or
-                line.startswith("**") and "response" in line.lower() and "planning" in line.lower() or
-                line.startswith("**") and "thinking" in line.lower() or
-                line.startswith("**") and "analysis" in line.lower()):
-                continue
-                
-            cleaned_lines.append(line)
+        call = LLMCall(TASK_CHAT, messages, chat_params(max_tokens, temperature))
+        for chunk in self.router.stream(call, deadline, priority):
+            yield chunk.text
+
+    def stream_ai_recommendations(
+        self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str], deadline: Optional[float] = None
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Streaming variant of get_ai_recommendations
         
-        # Join and clean up
-        cleaned = '\n'.join(cleaned_lines).strip()
+        Yields (section, line) pairs where section is "recommendations" or
+        "recovery_advice" as assigned by the incremental section parser. A
+        cached report is replayed line by line; a completed model stream is cached.
+
+        A streamed miss claims the key in ``inflight``, so concurrent requests
+        for the same injuries (streamed or not) wait for this report instead of
+        calling upstream again. Followers get the whole report at the end rather
+        than line by line, and other worker processes only share it once it
+        lands in the cache.
+        """
+        if not self.router.available(TASK_RECOMMENDATIONS):
+            result = self.get_ai_recommendations(injuries, safe_moves, unsafe_moves)
+            yield "recommendations", result["recommendations"]
+            return
         
-        # Remove any remaining internal reasoning markers
-        cleaned = cleaned.replace("**Final Answer:**", "").replace("**Response:**", "")
-        cleaned = cleaned.replace("**Thinking:**", "").replace("**Analysis:**", "")
+        cache_key = self._cache_key("rec", injuries)
+        flight = None
+        if self.cache.get(cache_key) is None and self.cache.get_stale(cache_key) is None:
+            flight = self.inflight.claim(cache_key)
+        if flight is None:
+            # A cached or stale report (whose refresh this schedules), or the in-flight call's result
+            cached = self.get_ai_recommendations(injuries, safe_moves, unsafe_moves, deadline)
+            for section in ("recommendations", "recovery_advice"):
+                yield section, cached[section]
+            return
         
-        # Remove repetitive phrases
-        cleaned = cleaned.replace("Let me provide", "Here's").replace("I'll provide", "Here's")
-        cleaned = cleaned.replace("Let me give you", "Here's").replace("I'll give you", "Here's")
+        parser = ResponseSectionParser()
+        full_text = []
+        cacheable = True
+        try:
+            for chunk in self.router.stream(self._recommendation_call(injuries, safe_moves, unsafe_moves), deadline):
+                full_text.append(chunk.text)
+                cacheable = chunk.cacheable
+                for line in chunk.text.split("\n"):
+                    section = parser.feed_line(line)
+                    if section:
+                        yield section, line.strip()
+        except BaseException as e:
+            # Followers get an ordinary error even when this stream was closed early (client disconnect)
+            self.inflight.finish(cache_key, flight, error=e if isinstance(e, Exception) else abandoned_stream())
+            raise
         
-        return cleaned
-
-    def _post_with_retry(
-        self,
-        url: str,
-        json_payload: Dict[str, Any],
-        headers: Dict[str, str],
-        max_retries: int = 3,
-        backoff: float = 1.5,
-        timeout: int = 20,
-    ) -> requests.Response:
-        """POST with retry for transient errors (e.g., 429/5xx) using exponential backoff."""
-        last_exc: Exception | None = None
-        last_resp: requests.Response | None = None
-        for attempt in range(max_retries):
-            try:
-                resp = requests.post(url, json=json_payload, headers=headers, timeout=timeout)
-                # Retry on common transient statuses
-                if resp.status_code in (429, 500, 502, 503, 504):
-                    # Allow one retry cycle for transient upstream issues
-                    wait_seconds = backoff ** attempt
-                    time.sleep(wait_seconds)
-                    last_resp = resp
-                    last_exc = requests.HTTPError(f"HTTP {resp.status_code}")
-                    continue
-                return resp
-            except (requests.ConnectionError, requests.Timeout) as e:
-                last_exc = e
-                wait_seconds = backoff ** attempt
-                time.sleep(wait_seconds)
-                continue
-        # If all retries exhausted, raise last captured exception or a generic HTTPError
-        if last_resp is not None:
-            return last_resp
-        if last_exc:
-            raise last_exc
-        raise requests.HTTPError("Request failed after retries")
+        result = parser.result("".join(full_text).strip())
+        if cacheable:
+            self.cache.set(cache_key, result)
+        self.inflight.finish(cache_key, flight, result)
     
     def _create_recommendation_prompt(
         self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str], similar_techniques: List[Dict] = None
@@ -430,32 +507,111 @@ CRITICAL RULES:
         cleaned_response = response.strip()
         
         # Split into recommendations and recovery advice based on content
-        lines = cleaned_response.split('\n')
-        recommendations = []
-        recovery_advice = []
-        
-        current_section = None
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Identify sections
-            if any(keyword in line.lower() for keyword in ['clinical assessment', 'rehabilitation protocol', 'treatment exercises', 'progression monitoring']):
-                current_section = 'recovery'
-            elif any(keyword in line.lower() for keyword in ['initial assessment', 'recommended exercises', 'safety analysis', 'training modifications']):
-                current_section = 'recommendations'
+        parser = ResponseSectionParser()
+        for line in cleaned_response.split('\n'):
+            parser.feed_line(line)
+        return parser.result(cleaned_response)
+
+
+def expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds until a time.monotonic() deadline (None without one)"""
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def full_advice(futures: Dict[str, Optional[Future]]) -> Dict[str, Any]:
+    """get_full_advice payload from the two part futures; unfinished (or never started) parts are pending"""
+    # Unfinished calls keep running and fill the cache for the next request
+    pending = [name for name, future in futures.items() if future is None or not future.done()]
+    status = "were not started before the deadline" if futures["ai_recommendations"] is None else "are still being generated"
+    ai_recommendations = futures["ai_recommendations"].result() if "ai_recommendations" not in pending else {
+        "recommendations": f"Recommendations {status}. Please try again shortly.",
+        "recovery_advice": "Please consult with a healthcare professional for personalized advice."
+    }
+    recovery_advice = futures["recovery_advice"].result() if "recovery_advice" not in pending else (
+        "Recovery advice is still being generated. Please try again shortly."
+        if futures["recovery_advice"] is not None else
+        "Recovery advice was not started before the deadline. Please try again shortly."
+    )
+    return {
+        "ai_recommendations": ai_recommendations,
+        "recovery_advice": recovery_advice,
+        "pending": pending
+    }
+
+
+def chat_params(max_tokens: int, temperature: float) -> Dict[str, Any]:
+    """Sampling parameters for a chat turn"""
+    return {**REPORT_PARAMS, "max_tokens": max_tokens, "temperature": temperature}
+
+
+def recommendations_fallback(e: Exception) -> Dict[str, str]:
+    """Degraded recommendations payload for a failed or refused upstream call"""
+    if isinstance(e, AdmissionRejected):
+        print(f"Recommendations call not admitted: {e}")
+        recommendations = BUSY_MESSAGE
+    elif isinstance(e, CircuitOpen):
+        recommendations = UNAVAILABLE_MESSAGE
+    elif isinstance(e, FlightTimeout):
+        # The shared call is still running and will fill the cache
+        recommendations = "Recommendations are still being generated. Please try again shortly."
+    else:
+        print(f"Error calling NVIDIA Cloud API: {e}")
+        recommendations = "Unable to get AI recommendations at this time. Please check your API key and internet connection."
+    return {
+        "recommendations": recommendations,
+        "recovery_advice": "Please consult with a healthcare professional for personalized advice."
+    }
+
+
+def abandoned_stream() -> Exception:
+    return RuntimeError("The streamed report was abandoned before it finished")
+
+
+def recovery_fallback(e: Exception) -> str:
+    """Degraded recovery advice for a failed or refused upstream call"""
+    if isinstance(e, AdmissionRejected):
+        print(f"Recovery advice call not admitted: {e}")
+        return BUSY_MESSAGE
+    if isinstance(e, CircuitOpen):
+        return UNAVAILABLE_MESSAGE
+    if isinstance(e, FlightTimeout):
+        return "Recovery advice is still being generated. Please try again shortly."
+    print(f"Error getting recovery advice: {e}")
+    return "Unable to get recovery advice at this time. Please check your API key and internet connection."
+
+
+class ResponseSectionParser:
+    def __init__(self):
+        """Incremental form of _parse_ai_response: feed report lines as they arrive"""
+        self.current_section = None
+        self.recommendations: List[str] = []
+        self.recovery_advice: List[str] = []
+
+    def feed_line(self, line: str) -> Optional[str]:
+        """Assign one line to a section; returns "recommendations", "recovery_advice" or None for blank lines"""
+        line = line.strip()
+        if not line:
+            return None
             
-            if current_section == 'recovery':
-                recovery_advice.append(line)
-            elif current_section == 'recommendations':
-                recommendations.append(line)
-            else:
-                # Default to recommendations if unclear
-                recommendations.append(line)
+        # Identify sections
+        if any(keyword in line.lower() for keyword in ['clinical assessment', 'rehabilitation protocol', 'treatment exercises', 'progression monitoring']):
+            self.current_section = 'recovery'
+        elif any(keyword in line.lower() for keyword in ['initial assessment', 'recommended exercises', 'safety analysis', 'training modifications']):
+            self.current_section = 'recommendations'
         
+        if self.current_section == 'recovery':
+            self.recovery_advice.append(line)
+            return "recovery_advice"
+        # Default to recommendations if unclear
+        self.recommendations.append(line)
+        return "recommendations"
+
+    def result(self, full_text: str) -> Dict[str, str]:
         return {
-            "recommendations": '\n'.join(recommendations) if recommendations else cleaned_response,
-            "recovery_advice": '\n'.join(recovery_advice) if recovery_advice else "Please consult with a healthcare professional for personalized recovery advice."
+            "recommendations": '\n'.join(self.recommendations) if self.recommendations else full_text,
+            "recovery_advice": '\n'.join(self.recovery_advice) if self.recovery_advice else "Please consult with a healthcare professional for personalized recovery advice."
         }
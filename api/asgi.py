@@ -0,0 +1,348 @@
+import asyncio
+import json
+import sys
+import time
+from io import BytesIO
+from urllib.parse import parse_qs
+
+import index
+from ai_service import BUSY_MESSAGE, UNAVAILABLE_MESSAGE
+from async_ai_service import AsyncBJJAIAdvisor
+from circuit_breaker import CircuitOpen
+from http_cache import RawJSON, encode_json, json_body
+from lazy import Lazy, when_loaded
+from metrics import metrics
+from rate_limiter import AdmissionRejected
+
+# ASGI entry point (needs httpx and an ASGI server):
+#
+#   uvicorn asgi:app --app-dir api
+#
+# POST /api/chat and POST /api/recommendations run on the event loop, so a
+# request waiting on the upstream LLM holds a coroutine instead of a worker
+# thread. Every other route is served by the Flask app on a thread pool.
+
+def create_async_advisor():
+    """Async advisor sharing the sync advisor's cache and backend router (rates, circuit breakers, latency stats)"""
+    advisor = index.ai_advisor.get()
+    return AsyncBJJAIAdvisor(
+        cache=advisor.cache,
+        similarity=advisor.similarity,
+        knowledge_version=advisor.knowledge_version,
+        router=advisor.router,
+    )
+
+async_advisor = Lazy(create_async_advisor)
+
+# Empty until the first async AI request builds the advisor, so a scrape never does
+metrics.collect("bjj_async_upstream", when_loaded(async_advisor, lambda a: a.upstream_stats().get("async_upstream", {})))
+metrics.collect("bjj_async_admission", when_loaded(async_advisor, lambda a: a.upstream_stats().get("async_admission", {})))
+metrics.collect("bjj_async_singleflight", when_loaded(async_advisor, lambda a: a.inflight.stats()))
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+def header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def parse_json_object(scope, body):
+    """Like Flask's ``request.get_json(silent=True) or {}``, keeping only JSON objects"""
+    content_type = (header(scope, b"content-type") or "").split(";")[0].strip().lower()
+    if content_type != "application/json" and not content_type.endswith("+json"):
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def wants_stream(scope, data):
+    """Streaming is requested with {"stream": true} in the body or ?stream=1"""
+    if data.get("stream") is True:
+        return True
+    values = parse_qs(scope["query_string"].decode("latin-1")).get("stream", [""])
+    return values[0].lower() in ("1", "true", "yes")
+
+async def send_body(send, status, body, content_type="application/json"):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def send_events(send, events):
+    """Stream an async generator of SSE strings; the generator is closed even if sending fails"""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    try:
+        async for event in events:
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+    finally:
+        await events.aclose()
+    await send({"type": "http.response.body", "body": b""})
+
+async def stream_recommendations(injuries, terms, safe_moves, unsafe_moves):
+    """Async form of index.stream_recommendations, with the same events"""
+    yield index.sse_event("partition", {
+        "injuries": injuries,
+        "canonical_injuries": terms,
+        "safe_moves": safe_moves,
+        "unsafe_moves": unsafe_moves
+    })
+
+    ai_recommendations = {}
+    recovery_advice = ""
+    pending = []
+
+    if terms:
+        advisor = async_advisor.get()
+        deadline = time.monotonic() + index.AI_DEADLINE_SECONDS
+        advisor_injuries = index.prompt_injuries(terms)
+        # Recovery advice is generated alongside the streamed report
+        recovery_task = advisor.spawn(advisor.get_recovery_advice(advisor_injuries, deadline))
+
+        sections = {"recommendations": [], "recovery_advice": []}
+        report = advisor.stream_ai_recommendations(advisor_injuries, safe_moves, unsafe_moves, deadline)
+        try:
+            async for section, text in report:
+                sections[section].append(text)
+                yield index.sse_event("token", {"field": section, "text": text})
+        except Exception as e:
+            print(f"Error streaming AI recommendations: {e}")
+            sections["recommendations"] = [index.stream_error_message(e)]
+            yield index.sse_event("error", {"field": "ai_recommendations", "message": sections["recommendations"][0]})
+        finally:
+            await report.aclose()
+        ai_recommendations = index.streamed_recommendations(sections)
+
+        try:
+            # Shielded so a late answer still lands in the cache
+            recovery_advice = await asyncio.wait_for(
+                asyncio.shield(recovery_task), max(0.0, deadline - time.monotonic())
+            )
+        except asyncio.TimeoutError:
+            recovery_advice = "Recovery advice is still being generated. Please try again shortly."
+            pending.append("recovery_advice")
+        yield index.sse_event("recovery_advice", {"text": recovery_advice})
+
+    yield index.sse_event("done", {
+        "injuries": injuries,
+        "canonical_injuries": terms,
+        "safe_moves": safe_moves,
+        "unsafe_moves": unsafe_moves,
+        "ai_recommendations": ai_recommendations,
+        "recovery_advice": recovery_advice,
+        "pending": pending
+    })
+
+async def api_recommendations(scope, receive, send):
+    data = parse_json_object(scope, await read_body(receive))
+    injuries = data.get("injuries", [])
+    if not isinstance(injuries, list):
+        injuries = [injuries]
+
+    kb = index.knowledge_base.get()
+    terms = index.canonical_injuries(injuries, kb)
+    partition = index.filter_moves(terms, kb)
+    safe_moves, unsafe_moves = partition.safe_moves, partition.unsafe_moves
+
+    if wants_stream(scope, data):
+        return await send_events(send, stream_recommendations(injuries, terms, safe_moves, unsafe_moves))
+
+    ai_recommendations = {}
+    recovery_advice = ""
+    pending = []
+
+    if terms:
+        advice = await async_advisor.get().get_full_advice(
+            index.prompt_injuries(terms), safe_moves, unsafe_moves, timeout=index.AI_DEADLINE_SECONDS
+        )
+        ai_recommendations = advice["ai_recommendations"]
+        recovery_advice = advice["recovery_advice"]
+        pending = advice["pending"]
+
+    return await send_body(send, 200, json_body({
+        "injuries": injuries,
+        "canonical_injuries": terms,
+        "safe_moves": RawJSON(partition.safe_json),
+        "unsafe_moves": RawJSON(partition.unsafe_json),
+        "ai_recommendations": ai_recommendations,
+        "recovery_advice": recovery_advice,
+        "pending": pending
+    }))
+
+async def stream_chat(session_id, history, trimmed, deadline, prompt_tokens):
+    """Async form of index.stream_chat; history is untouched if the stream fails"""
+    reply = []
+    chunks = async_advisor.get().stream_chat_completion(trimmed, max_tokens=400, temperature=0.1, deadline=deadline)
+    try:
+        async for chunk in chunks:
+            reply.append(chunk)
+            yield index.sse_event("token", {"text": chunk})
+    except AdmissionRejected as e:
+        print(f"Chat stream not admitted: {e}")
+        yield index.sse_event("error", {"message": BUSY_MESSAGE, "busy": True})
+        return
+    except CircuitOpen:
+        yield index.sse_event("error", {"message": UNAVAILABLE_MESSAGE, "busy": True})
+        return
+    except Exception as e:
+        print(f"Error streaming chat completion: {e}")
+        yield index.sse_event("error", {"message": "Unable to get a reply at this time. Please try again."})
+        return
+    finally:
+        await chunks.aclose()
+
+    yield index.sse_event("done", index.commit_chat_turn(session_id, history, "".join(reply), prompt_tokens))
+
+async def api_chat(scope, receive, send):
+    data = parse_json_object(scope, await read_body(receive))
+    user_message = data.get("message", "").strip()
+    session_id = data.get("session_id", "default")
+
+    if not user_message:
+        return await send_body(send, 400, encode_json({"error": "message is required"}))
+
+    history, trimmed, prompt_tokens = index.start_chat_turn(session_id, user_message)
+    deadline = time.monotonic() + index.CHAT_DEADLINE_SECONDS
+
+    if wants_stream(scope, data):
+        return await send_events(send, stream_chat(session_id, history, trimmed, deadline, prompt_tokens))
+
+    try:
+        ai_text = await async_advisor.get().chat_completion(trimmed, max_tokens=400, temperature=0.1, deadline=deadline)
+    except AdmissionRejected as e:
+        # Fail fast instead of queueing past the deadline; the turn is not stored so the user can resend it
+        print(f"Chat call not admitted: {e}")
+        return await send_body(send, 503, encode_json({"session_id": session_id, "reply": BUSY_MESSAGE, "busy": True}))
+    except CircuitOpen:
+        return await send_body(
+            send, 503, encode_json({"session_id": session_id, "reply": UNAVAILABLE_MESSAGE, "busy": True})
+        )
+
+    return await send_body(send, 200, encode_json(index.commit_chat_turn(session_id, history, ai_text, prompt_tokens)))
+
+# Routes served natively on the event loop; the rest go to the Flask app
+ROUTES = {
+    ("POST", "/api/chat"): api_chat,
+    ("POST", "/api/recommendations"): api_recommendations,
+}
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = f"HTTP_{key}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def run_wsgi(environ):
+    """Call the Flask app (on a worker thread) and collect its whole response"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+
+    body = index.app(environ, start_response)
+    try:
+        content = b"".join(body)
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+    return response["status"], response["headers"], content
+
+async def call_wsgi(scope, receive, send):
+    environ = wsgi_environ(scope, await read_body(receive))
+    status, headers, content = await asyncio.to_thread(run_wsgi, environ)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+    })
+    await send({"type": "http.response.body", "body": content})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if not index.LAZY_INIT:
+                async_advisor.get()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if async_advisor.loaded:
+                await async_advisor.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        return await call_wsgi(scope, receive, send)
+
+    # Same metrics as the Flask hooks: latency to the start of the response, and status counts
+    started = time.perf_counter()
+    response_started = False
+
+    async def timed_send(message):
+        nonlocal response_started
+        if message["type"] == "http.response.start":
+            response_started = True
+            metrics.observe("bjj_http_request_seconds", time.perf_counter() - started, route=scope["path"], method="POST")
+            metrics.inc("bjj_http_requests_total", route=scope["path"], method="POST", status=message["status"])
+        await send(message)
+
+    try:
+        await handler(scope, receive, timed_send)
+    except Exception as e:
+        print(f"Error handling {scope['path']}: {e}")
+        if not response_started:
+            await send_body(timed_send, 500, encode_json({"error": "Internal server error"}))
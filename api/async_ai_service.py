@@ -0,0 +1,227 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from ai_cache import create_cache
+from ai_service import (
+    NOT_CONFIGURED_MESSAGE, REVALIDATE_DEADLINE_SECONDS, BJJAIAdvisor, ResponseSectionParser, abandoned_stream,
+    chat_params, recommendations_fallback, recovery_fallback
+)
+from llm_backends import TASK_CHAT, TASK_RECOMMENDATIONS, TASK_RECOVERY, LLMCall
+from llm_router import create_router
+from rate_limiter import PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_RECOMMENDATIONS
+from singleflight import AsyncSingleFlight
+
+# asyncio variant of BJJAIAdvisor for the ASGI app (api/asgi.py)
+
+
+class AsyncBJJAIAdvisor(BJJAIAdvisor):
+    def __init__(self, cache=None, similarity=None, knowledge_version=None, router=None, api_url: Optional[str] = None):
+        """
+        BJJAIAdvisor whose backend calls are coroutines on one event loop
+
+        Prompts, cache keys, response parsing and degraded replies are
+        inherited, so answers are interchangeable with the sync advisor's;
+        passing its cache and router makes the two share cached answers and
+        each backend's rate, circuit breaker and latency statistics. ``api_url``
+        is used as in BJJAIAdvisor when no router is given.
+        """
+        self.cache = cache if cache is not None else create_cache()
+        self.router = router if router is not None else create_router(api_url=api_url)
+        self.model_name = self.router.model_name
+        self.similarity = similarity
+        self.knowledge_version = knowledge_version
+        self.inflight = AsyncSingleFlight(self.cache)
+        self._revalidating = set()
+        # Background tasks (refreshes, parts still running past a deadline), referenced until done
+        self._tasks = set()
+
+    def spawn(self, coro) -> "asyncio.Task":
+        """Run a coroutine in the background; it is kept alive until it finishes"""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def aclose(self):
+        await self.router.aclose()
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 600,
+        temperature: float = 0.1,
+        deadline: Optional[float] = None,
+        priority: int = PRIORITY_CHAT,
+        task: str = TASK_CHAT,
+    ) -> str:
+        """Run a chat completion with a list of messages [{role, content}]; ``deadline`` is a time.monotonic() value."""
+        if not self.router.available(task):
+            return NOT_CONFIGURED_MESSAGE
+
+        call = LLMCall(task, messages, chat_params(max_tokens, temperature))
+        return (await self.router.acomplete(call, deadline, priority)).text
+
+    async def get_ai_recommendations(
+        self,
+        injuries: List[str],
+        safe_moves: List[str],
+        unsafe_moves: List[str],
+        deadline: Optional[float] = None,
+        priority: int = PRIORITY_RECOMMENDATIONS,
+    ) -> Dict[str, str]:
+        """Awaitable form of BJJAIAdvisor.get_ai_recommendations"""
+        if not self.router.available(TASK_RECOMMENDATIONS):
+            return {
+                "recommendations": NOT_CONFIGURED_MESSAGE,
+                "recovery_advice": "Consult with a healthcare professional for personalized recovery advice."
+            }
+
+        cache_key = self._cache_key("rec", injuries)
+
+        async def fetch(call_deadline=deadline, call_priority=priority):
+            completion = await self.router.acomplete(
+                self._recommendation_call(injuries, safe_moves, unsafe_moves), call_deadline, call_priority
+            )
+            result = self._parse_ai_response(completion.text)
+            if completion.cacheable:
+                self.cache.set(cache_key, result)
+            return result
+
+        cached = self._cached(cache_key, fetch)
+        if cached is not None:
+            return cached
+
+        try:
+            return await self.inflight.do(cache_key, fetch, deadline)
+        except Exception as e:
+            return recommendations_fallback(e)
+
+    async def get_recovery_advice(
+        self, injuries: List[str], deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> str:
+        """Awaitable form of BJJAIAdvisor.get_recovery_advice"""
+        if not self.router.available(TASK_RECOVERY):
+            return "AI service not configured. Please consult with a healthcare professional."
+
+        cache_key = self._cache_key("recov", injuries)
+        call = self._recovery_call(injuries)
+
+        async def fetch(call_deadline=deadline, call_priority=priority):
+            completion = await self.router.acomplete(call, call_deadline, call_priority)
+            if completion.cacheable:
+                self.cache.set(cache_key, completion.text)
+            return completion.text
+
+        cached = self._cached(cache_key, fetch)
+        if cached is not None:
+            return cached
+
+        try:
+            return await self.inflight.do(cache_key, fetch, deadline)
+        except Exception as e:
+            return recovery_fallback(e)
+
+    def _revalidate(self, cache_key: str, fetch):
+        if cache_key in self._revalidating:
+            return
+        self._revalidating.add(cache_key)
+
+        async def refresh():
+            deadline = time.monotonic() + REVALIDATE_DEADLINE_SECONDS
+            try:
+                await self.inflight.do(cache_key, lambda: fetch(deadline, PRIORITY_BACKGROUND), deadline)
+            except Exception as e:
+                print(f"Background refresh failed, keeping the stale answer: {e}")
+            finally:
+                self._revalidating.discard(cache_key)
+
+        self.spawn(refresh())
+
+    async def get_full_advice(
+        self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str], timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Awaitable form of BJJAIAdvisor.get_full_advice; unfinished parts keep running and fill the cache"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        tasks = {
+            "ai_recommendations": self.spawn(self.get_ai_recommendations(injuries, safe_moves, unsafe_moves, deadline)),
+            "recovery_advice": self.spawn(self.get_recovery_advice(injuries, deadline)),
+        }
+        await asyncio.wait(tasks.values(), timeout=timeout)
+
+        pending = [name for name, task in tasks.items() if not task.done()]
+        ai_recommendations = tasks["ai_recommendations"].result() if "ai_recommendations" not in pending else {
+            "recommendations": "Recommendations are still being generated. Please try again shortly.",
+            "recovery_advice": "Please consult with a healthcare professional for personalized advice."
+        }
+        recovery_advice = tasks["recovery_advice"].result() if "recovery_advice" not in pending else (
+            "Recovery advice is still being generated. Please try again shortly."
+        )
+        return {
+            "ai_recommendations": ai_recommendations,
+            "recovery_advice": recovery_advice,
+            "pending": pending
+        }
+
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 600,
+        temperature: float = 0.1,
+        deadline: Optional[float] = None,
+        priority: int = PRIORITY_CHAT,
+    ) -> AsyncIterator[str]:
+        """Streaming variant of chat_completion yielding cleaned text chunks."""
+        if not self.router.available(TASK_CHAT):
+            yield NOT_CONFIGURED_MESSAGE
+            return
+
+        call = LLMCall(TASK_CHAT, messages, chat_params(max_tokens, temperature))
+        async for chunk in self.router.astream(call, deadline, priority):
+            yield chunk.text
+
+    async def stream_ai_recommendations(
+        self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str], deadline: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Awaitable form of BJJAIAdvisor.stream_ai_recommendations"""
+        if not self.router.available(TASK_RECOMMENDATIONS):
+            result = await self.get_ai_recommendations(injuries, safe_moves, unsafe_moves)
+            yield "recommendations", result["recommendations"]
+            return
+
+        cache_key = self._cache_key("rec", injuries)
+        flight = None
+        if self.cache.get(cache_key) is None and self.cache.get_stale(cache_key) is None:
+            flight = self.inflight.claim(cache_key)
+        if flight is None:
+            cached = await self.get_ai_recommendations(injuries, safe_moves, unsafe_moves, deadline)
+            for section in ("recommendations", "recovery_advice"):
+                yield section, cached[section]
+            return
+
+        parser = ResponseSectionParser()
+        full_text = []
+        cacheable = True
+        call = self._recommendation_call(injuries, safe_moves, unsafe_moves)
+        try:
+            async for chunk in self.router.astream(call, deadline):
+                full_text.append(chunk.text)
+                cacheable = chunk.cacheable
+                for line in chunk.text.split("\n"):
+                    section = parser.feed_line(line)
+                    if section:
+                        yield section, line.strip()
+        except BaseException as e:
+            self.inflight.finish(cache_key, flight, error=e if isinstance(e, Exception) else abandoned_stream())
+            raise
+
+        result = parser.result("".join(full_text).strip())
+        if cacheable:
+            self.cache.set(cache_key, result)
+        self.inflight.finish(cache_key, flight, result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "singleflight": self.inflight.stats(),
+            "background_tasks": len(self._tasks),
+        }
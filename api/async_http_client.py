@@ -0,0 +1,131 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from http_client import RETRY_STATUSES, parse_retry_after
+from metrics import metrics
+
+# asyncio counterpart of http_client.PooledHTTPClient (requires httpx, used by the ASGI app only)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Raised when the caller's end-to-end deadline leaves no time for another attempt"""
+
+
+class AsyncPooledHTTPClient:
+    def __init__(self, max_connections: int = 1000, max_keepalive: int = 100, max_backoff: float = 20.0):
+        """
+        httpx.AsyncClient with a keep-alive pool sized for many concurrent upstream calls
+
+        A call waiting on upstream holds a socket, not a thread, so one
+        process can keep ``max_connections`` calls in flight. Retries, backoff,
+        Retry-After and deadlines behave as in PooledHTTPClient. The client
+        binds to the event loop it is first used on.
+        """
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        )
+        self.max_backoff = max_backoff
+        self.requests = 0
+        self.retries = 0
+        self.retry_after_waits = 0
+        self.deadline_exceeded = 0
+        self.in_flight = 0
+
+    def _backoff_delay(self, attempt: int, backoff: float) -> float:
+        return random.uniform(0, min(self.max_backoff, backoff ** attempt))
+
+    async def post(
+        self,
+        url: str,
+        json_payload: Dict[str, Any],
+        headers: Dict[str, str],
+        max_retries: int = 3,
+        backoff: float = 1.5,
+        timeout: float = 20,
+        deadline: Optional[float] = None,
+        stream: bool = False,
+        admit: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> httpx.Response:
+        """
+        POST with retry for transient errors (429/5xx, connection errors, timeouts)
+
+        Arguments match PooledHTTPClient.post, except that ``admit`` is awaited.
+        A streamed response must be closed with ``await response.aclose()``.
+        """
+        last_exc: Exception | None = None
+        last_resp: httpx.Response | None = None
+        out_of_time = False
+        for attempt in range(max_retries):
+            attempt_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    out_of_time = True
+                    break
+                attempt_timeout = min(timeout, remaining)
+
+            if admit is not None:
+                with metrics.span("queue_wait"):
+                    await admit()
+            if attempt:
+                self.retries += 1
+            self.requests += 1
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                request = self.client.build_request("POST", url, json=json_payload, headers=headers, timeout=attempt_timeout)
+                resp = await self.client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                outcome = "timeout" if isinstance(e, httpx.TimeoutException) else "connection_error"
+                metrics.observe("bjj_upstream_attempt_seconds", time.perf_counter() - started, outcome=outcome)
+                last_exc = e
+                wait_seconds = self._backoff_delay(attempt, backoff)
+            else:
+                # For streamed responses this is time to headers
+                metrics.observe("bjj_upstream_attempt_seconds", time.perf_counter() - started, outcome=str(resp.status_code))
+                if resp.status_code not in RETRY_STATUSES:
+                    return resp
+                last_resp = resp
+                last_exc = httpx.HTTPStatusError(f"HTTP {resp.status_code}", request=request, response=resp)
+                wait_seconds = self._backoff_delay(attempt, backoff)
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if retry_after is not None:
+                    self.retry_after_waits += 1
+                    # Clamped so a huge server value cannot park the caller; the deadline check below still applies
+                    wait_seconds = min(retry_after, self.max_backoff)
+                if stream:
+                    # Hand the unread connection back to the pool before retrying
+                    await resp.aclose()
+            finally:
+                self.in_flight -= 1
+
+            if attempt == max_retries - 1:
+                break
+            if deadline is not None and time.monotonic() + wait_seconds >= deadline:
+                out_of_time = True
+                break
+            await asyncio.sleep(wait_seconds)
+
+        if out_of_time:
+            self.deadline_exceeded += 1
+        if last_resp is not None:
+            return last_resp
+        if out_of_time or last_exc is None:
+            raise DeadlineExceeded("Upstream deadline exceeded") from last_exc
+        raise last_exc
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "retry_after_waits": self.retry_after_waits,
+            "deadline_exceeded": self.deadline_exceeded,
+            "in_flight": self.in_flight,
+        }
@@ -0,0 +1,123 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from llm_backends import TASK_SUMMARY
+from rate_limiter import PRIORITY_BACKGROUND
+from session_store import count_tokens
+
+# Rolling summarization of long chat histories for /api/chat
+
+SUMMARY_PROMPT = (
+    "Summarize this BJJ coaching conversation for the coach's own notes. Keep the athlete's injuries, "
+    "pain levels, restrictions, goals and any advice already given. Plain sentences, at most 120 words. "
+    "NO internal reasoning, start immediately with the summary."
+)
+
+
+def _fingerprint(message: Dict[str, str]) -> Tuple[str, str]:
+    return message.get("role", ""), message.get("content", "")
+
+
+class HistoryCompactor:
+    def __init__(
+        self,
+        advisor,
+        sessions,
+        threshold_tokens: int = 1200,
+        keep_last: int = 6,
+        summary_max_tokens: int = 200,
+        resummarize_after: int = 4,
+    ):
+        """
+        Replace older chat turns with a running summary once history passes a token threshold
+
+        The system prompt and the last ``keep_last`` messages are always sent
+        verbatim. Summaries are generated off the request path through
+        ``advisor.chat_completion`` and stored with the session in ``sessions``
+        (a session store), so with the SQLite backend every worker reuses them;
+        until one is ready, the older turns are sent unchanged. An existing summary is refreshed once
+        ``resummarize_after`` more messages have aged out of the verbatim window.
+        """
+        self.advisor = advisor
+        self.threshold_tokens = threshold_tokens
+        self.keep_last = keep_last
+        self.summary_max_tokens = summary_max_tokens
+        self.resummarize_after = resummarize_after
+        # Holds each session's [last summarized message, summary text]
+        self.sessions = sessions
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def compact(self, session_id: str, history: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """
+        Build the message list to send upstream
+
+        Returns:
+            (messages, {"before": tokens of the full history, "after": tokens of messages})
+        """
+        before = count_tokens(history)
+        if before <= self.threshold_tokens:
+            return history, {"before": before, "after": before}
+
+        system = [m for m in history[:1] if m.get("role") == "system"]
+        turns = history[len(system):]
+        if len(turns) <= self.keep_last:
+            return history, {"before": before, "after": before}
+        older, recent = turns[:-self.keep_last], turns[-self.keep_last:]
+
+        summary, covered = self._cached_summary(session_id, older)
+        uncovered = len(older) - covered
+        if uncovered and (summary is None or uncovered >= self.resummarize_after):
+            self._schedule_summary(session_id, older)
+
+        if summary is None:
+            messages = history
+        else:
+            summary_message = {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+            messages = system + [summary_message] + older[covered:] + recent
+        return messages, {"before": before, "after": count_tokens(messages)}
+
+    def _cached_summary(self, session_id: str, older: List[Dict[str, str]]) -> Tuple[Optional[str], int]:
+        """Return (summary, number of ``older`` messages it covers) for the session's cached summary"""
+        entry = self.sessions.get_summary(session_id)
+        if entry is None:
+            return None, 0
+        boundary, summary = entry
+        boundary = tuple(boundary)
+        # Stored history is capped, so locate the boundary by content rather than position
+        for i in range(len(older) - 1, -1, -1):
+            if _fingerprint(older[i]) == boundary:
+                return summary, i + 1
+        return None, 0
+
+    def _schedule_summary(self, session_id: str, older: List[Dict[str, str]]):
+        if not self.advisor.configured(TASK_SUMMARY):
+            return
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self.advisor.submit_background(self._summarize, session_id, list(older))
+
+    def _summarize(self, session_id: str, older: List[Dict[str, str]]):
+        """Background job: fold the not-yet-summarized turns into the running summary"""
+        try:
+            previous, covered = self._cached_summary(session_id, older)
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older[covered:])
+            if previous:
+                transcript = f"Earlier summary: {previous}\n\n{transcript}"
+            summary = self.advisor.chat_completion(
+                [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+                max_tokens=self.summary_max_tokens,
+                temperature=0.1,
+                deadline=time.monotonic() + 30,
+                priority=PRIORITY_BACKGROUND,
+                task=TASK_SUMMARY,
+            )
+            self.sessions.save_summary(session_id, [list(_fingerprint(older[-1])), summary])
+        except Exception as e:
+            print(f"Error summarizing chat history: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
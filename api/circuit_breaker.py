@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from typing import Any, Dict
+
+# Circuit breaker for upstream LLM calls
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised without contacting upstream while the circuit is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Stop calling an upstream that keeps failing
+
+        After ``failure_threshold`` consecutive failed calls the circuit opens
+        and every call fails immediately with CircuitOpen. Once
+        ``reset_timeout`` seconds have passed, a single probe call is let
+        through (half-open): success closes the circuit, failure re-opens it.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.short_circuited = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpen unless the call may go upstream"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.short_circuited += 1
+        raise CircuitOpen("Upstream circuit is open")
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """The call ended without reaching upstream (e.g. it was not admitted); free the probe slot"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+def create_circuit_breaker() -> CircuitBreaker:
+    """
+    Build the upstream circuit breaker from environment settings
+
+    BJJ_CIRCUIT_FAILURES: consecutive failed calls that open the circuit (default: 5)
+    BJJ_CIRCUIT_RESET: seconds before a probe call is allowed through (default: 30)
+    """
+    return CircuitBreaker(
+        failure_threshold=int(os.getenv("BJJ_CIRCUIT_FAILURES", "5")),
+        reset_timeout=float(os.getenv("BJJ_CIRCUIT_RESET", "30")),
+    )
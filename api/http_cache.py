@@ -0,0 +1,95 @@
+import gzip
+import hashlib
+import json
+from typing import Any, Optional
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+# HTTP caching helpers for the deterministic GET endpoints
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+
+class RawJSON(bytes):
+    """Already-encoded JSON that json_body splices in verbatim"""
+
+
+def encode_json(value: Any) -> bytes:
+    """Compact, ASCII-escaped JSON, byte-compatible with Flask's jsonify"""
+    return json.dumps(value, separators=(",", ":")).encode("ascii")
+
+
+def json_body(value: Any) -> bytes:
+    """
+    Encode a response object whose values may be RawJSON fragments
+
+    Only dicts and lists of dicts are walked; any other value is encoded in
+    one json.dumps call, so plain lists of strings stay on the C encoder.
+    """
+    if isinstance(value, RawJSON):
+        return value
+    if isinstance(value, dict):
+        return b"{" + b",".join(encode_json(str(k)) + b":" + json_body(v) for k, v in value.items()) + b"}"
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return b"[" + b",".join(json_body(item) for item in value) + b"]"
+    return encode_json(value)
+
+
+def strong_etag(*parts: str) -> str:
+    """Quoted strong ETag over the given parts"""
+    digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    """Each content-coding is a different representation, so it gets its own strong ETag"""
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match: Optional[str], etags) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored and "*" matches anything"""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    if "*" in candidates:
+        return True
+    candidates = {tag[2:] if tag.startswith("W/") else tag for tag in candidates}
+    return any(etag in candidates for etag in etags)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick "br" (if the brotli package is installed) or "gzip" from an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body)
+    if encoding == "gzip":
+        # mtime=0 keeps the output byte-identical across processes, matching the strong ETag
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    return body
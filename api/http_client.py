@@ -0,0 +1,176 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+# Pooled keep-alive HTTP client for upstream LLM calls
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Raised when the caller's end-to-end deadline leaves no time for another attempt"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class PooledHTTPClient:
+    def __init__(
+        self,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        max_backoff: float = 20.0,
+    ):
+        """
+        Persistent requests.Session with a keep-alive connection pool
+
+        Reusing the session avoids a fresh TCP + TLS handshake per upstream call.
+        """
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.max_backoff = max_backoff
+        self.requests = 0
+        self.retries = 0
+        self.retry_after_waits = 0
+        self.deadline_exceeded = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _backoff_delay(self, attempt: int, backoff: float) -> float:
+        """Full-jitter exponential backoff so retrying workers do not synchronize"""
+        return random.uniform(0, min(self.max_backoff, backoff ** attempt))
+
+    def post(
+        self,
+        url: str,
+        json_payload: Dict[str, Any],
+        headers: Dict[str, str],
+        max_retries: int = 3,
+        backoff: float = 1.5,
+        timeout: float = 20,
+        deadline: Optional[float] = None,
+        stream: bool = False,
+        admit: Optional[Callable[[], None]] = None,
+    ) -> requests.Response:
+        """
+        POST with retry for transient errors (429/5xx, connection errors, timeouts)
+
+        Args:
+            deadline: Absolute ``time.monotonic()`` value by which the call must finish;
+                per-attempt timeouts and sleeps are clipped to it
+            stream: Leave the body unread so the caller can iterate over it
+            admit: Called before every attempt, retries included; blocks until the
+                attempt may go upstream or raises to abandon the call
+
+        Honors Retry-After on 429/503, up to ``max_backoff`` seconds, and
+        returns the last transient response once retries or the deadline run out.
+        """
+        last_exc: Exception | None = None
+        last_resp: requests.Response | None = None
+        out_of_time = False
+        for attempt in range(max_retries):
+            attempt_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    out_of_time = True
+                    break
+                attempt_timeout = min(timeout, remaining)
+
+            if admit is not None:
+                with metrics.span("queue_wait"):
+                    admit()
+            if attempt:
+                self._count("retries")
+            self._count("requests")
+            started = time.perf_counter()
+            try:
+                resp = self.session.post(
+                    url, json=json_payload, headers=headers, timeout=attempt_timeout, stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                outcome = "timeout" if isinstance(e, requests.Timeout) else "connection_error"
+                metrics.observe("bjj_upstream_attempt_seconds", time.perf_counter() - started, outcome=outcome)
+                last_exc = e
+                wait_seconds = self._backoff_delay(attempt, backoff)
+            else:
+                # For streamed responses this is time to headers
+                elapsed = time.perf_counter() - started
+                metrics.observe("bjj_upstream_attempt_seconds", elapsed, outcome=str(resp.status_code))
+                if resp.status_code not in RETRY_STATUSES:
+                    return resp
+                last_resp = resp
+                last_exc = requests.HTTPError(f"HTTP {resp.status_code}")
+                wait_seconds = self._backoff_delay(attempt, backoff)
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if retry_after is not None:
+                    self._count("retry_after_waits")
+                    # Clamped so a huge server value cannot park the caller; the deadline check below still applies
+                    wait_seconds = min(retry_after, self.max_backoff)
+                if stream:
+                    # Hand the unread connection back to the pool before retrying
+                    resp.close()
+
+            # No point sleeping after the final attempt or past the deadline
+            if attempt == max_retries - 1:
+                break
+            if deadline is not None and time.monotonic() + wait_seconds >= deadline:
+                out_of_time = True
+                break
+            time.sleep(wait_seconds)
+
+        if out_of_time:
+            self._count("deadline_exceeded")
+        # If all retries exhausted, return the last transient response or raise the last exception
+        if last_resp is not None:
+            return last_resp
+        if out_of_time or last_exc is None:
+            raise DeadlineExceeded("Upstream deadline exceeded") from last_exc
+        raise last_exc
+
+    def connection_stats(self) -> Dict[str, int]:
+        """New vs reused connections, read from the urllib3 pools behind the session"""
+        opened = 0
+        served = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+        return {"connections_opened": opened, "connections_reused": max(0, served - opened)}
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "requests": self.requests,
+            "retries": self.retries,
+            "retry_after_waits": self.retry_after_waits,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
+        stats.update(self.connection_stats())
+        return stats
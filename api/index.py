@@ -1,8 +1,27 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, Response, g, request, render_template, jsonify
+import base64
 import os
 import json
-import re
-from ai_service import BJJAIAdvisor
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from functools import lru_cache, partial
+from urllib.parse import quote
+from ai_cache import PrewarmedCache, create_cache
+from ai_service import BUSY_MESSAGE, UNAVAILABLE_MESSAGE
+from circuit_breaker import CircuitOpen
+from chat_summary import HistoryCompactor
+from session_store import count_tokens, create_session_store, trim_to_token_budget
+from http_cache import (
+    RawJSON, compress, etag_matches, json_body, negotiate_encoding, representation_etag, strong_etag, MIN_COMPRESS_BYTES
+)
+from injury_canonical import display_name
+from jobs import RecommendationJobs, create_job_store
+from metrics import metrics
+from knowledge_base import CurrentSimilarity, ReloadingKnowledgeBase
+from lazy import Lazy, when_loaded
+from prewarm import load_artifact
+from rate_limiter import AdmissionRejected
+from technique_index import joint_terms, normalize_injury, normalize_term
 from flask_cors import CORS
 
 app = Flask(__name__)
@@ -13,25 +32,214 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 # Construct the path to the JSON file
 json_path = os.path.join(current_dir, "bjj_moves.json")
 
-# Load the BJJ knowledge base
-with open(json_path, "r") as f:
-    technique_db = json.load(f)
+# Lazy mode defers the knowledge base, the AI advisor and their heavy imports (NumPy, requests) to first
+# use, so a serverless cold start can answer its first request sooner; on by default on Vercel
+LAZY_INIT = os.getenv("BJJ_LAZY_INIT", "1" if os.getenv("VERCEL") else "0") == "1"
 
-# Initialize AI advisor
-ai_advisor = BJJAIAdvisor()
+# Optional precompiled knowledge base (python api/knowledge_base.py), used when it matches bjj_moves.json
+kb_snapshot_path = os.getenv("BJJ_KB_SNAPSHOT")
 
-def normalize_injury(text):
-    return re.sub(r"\s+", "_", text.strip().lower())
+# Answers generated offline by prewarm.py are served without any upstream call
+prewarm_path = os.getenv("BJJ_PREWARM_ARTIFACT", os.path.join(current_dir, "prewarm_cache.json"))
 
-def filter_moves(injuries, db):
-    injury_norms = [normalize_injury(i) for i in injuries]
-    safe_moves, unsafe_moves = [], []
-    for move in db:
-        if any(injury in move["unsafe_for"] for injury in injury_norms):
-            unsafe_moves.append(move["technique"])
-        else:
-            safe_moves.append(move["technique"])
-    return safe_moves, unsafe_moves
+# The BJJ knowledge base: technique store, bitset index, injury canonicalizer and (on first use) similarity
+# index, rebuilt and swapped in when bjj_moves.json changes. Routes take one knowledge_base.get() per request.
+KB_RELOAD_INTERVAL = float(os.getenv("BJJ_KB_RELOAD_INTERVAL", "2"))
+knowledge_base = ReloadingKnowledgeBase(json_path, kb_snapshot_path, check_interval=KB_RELOAD_INTERVAL)
+
+def create_advisor():
+    """AI advisor whose cache starts with any pre-warmed answers matching this knowledge base"""
+    from ai_service import BJJAIAdvisor
+    from llm_router import create_router
+
+    # The template backend answers from the same live knowledge base as the routes
+    router = create_router(knowledge_base=knowledge_base.get)
+    prewarmed = load_artifact(prewarm_path, router.model_name, knowledge_base.get().version)
+    return BJJAIAdvisor(
+        cache=PrewarmedCache(create_cache(), prewarmed) if prewarmed else None,
+        similarity=CurrentSimilarity(knowledge_base.get),
+        knowledge_version=lambda: knowledge_base.get().version,
+        router=router,
+        workers=int(os.getenv("BJJ_AI_WORKERS", "64")),
+        background_workers=int(os.getenv("BJJ_AI_BACKGROUND_WORKERS", "4")),
+    )
+
+ai_advisor = Lazy(create_advisor)
+
+if not LAZY_INIT:
+    knowledge_base.get().similarity
+    ai_advisor.get()
+
+# Chat histories, bounded by idle TTL and session count (optionally shared via SQLite)
+chat_sessions = create_session_store()
+
+# Estimated prompt-token budget for the chat history sent upstream
+CHAT_TOKEN_BUDGET = int(os.getenv("BJJ_CHAT_TOKEN_BUDGET", "2000"))
+
+# Past this many estimated tokens, older chat turns are replaced by a running summary
+history_compactor = HistoryCompactor(
+    ai_advisor,
+    chat_sessions,
+    threshold_tokens=int(os.getenv("BJJ_CHAT_SUMMARY_THRESHOLD", "1200")),
+    keep_last=int(os.getenv("BJJ_CHAT_KEEP_MESSAGES", "6")),
+)
+
+# Upper bound on athletes per batch request
+MAX_BATCH_PROFILES = 500
+
+# Shared deadline (seconds) for the concurrent recommendation + recovery calls
+AI_DEADLINE_SECONDS = float(os.getenv("BJJ_AI_DEADLINE", "55"))
+
+# Unique batch profiles whose AI calls run at once, all under one AI_DEADLINE_SECONDS
+BATCH_AI_CONCURRENCY = int(os.getenv("BJJ_BATCH_AI_CONCURRENCY", "4"))
+
+# End-to-end deadline (seconds) for a chat turn's upstream call, retries included
+CHAT_DEADLINE_SECONDS = float(os.getenv("BJJ_CHAT_DEADLINE", "30"))
+
+# Background recommendation jobs: the AI calls outlive the request, so they get a longer deadline
+recommendation_jobs = RecommendationJobs(
+    ai_advisor,
+    create_job_store(),
+    workers=int(os.getenv("BJJ_JOB_WORKERS", "4")),
+    timeout=float(os.getenv("BJJ_JOB_DEADLINE", "300")),
+)
+
+# Page size bounds for GET /api/techniques
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# GET filter results only change with the knowledge base. With hot reload on, an edit to bjj_moves.json reaches
+# CDN-cached answers within s-maxage + stale-while-revalidate (6 minutes); with it off, only a deploy changes them
+FILTER_CACHE_CONTROL = os.getenv(
+    "BJJ_FILTER_CACHE_CONTROL",
+    "public, max-age=60, s-maxage=300, stale-while-revalidate=60" if KB_RELOAD_INTERVAL > 0
+    else "public, max-age=300, s-maxage=86400, stale-while-revalidate=604800"
+)
+
+# Existing stats() counters, read at scrape time by GET /api/metrics; advisor ones stay empty until it is built
+metrics.collect("bjj_cache", when_loaded(ai_advisor, lambda advisor: advisor.cache.stats()))
+metrics.collect("bjj_singleflight", when_loaded(ai_advisor, lambda advisor: advisor.inflight.stats()))
+metrics.collect("bjj_upstream", when_loaded(ai_advisor, lambda advisor: advisor.upstream_stats()["upstream"]))
+metrics.collect("bjj_admission", when_loaded(ai_advisor, lambda advisor: advisor.upstream_stats()["admission"]))
+metrics.collect("bjj_circuit", when_loaded(ai_advisor, lambda advisor: advisor.upstream_stats()["circuit"]))
+metrics.collect("bjj_router", when_loaded(
+    ai_advisor, lambda advisor: {k: v for k, v in advisor.router.stats().items() if k != "backends"}
+))
+# Backend names come from BJJ_LLM_BACKENDS, so they go in a label rather than the metric name
+metrics.collect(
+    "bjj_router_backend", when_loaded(ai_advisor, lambda advisor: advisor.router.stats()["backends"]), label="backend"
+)
+metrics.collect("bjj_jobs", recommendation_jobs.stats)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-route latency (time to first byte for streamed responses) and status counts"""
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.observe("bjj_http_request_seconds", time.perf_counter() - started, route=route, method=request.method)
+        metrics.inc("bjj_http_requests_total", route=route, method=request.method, status=response.status_code)
+    return response
+
+def canonical_injuries(injuries, kb):
+    """Canonical terms for a request's injuries; these drive both filtering and AI cache keys"""
+    with metrics.span("normalize"):
+        return kb.canonicalizer.canonicalize_all(injuries)
+
+def filter_moves(terms, kb):
+    """Partition (safe/unsafe names and their pre-encoded JSON) for canonical terms"""
+    with metrics.span("filter"):
+        return kb.partition(kb.canonicalizer.expand(terms))
+
+def json_response(payload, status=200):
+    """JSON response whose RawJSON values are spliced in without re-encoding"""
+    return Response(json_body(payload), status=status, mimetype="application/json")
+
+def prompt_injuries(terms):
+    return [display_name(t) for t in terms]
+
+def wants_stream(data):
+    """Streaming is requested with {"stream": true} in the body or ?stream=1"""
+    if data.get("stream") is True:
+        return True
+    return request.args.get("stream", "").lower() in ("1", "true", "yes")
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(
+        events,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def stream_error_message(e):
+    """Text that replaces a recommendation report whose stream failed"""
+    if isinstance(e, AdmissionRejected):
+        return BUSY_MESSAGE
+    if isinstance(e, CircuitOpen):
+        return UNAVAILABLE_MESSAGE
+    return "Unable to get AI recommendations at this time. Please check your API key and internet connection."
+
+def streamed_recommendations(sections):
+    """ai_recommendations payload assembled from streamed report lines"""
+    return {
+        "recommendations": "\n".join(sections["recommendations"]),
+        "recovery_advice": "\n".join(sections["recovery_advice"])
+        or "Please consult with a healthcare professional for personalized recovery advice."
+    }
+
+def stream_recommendations(injuries, terms, safe_moves, unsafe_moves):
+    """SSE events: partition first, then report lines as they arrive, recovery advice, and the full payload"""
+    yield sse_event("partition", {
+        "injuries": injuries,
+        "canonical_injuries": terms,
+        "safe_moves": safe_moves,
+        "unsafe_moves": unsafe_moves
+    })
+
+    ai_recommendations = {}
+    recovery_advice = ""
+    pending = []
+
+    if terms:
+        deadline = time.monotonic() + AI_DEADLINE_SECONDS
+        advisor_injuries = prompt_injuries(terms)
+        # Recovery advice is generated alongside the streamed report
+        recovery_future = ai_advisor.submit(ai_advisor.get_recovery_advice, advisor_injuries, deadline)
+
+        sections = {"recommendations": [], "recovery_advice": []}
+        try:
+            for section, text in ai_advisor.stream_ai_recommendations(advisor_injuries, safe_moves, unsafe_moves, deadline):
+                sections[section].append(text)
+                yield sse_event("token", {"field": section, "text": text})
+        except Exception as e:
+            print(f"Error streaming AI recommendations: {e}")
+            sections["recommendations"] = [stream_error_message(e)]
+            yield sse_event("error", {"field": "ai_recommendations", "message": sections["recommendations"][0]})
+        ai_recommendations = streamed_recommendations(sections)
+
+        try:
+            recovery_advice = recovery_future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FuturesTimeoutError:
+            recovery_advice = "Recovery advice is still being generated. Please try again shortly."
+            pending.append("recovery_advice")
+        yield sse_event("recovery_advice", {"text": recovery_advice})
+
+    yield sse_event("done", {
+        "injuries": injuries,
+        "canonical_injuries": terms,
+        "safe_moves": safe_moves,
+        "unsafe_moves": unsafe_moves,
+        "ai_recommendations": ai_recommendations,
+        "recovery_advice": recovery_advice,
+        "pending": pending
+    })
 
 @app.route("/api/recommendations", methods=["POST"])
 def api_recommendations():
@@ -40,23 +248,330 @@ def api_recommendations():
     if not isinstance(injuries, list):
         injuries = [injuries]
 
-    safe_moves, unsafe_moves = filter_moves(injuries, technique_db)
+    kb = knowledge_base.get()
+    terms = canonical_injuries(injuries, kb)
+    partition = filter_moves(terms, kb)
+    safe_moves, unsafe_moves = partition.safe_moves, partition.unsafe_moves
+
+    if wants_stream(data):
+        return sse_response(stream_recommendations(injuries, terms, safe_moves, unsafe_moves))
 
     ai_recommendations = {}
     recovery_advice = ""
+    pending = []
 
-    if injuries:
-        ai_recommendations = ai_advisor.get_ai_recommendations(injuries, safe_moves, unsafe_moves)
-        recovery_advice = ai_advisor.get_recovery_advice(injuries)
+    if terms:
+        advice = ai_advisor.get_full_advice(
+            prompt_injuries(terms), safe_moves, unsafe_moves, timeout=AI_DEADLINE_SECONDS
+        )
+        ai_recommendations = advice["ai_recommendations"]
+        recovery_advice = advice["recovery_advice"]
+        pending = advice["pending"]
 
-    return jsonify({
+    return json_response({
         "injuries": injuries,
-        "safe_moves": safe_moves,
-        "unsafe_moves": unsafe_moves,
+        "canonical_injuries": terms,
+        "safe_moves": RawJSON(partition.safe_json),
+        "unsafe_moves": RawJSON(partition.unsafe_json),
         "ai_recommendations": ai_recommendations,
-        "recovery_advice": recovery_advice
+        "recovery_advice": recovery_advice,
+        "pending": pending
     })
 
+@app.route("/api/recommendations/jobs", methods=["POST"])
+def api_recommendation_jobs():
+    data = request.get_json(silent=True) or {}
+    injuries = data.get("injuries", [])
+    if not isinstance(injuries, list):
+        injuries = [injuries]
+
+    kb = knowledge_base.get()
+    terms = canonical_injuries(injuries, kb)
+    partition = filter_moves(terms, kb)
+    job, attached = recommendation_jobs.start(
+        terms, prompt_injuries(terms), partition.safe_moves, partition.unsafe_moves
+    )
+
+    response = json_response({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "attached": attached,
+        "status_url": f"/api/recommendations/jobs/{job['job_id']}",
+        "injuries": injuries,
+        "canonical_injuries": terms,
+        "safe_moves": RawJSON(partition.safe_json),
+        "unsafe_moves": RawJSON(partition.unsafe_json)
+    }, status=202)
+    response.headers["Location"] = f"/api/recommendations/jobs/{job['job_id']}"
+    return response
+
+@app.route("/api/recommendations/jobs/<job_id>", methods=["GET"])
+def api_recommendation_job(job_id):
+    job = recommendation_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    response = jsonify(job)
+    response.headers["Cache-Control"] = "no-store"
+    if job["status"] == "running":
+        response.headers["Retry-After"] = "2"
+    return response
+
+def canonical_query(terms):
+    """The one query string each injury set is served under, so CDN and browser caches share entries"""
+    return f"injuries={quote(','.join(terms), safe=',')}" if terms else ""
+
+def query_injuries():
+    return [i for i in request.args.get("injuries", "").split(",") if i.strip()]
+
+# (knowledge base version, LRU of its GET representations); replaced on reload so the old knowledge base can be freed
+filter_cache = (None, None)
+
+def filter_representation(kb, terms, encoding):
+    """Encoded GET body and its ETag; a pure function of the knowledge base and injury set, cached per encoding"""
+    global filter_cache
+    version, cached = filter_cache
+    if version != kb.version:
+        cached = lru_cache(maxsize=1024)(partial(build_filter_representation, kb))
+        filter_cache = (kb.version, cached)
+    return cached(terms, encoding)
+
+def build_filter_representation(kb, terms, encoding):
+    partition = filter_moves(list(terms), kb)
+    query = canonical_query(terms)
+    body = json_body({
+        "injuries": list(terms),
+        "canonical_injuries": list(terms),
+        "safe_moves": RawJSON(partition.safe_json),
+        "unsafe_moves": RawJSON(partition.unsafe_json),
+        "knowledge_base_version": kb.version[:16],
+        "ai_url": f"/api/recommendations/ai?{query}" if terms else None
+    })
+    if len(body) < MIN_COMPRESS_BYTES:
+        encoding = None
+    etag = strong_etag(kb.version, query)
+    return compress(body, encoding), encoding, representation_etag(etag, encoding), etag
+
+@app.route("/api/recommendations", methods=["GET"])
+def api_recommendations_get():
+    """
+    Cacheable safe/unsafe partition for ?injuries=a,b (AI text comes from /api/recommendations/ai)
+
+    Non-canonical queries are redirected to the canonical spelling, and
+    If-None-Match is answered with 304 while the knowledge base is unchanged.
+    """
+    kb = knowledge_base.get()
+    terms = tuple(canonical_injuries(query_injuries(), kb))
+    query = canonical_query(terms)
+    if request.query_string.decode("utf-8", "replace") != query:
+        response = app.redirect(f"{request.path}?{query}" if query else request.path, code=301)
+        response.headers["Cache-Control"] = FILTER_CACHE_CONTROL
+        return response
+
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    body, encoding, etag, base_etag = filter_representation(kb, terms, encoding)
+    headers = {"ETag": etag, "Cache-Control": FILTER_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("If-None-Match"), (etag, base_etag)):
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype="application/json", headers=headers)
+
+@app.route("/api/recommendations/ai", methods=["GET"])
+def api_recommendations_ai():
+    """AI text for the injury set of a GET filter result; never cached by intermediaries"""
+    kb = knowledge_base.get()
+    terms = canonical_injuries(query_injuries(), kb)
+    partition = filter_moves(terms, kb)
+    safe_moves, unsafe_moves = partition.safe_moves, partition.unsafe_moves
+
+    ai_recommendations = {}
+    recovery_advice = ""
+    pending = []
+    if terms:
+        advice = ai_advisor.get_full_advice(
+            prompt_injuries(terms), safe_moves, unsafe_moves, timeout=AI_DEADLINE_SECONDS
+        )
+        ai_recommendations = advice["ai_recommendations"]
+        recovery_advice = advice["recovery_advice"]
+        pending = advice["pending"]
+
+    response = jsonify({
+        "canonical_injuries": terms,
+        "ai_recommendations": ai_recommendations,
+        "recovery_advice": recovery_advice,
+        "pending": pending
+    })
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+def query_values(name):
+    """Comma-separated and/or repeated query parameter values"""
+    return [v.strip() for raw in request.args.getlist(name) for v in raw.split(",") if v.strip()]
+
+def technique_filter_values(field, values, kb):
+    """Normalize raw query values for one TechniqueIndex field"""
+    if field == "joint":
+        return [term for v in values for term in joint_terms(v)]
+    if field == "stress":
+        return [normalize_term(v) for v in values]
+    if field == "injury":
+        return kb.canonicalizer.expand(canonical_injuries(values, kb))
+    return [normalize_injury(v) for v in values]
+
+# Query parameter -> (field, exclude?) for GET /api/techniques
+TECHNIQUE_QUERY_PARAMS = {
+    "joint": ("joint", False),
+    "exclude_joint": ("joint", True),
+    "stress": ("stress", False),
+    "exclude_stress": ("stress", True),
+    "body_type": ("body_type", False),
+    "exclude_body_type": ("body_type", True),
+    "unsafe_for": ("injury", False),
+    "safe_for_injury": ("injury", True),
+}
+
+def encode_cursor(after, kb):
+    # Ids are positions in the knowledge base, so a cursor is only valid for the version that issued it
+    raw = f"{kb.version[:8]}:{after}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, kb):
+    """Return the ``after`` id of a cursor, or None if it is malformed or from another knowledge base"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        version, after = raw.split(":")
+        after = int(after)
+        # -1 (before the first technique) is the lowest id a cursor may carry
+        return after if version == kb.version[:8] and after >= -1 else None
+    except ValueError:
+        return None
+
+@app.route("/api/techniques", methods=["GET"])
+def api_techniques():
+    """
+    Compound technique query over the inverted indexes, e.g.
+    ?safe_for_injury=acl_reconstruction&body_type=lanky&exclude_stress=rotational torque
+
+    Values within a parameter are OR-ed and parameters are AND-ed. Results come
+    in knowledge-base order, ``limit`` at a time, continued with ``cursor``.
+    """
+    kb = knowledge_base.get()
+    include, exclude = {}, {}
+    for param, (field, excluded) in TECHNIQUE_QUERY_PARAMS.items():
+        values = query_values(param)
+        if values:
+            target = exclude if excluded else include
+            target[field] = target.get(field, []) + technique_filter_values(field, values, kb)
+
+    try:
+        limit = min(MAX_PAGE_SIZE, max(1, int(request.args.get("limit", DEFAULT_PAGE_SIZE))))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    after = -1
+    if request.args.get("cursor"):
+        after = decode_cursor(request.args["cursor"], kb)
+        if after is None:
+            return jsonify({"error": "invalid or expired cursor"}), 400
+
+    technique_index = kb.technique_index
+    mask = technique_index.query(include, exclude)
+    ids, next_after = technique_index.page(mask, after, limit)
+    response = json_response({
+        "techniques": RawJSON(kb.db.records_json(ids)),
+        "total": technique_index.count(mask),
+        "next_cursor": encode_cursor(next_after, kb) if next_after is not None else None,
+        "filters": {"include": include, "exclude": exclude}
+    })
+    response.headers["Cache-Control"] = FILTER_CACHE_CONTROL
+    return response
+
+@app.route("/api/recommendations/batch", methods=["POST"])
+def api_recommendations_batch():
+    data = request.get_json(silent=True) or {}
+    profiles = data.get("profiles", [])
+    include_ai = data.get("include_ai", True)
+
+    if not isinstance(profiles, list):
+        return jsonify({"error": "profiles must be a list"}), 400
+    if len(profiles) > MAX_BATCH_PROFILES:
+        return jsonify({"error": f"at most {MAX_BATCH_PROFILES} profiles per batch"}), 400
+
+    # Each profile is either a list of injuries or {"id": ..., "injuries": [...]}
+    kb = knowledge_base.get()
+    entries = []
+    for i, profile in enumerate(profiles):
+        if isinstance(profile, dict):
+            profile_id = profile.get("id", i)
+            injuries = profile.get("injuries", [])
+        else:
+            profile_id, injuries = i, profile
+        if isinstance(injuries, str):
+            injuries = [injuries]
+        if not isinstance(injuries, list) or not all(isinstance(injury, str) for injury in injuries):
+            return jsonify({
+                "error": f"profiles[{i}] must be a list of injury strings or an object with an \"injuries\" list of strings"
+            }), 400
+        key = tuple(canonical_injuries(injuries, kb))
+        entries.append((profile_id, injuries, key))
+
+    # Deduplicate profiles that canonicalize to the same injuries before any filtering or AI work
+    keys = list(dict.fromkeys(key for _, _, key in entries))
+    expanded = [kb.canonicalizer.expand(key) for key in keys]
+    partitions = dict(zip(keys, kb.technique_index.partition_many(expanded)))
+
+    ai_results = {}
+    if include_ai:
+        # Unique profiles share one overall deadline, a few at a time; unfinished ones come back pending
+        ai_keys = [key for key in keys if key]
+        advice = ai_advisor.get_batch_advice(
+            [(prompt_injuries(key), *partitions[key]) for key in ai_keys],
+            timeout=AI_DEADLINE_SECONDS, max_concurrency=BATCH_AI_CONCURRENCY,
+        )
+        ai_results = dict(zip(ai_keys, advice))
+
+    results = []
+    for profile_id, injuries, key in entries:
+        safe_moves, unsafe_moves = partitions[key]
+        advice = ai_results.get(key, {"ai_recommendations": {}, "recovery_advice": "", "pending": []})
+        results.append({
+            "id": profile_id,
+            "injuries": injuries,
+            "canonical_injuries": list(key),
+            "safe_moves": safe_moves,
+            "unsafe_moves": unsafe_moves,
+            "ai_recommendations": advice["ai_recommendations"],
+            "recovery_advice": advice["recovery_advice"],
+            "pending": advice["pending"]
+        })
+
+    return jsonify({
+        "results": results,
+        "unique_profiles": len(keys)
+    })
+
+@app.route("/api/cache/stats", methods=["GET"])
+def api_cache_stats():
+    stats = ai_advisor.cache.stats()
+    stats["inflight"] = ai_advisor.inflight.stats()
+    stats["jobs"] = recommendation_jobs.stats()
+    return jsonify(stats)
+
+@app.route("/api/upstream/stats", methods=["GET"])
+def api_upstream_stats():
+    upstream = ai_advisor.upstream_stats()
+    stats = dict(upstream["upstream"])
+    stats["admission"] = upstream["admission"]
+    stats["circuit"] = upstream["circuit"]
+    stats["router"] = ai_advisor.router.stats()
+    return jsonify(stats)
+
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """Counters, latency histograms and stage timings in Prometheus text format"""
+    response = Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
 @app.route("/api/chat", methods=["POST"])
 def api_chat():
     data = request.get_json(silent=True) or {}
@@ -66,10 +581,33 @@ def api_chat():
     if not user_message:
         return jsonify({"error": "message is required"}), 400
 
-    # Minimal in-memory chat history per session
-    if not hasattr(app, "_chat_histories"):
-        app._chat_histories = {}
-    history = app._chat_histories.get(session_id, [])
+    history, trimmed, prompt_tokens = start_chat_turn(session_id, user_message)
+    deadline = time.monotonic() + CHAT_DEADLINE_SECONDS
+
+    if wants_stream(data):
+        return sse_response(stream_chat(session_id, history, trimmed, deadline, prompt_tokens))
+
+    # Call AI
+    try:
+        ai_text = ai_advisor.chat_completion(trimmed, max_tokens=400, temperature=0.1, deadline=deadline)
+    except AdmissionRejected as e:
+        # Fail fast instead of queueing past the deadline; the turn is not stored so the user can resend it
+        print(f"Chat call not admitted: {e}")
+        return jsonify({"session_id": session_id, "reply": BUSY_MESSAGE, "busy": True}), 503
+    except CircuitOpen:
+        return jsonify({"session_id": session_id, "reply": UNAVAILABLE_MESSAGE, "busy": True}), 503
+
+    return jsonify(commit_chat_turn(session_id, history, ai_text, prompt_tokens))
+
+def start_chat_turn(session_id, user_message):
+    """
+    Add the user's message to the session history and build the upstream messages
+
+    Returns (history, trimmed messages to send, prompt token counts); the
+    history is only stored by commit_chat_turn.
+    """
+    # Chat history per session; changes are committed once the reply is complete
+    history = chat_sessions.get(session_id)
 
     # System prompt to guide tone and role
     if not history:
@@ -86,21 +624,44 @@ def api_chat():
     # Append user message
     history.append({"role": "user", "content": user_message})
 
-    # Trim history to last ~10 turns to keep payload small
-    trimmed = history[-21:]
+    # Summarize older turns, then trim to an estimated token budget to keep the upstream payload small
+    compacted, prompt_tokens = history_compactor.compact(session_id, history)
+    trimmed = trim_to_token_budget(compacted, CHAT_TOKEN_BUDGET)
+    prompt_tokens["after"] = count_tokens(trimmed)
+    return history, trimmed, prompt_tokens
 
-    # Call AI
-    ai_text = ai_advisor.chat_completion(trimmed, max_tokens=400, temperature=0.1)
-
-    # Append assistant reply and persist
+def commit_chat_turn(session_id, history, ai_text, prompt_tokens):
+    """Append the assistant reply, persist the session and build the response body"""
     history.append({"role": "assistant", "content": ai_text})
-    app._chat_histories[session_id] = history[-50:]
+    chat_sessions.save(session_id, history)
 
-    return jsonify({
+    return {
         "session_id": session_id,
         "reply": ai_text,
-        "history_len": len(app._chat_histories[session_id])
-    })
+        "history_len": min(len(history), chat_sessions.max_messages),
+        "prompt_tokens": prompt_tokens
+    }
+
+def stream_chat(session_id, history, trimmed, deadline, prompt_tokens):
+    """SSE events: reply tokens as they arrive, then the committed turn; history is untouched if the stream fails"""
+    reply = []
+    try:
+        for chunk in ai_advisor.stream_chat_completion(trimmed, max_tokens=400, temperature=0.1, deadline=deadline):
+            reply.append(chunk)
+            yield sse_event("token", {"text": chunk})
+    except AdmissionRejected as e:
+        print(f"Chat stream not admitted: {e}")
+        yield sse_event("error", {"message": BUSY_MESSAGE, "busy": True})
+        return
+    except CircuitOpen:
+        yield sse_event("error", {"message": UNAVAILABLE_MESSAGE, "busy": True})
+        return
+    except Exception as e:
+        print(f"Error streaming chat completion: {e}")
+        yield sse_event("error", {"message": "Unable to get a reply at this time. Please try again."})
+        return
+
+    yield sse_event("done", commit_chat_turn(session_id, history, "".join(reply), prompt_tokens))
 
 # Vercel serverless function handler
 def handler(request):
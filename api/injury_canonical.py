@@ -0,0 +1,236 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+from technique_index import normalize_injury
+
+# Canonicalization of free-text injuries onto the knowledge-base tag vocabulary
+
+# Broad complaints expand to every specific tag for that region, so filtering errs on the safe side
+INJURY_GROUPS: Dict[str, List[str]] = {
+    "knee_injury": ["acl_reconstruction", "meniscus_tear", "mcl_sprain", "pcl_injury", "patellofemoral_pain"],
+    "shoulder_injury": ["labrum_tear", "rotator_cuff_injury", "shoulder_instability"],
+    "back_injury": ["lower_back_pain", "spinal_disc_injury", "scoliosis"],
+    "wrist_injury": ["wrist_ligament_injury", "recent_wrist_fracture", "carpal_instability"],
+    "ankle_injury": ["ankle_instability", "ankle_ligament_injury", "achilles_tendonitis"],
+    "elbow_injury": ["elbow_ligament_injury"],
+    "hip_injury": ["hip_labrum_injury"],
+}
+
+# Common spellings -> canonical term (a knowledge-base tag or an INJURY_GROUPS key)
+INJURY_ALIASES: Dict[str, str] = {
+    "torn meniscus": "meniscus_tear",
+    "meniscus": "meniscus_tear",
+    "torn acl": "acl_reconstruction",
+    "acl": "acl_reconstruction",
+    "acl tear": "acl_reconstruction",
+    "acl surgery": "acl_reconstruction",
+    "mcl": "mcl_sprain",
+    "mcl tear": "mcl_sprain",
+    "pcl": "pcl_injury",
+    "pcl tear": "pcl_injury",
+    "runners knee": "patellofemoral_pain",
+    "kneecap pain": "patellofemoral_pain",
+    "knee": "knee_injury",
+    "knee pain": "knee_injury",
+    "bad knee": "knee_injury",
+    "torn labrum": "labrum_tear",
+    "slap tear": "labrum_tear",
+    "rotator cuff": "rotator_cuff_injury",
+    "rotator cuff tear": "rotator_cuff_injury",
+    "dislocated shoulder": "shoulder_instability",
+    "shoulder dislocation": "shoulder_instability",
+    "shoulder": "shoulder_injury",
+    "shoulder pain": "shoulder_injury",
+    "back pain": "back_injury",
+    "bad back": "back_injury",
+    "low back pain": "lower_back_pain",
+    "herniated disc": "spinal_disc_injury",
+    "slipped disc": "spinal_disc_injury",
+    "bulging disc": "spinal_disc_injury",
+    "herniated cervical disc": "cervical_disc_injury",
+    "neck pain": "neck_injury",
+    "stiff neck": "neck_injury",
+    "whiplash": "neck_injury",
+    "broken wrist": "recent_wrist_fracture",
+    "wrist fracture": "recent_wrist_fracture",
+    "sprained wrist": "wrist_ligament_injury",
+    "wrist pain": "wrist_injury",
+    "sprained ankle": "ankle_ligament_injury",
+    "ankle sprain": "ankle_ligament_injury",
+    "rolled ankle": "ankle_ligament_injury",
+    "achilles": "achilles_tendonitis",
+    "achilles tendinitis": "achilles_tendonitis",
+    "pulled hamstring": "hamstring_injury",
+    "hamstring strain": "hamstring_injury",
+    "elbow pain": "elbow_injury",
+    "hyperextended elbow": "elbow_ligament_injury",
+    "hip labral tear": "hip_labrum_injury",
+    "hip pain": "hip_injury",
+}
+
+
+# Words saying how a body part is hurt rather than which one; fuzzy matching ignores them so that
+# "sprained knee" is compared with the knee phrases, not with "sprained wrist"
+GENERIC_INJURY_WORDS = frozenset({
+    "injury", "injuries", "injured", "pain", "painful", "sore", "soreness", "ache", "aching", "hurt", "hurts",
+    "fracture", "fractured", "broken", "break", "sprain", "sprained", "strain", "strained", "tear", "torn",
+    "pulled", "rolled", "bad", "surgery", "left", "right", "my", "a", "the",
+})
+
+# Words naming a body region; a fuzzy match must cover a region the text names, if it names any
+BODY_REGION_WORDS: Dict[str, str] = {
+    "knee": "knee", "knees": "knee", "kneecap": "knee", "acl": "knee", "mcl": "knee", "pcl": "knee",
+    "meniscus": "knee", "patella": "knee", "patellofemoral": "knee",
+    "shoulder": "shoulder", "shoulders": "shoulder", "rotator": "shoulder", "cuff": "shoulder",
+    "back": "back", "spine": "back", "spinal": "back", "lumbar": "back", "scoliosis": "back",
+    "neck": "neck", "cervical": "neck",
+    "wrist": "wrist", "wrists": "wrist", "carpal": "wrist",
+    "ankle": "ankle", "ankles": "ankle", "achilles": "ankle",
+    "elbow": "elbow", "elbows": "elbow",
+    "hip": "hip", "hips": "hip",
+    "hamstring": "hamstring", "hamstrings": "hamstring",
+    # Regions the knowledge base has no tags for; naming one rules out every fuzzy match
+    "toe": "toe", "toes": "toe", "foot": "foot", "feet": "foot", "finger": "finger", "fingers": "finger",
+    "thumb": "finger", "hand": "hand", "rib": "rib", "ribs": "rib", "jaw": "jaw", "nose": "nose",
+    "ear": "ear", "groin": "groin", "quad": "thigh", "calf": "calf", "shin": "shin", "chest": "chest",
+}
+
+
+def phrase_key(text: str) -> str:
+    """Lowercase, drop punctuation and collapse separators: "Meniscus-Tear!" -> "meniscus tear" """
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower().replace("'", "")).split())
+
+
+def core_key(phrase: str) -> str:
+    """Sorted words of a phrase key without GENERIC_INJURY_WORDS: "Sprained ACL knee" -> "acl knee" """
+    return " ".join(sorted(word for word in phrase.split() if word not in GENERIC_INJURY_WORDS))
+
+
+def body_regions(phrase: str) -> Set[str]:
+    return {BODY_REGION_WORDS[word] for word in phrase.split() if word in BODY_REGION_WORDS}
+
+
+def trigrams(phrase: str) -> Set[str]:
+    padded = f"  {phrase} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InjuryCanonicalizer:
+    def __init__(self, db: List[Dict], aliases: Optional[Dict[str, str]] = None, min_similarity: float = 0.55):
+        """
+        Resolve free-text injuries to canonical terms
+
+        Canonical terms are the ``unsafe_for`` tags of the knowledge base plus
+        the broad INJURY_GROUPS keys. Lookup tries the exact tag, then the alias
+        table (also with words sorted), then the same phrases with generic words
+        like "injury" or "sprained" dropped, then a character-trigram index over
+        those reduced phrases, scored by Dice similarity. A trigram match must
+        reach ``min_similarity`` and cover every body region the text names.
+        Text without such a match resolves to the broad term for the one body
+        region it names ("knee ligament injury" -> knee_injury), or else is kept
+        as typed (normalized) rather than guessed.
+        """
+        self.vocabulary: Set[str] = {normalize_injury(t) for move in db for t in move.get("unsafe_for", [])}
+        self.groups = {
+            term: [tag for tag in tags if tag in self.vocabulary] for term, tags in INJURY_GROUPS.items()
+        }
+        canonical_terms = self.vocabulary | set(self.groups)
+        self.min_similarity = min_similarity
+        # Member tag -> its broad group, which also gives the tag its body region
+        self.group_of = {tag: term for term, tags in INJURY_GROUPS.items() for tag in tags}
+
+        # phrase -> canonical term, for exact and word-order-insensitive lookups
+        self.phrases: Dict[str, str] = {}
+        for term in canonical_terms:
+            self.phrases[phrase_key(term)] = term
+        for alias, term in (aliases if aliases is not None else INJURY_ALIASES).items():
+            if term in canonical_terms:
+                self.phrases[phrase_key(alias)] = term
+        self.sorted_phrases = {" ".join(sorted(p.split())): term for p, term in self.phrases.items()}
+
+        # Phrases reduced to their specific words; several terms sharing one resolve to their common group
+        self.cores: Dict[str, str] = {}
+        for phrase, term in self.phrases.items():
+            core = core_key(phrase)
+            if core:
+                self.cores[core] = self._common_term(self.cores.get(core, term), term)
+
+        # Trigram inverted index over every reduced phrase, with the body regions each one covers
+        self.entries = list(self.cores)
+        self.entry_grams = [trigrams(core) for core in self.entries]
+        self.entry_regions = [self._regions(core, self.cores[core]) for core in self.entries]
+        self.gram_index: Dict[str, List[int]] = {}
+        for i, grams in enumerate(self.entry_grams):
+            for gram in grams:
+                self.gram_index.setdefault(gram, []).append(i)
+
+        self._memo: Dict[str, str] = {}
+
+    def _common_term(self, a: str, b: str) -> str:
+        """The broad group covering both terms when they share one, else the first"""
+        group_a, group_b = self.group_of.get(a, a), self.group_of.get(b, b)
+        if a != b and group_a == group_b and group_a in self.groups:
+            return group_a
+        return a
+
+    def _regions(self, core: str, term: str) -> Set[str]:
+        regions = body_regions(core) | body_regions(phrase_key(term))
+        group = self.group_of.get(term)
+        if group is not None:
+            regions |= body_regions(phrase_key(group))
+        return regions
+
+    def canonicalize(self, text: str) -> str:
+        """Map one free-text injury to its canonical term (falls back to normalize_injury)"""
+        term = self._memo.get(text)
+        if term is None:
+            term = self._resolve(text)
+            if len(self._memo) < 10000:
+                self._memo[text] = term
+        return term
+
+    def _resolve(self, text: str) -> str:
+        phrase = phrase_key(text)
+        if not phrase:
+            return normalize_injury(text)
+        term = self.phrases.get(phrase) or self.sorted_phrases.get(" ".join(sorted(phrase.split())))
+        if term:
+            return term
+        core = core_key(phrase)
+        match = (self.cores.get(core) or self._fuzzy_match(core) or self._region_term(core)) if core else None
+        return match if match else normalize_injury(text)
+
+    def _region_term(self, core: str) -> Optional[str]:
+        """Broad term for the single body region named in ``core`` (covering every tag of that region)"""
+        regions = body_regions(core)
+        return self.cores.get(regions.pop()) if len(regions) == 1 else None
+
+    def _fuzzy_match(self, core: str) -> Optional[str]:
+        grams = trigrams(core)
+        regions = body_regions(core)
+        shared = Counter(i for gram in grams for i in self.gram_index.get(gram, ()))
+        best, best_score = None, self.min_similarity
+        for i, common in shared.items():
+            if regions and not regions <= self.entry_regions[i]:
+                continue
+            score = 2 * common / (len(grams) + len(self.entry_grams[i]))
+            if score > best_score:
+                best, best_score = i, score
+        return self.cores[self.entries[best]] if best is not None else None
+
+    def canonicalize_all(self, injuries: Iterable[str]) -> List[str]:
+        """Sorted, de-duplicated canonical terms for an injury profile"""
+        return sorted({term for term in map(self.canonicalize, injuries) if term})
+
+    def expand(self, terms: Iterable[str]) -> List[str]:
+        """Knowledge-base tags covered by canonical terms (groups expand to their member tags)"""
+        tags: Set[str] = set()
+        for term in terms:
+            tags.update(self.groups.get(term, [term]))
+        return sorted(tags)
+
+
+def display_name(term: str) -> str:
+    """Readable form of a canonical term for prompts: "meniscus_tear" -> "meniscus tear" """
+    return term.replace("_", " ")
@@ -0,0 +1,223 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+# Asynchronous recommendation jobs: POST returns immediately, clients poll for the AI text
+
+AI_PARTS = ("ai_recommendations", "recovery_advice")
+
+# Returned for a part whose worker raised instead of producing a fallback text
+FAILED_PART_TEXT = "Unable to generate this part. Please try again."
+
+
+class MemoryJobStore:
+    def __init__(self, max_jobs: int = 1000, ttl: float = 3600):
+        """In-process job records, oldest evicted past ``max_jobs`` or ``ttl`` seconds"""
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            cutoff = time.time() - self.ttl
+            while self._jobs:
+                oldest = next(iter(self._jobs.values()))
+                if len(self._jobs) <= self.max_jobs and oldest["created"] >= cutoff:
+                    break
+                self._jobs.popitem(last=False)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job is not None else None
+
+    def find_running(self, key: str, since: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job["key"] == key and job["status"] == "running" and job["created"] >= since:
+                    return json.loads(json.dumps(job))
+        return None
+
+    def update(self, job_id: str, fields: Dict[str, Any]):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+
+class SQLiteJobStore:
+    def __init__(self, path: str, max_jobs: int = 10000, ttl: float = 3600):
+        """Job records in a SQLite file, so any worker process can answer a status poll"""
+        self.path = path
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS recommendation_jobs ("
+            "job_id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, created REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS recommendation_jobs_key ON recommendation_jobs (key, status)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread, reopened after fork"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, job: Dict[str, Any]):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO recommendation_jobs (job_id, key, status, created, data) VALUES (?, ?, ?, ?, ?)",
+            (job["job_id"], job["key"], job["status"], job["created"], json.dumps(job)),
+        )
+        conn.execute("DELETE FROM recommendation_jobs WHERE created < ?", (time.time() - self.ttl,))
+        conn.execute(
+            "DELETE FROM recommendation_jobs WHERE job_id IN "
+            "(SELECT job_id FROM recommendation_jobs ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_jobs,),
+        )
+        conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM recommendation_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def find_running(self, key: str, since: float) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT data FROM recommendation_jobs WHERE key = ? AND status = 'running' AND created >= ? "
+            "ORDER BY created DESC LIMIT 1",
+            (key, since),
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def update(self, job_id: str, fields: Dict[str, Any]):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT data FROM recommendation_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is not None:
+            job = json.loads(row[0])
+            job.update(fields)
+            conn.execute(
+                "UPDATE recommendation_jobs SET status = ?, data = ? WHERE job_id = ?",
+                (job["status"], json.dumps(job), job_id),
+            )
+        conn.commit()
+
+
+class RecommendationJobs:
+    def __init__(self, advisor, store, workers: int = 4, timeout: float = 300):
+        """
+        Run the AI part of a recommendation request in the background
+
+        The caller already has the safe/unsafe lists; a dedicated worker pool
+        makes the recommendation and recovery calls (each with a ``timeout``
+        second deadline) and fills the job's parts as they finish. A request
+        for an injury set that already has a running job attaches to it. With
+        the SQLite store, attaching also works across worker processes, but
+        two processes racing on a brand-new key may each start a job; the
+        advisor's single-flight still makes one upstream call per answer.
+        """
+        self.advisor = advisor
+        self.store = store
+        self.timeout = timeout
+        self.attached = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bjj-job")
+        self._lock = threading.Lock()
+
+    def start(
+        self, terms: List[str], injuries: List[str], safe_moves: List[str], unsafe_moves: List[str]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Return (job, attached); ``terms`` are the canonical injuries identifying the job"""
+        key = json.dumps(sorted(terms))
+        with self._lock:
+            job = self.store.find_running(key, since=time.time() - self.timeout)
+            if job is not None:
+                self.attached += 1
+                return job, True
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "key": key,
+                "status": "running" if terms else "complete",
+                "created": time.time(),
+                "canonical_injuries": terms,
+                "safe_moves": safe_moves,
+                "unsafe_moves": unsafe_moves,
+                "ai_recommendations": None if terms else {},
+                "recovery_advice": None if terms else "",
+                "pending": list(AI_PARTS) if terms else [],
+            }
+            self.store.create(job)
+        if not terms:
+            return job, False
+
+        deadline = time.monotonic() + self.timeout
+        calls = {
+            "ai_recommendations": self._executor.submit(
+                self.advisor.get_ai_recommendations, injuries, safe_moves, unsafe_moves, deadline
+            ),
+            "recovery_advice": self._executor.submit(self.advisor.get_recovery_advice, injuries, deadline),
+        }
+        for part, future in calls.items():
+            future.add_done_callback(lambda f, part=part: self._finish(job["job_id"], part, f))
+        return job, False
+
+    def _finish(self, job_id: str, part: str, future: Future):
+        error = future.exception()
+        if error is not None:
+            print(f"Recommendation job {job_id} failed on {part}: {error}")
+        value = future.result() if error is None else FAILED_PART_TEXT
+        # Both parts of a job finish in this process, so the lock makes read-modify-write safe
+        with self._lock:
+            job = self.store.get(job_id)
+            if job is None:
+                return
+            pending = [p for p in job["pending"] if p != part]
+            self.store.update(job_id, {
+                part: value,
+                "pending": pending,
+                "status": "running" if pending else "complete",
+                "updated": time.time(),
+            })
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        # A job whose worker died never completes; report it instead of polling forever
+        if job["status"] == "running" and time.time() - job["created"] > self.timeout + 60:
+            job["status"] = "expired"
+        job.pop("key", None)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        return {"attached": self.attached}
+
+
+def create_job_store():
+    """
+    Build the recommendation job store from environment settings
+
+    BJJ_JOB_BACKEND: "memory" (default) or "sqlite"
+    BJJ_JOB_PATH: SQLite file path (default: /tmp/bjj_jobs.sqlite3)
+    BJJ_JOB_TTL: seconds a finished job stays pollable (default: 3600)
+    """
+    backend = os.getenv("BJJ_JOB_BACKEND", "memory").lower()
+    ttl = float(os.getenv("BJJ_JOB_TTL", "3600"))
+    if backend == "sqlite":
+        return SQLiteJobStore(os.getenv("BJJ_JOB_PATH", "/tmp/bjj_jobs.sqlite3"), ttl=ttl)
+    return MemoryJobStore(ttl=ttl)
@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from injury_canonical import InjuryCanonicalizer
+from prewarm import knowledge_base_hash
+from technique_index import TechniqueIndex
+from technique_store import TechniqueStore
+
+# bjj_moves.json and everything derived from it, built once per process (or loaded from a snapshot)
+
+# Bump when KnowledgeBase's pickled layout changes so older snapshots are rebuilt instead of loaded
+SNAPSHOT_FORMAT_VERSION = 4
+
+# Distinct unsafe masks whose partition (lists and encoded JSON) is kept ready
+PARTITION_CACHE_SIZE = 1024
+
+
+class Partition(NamedTuple):
+    """Safe/unsafe technique names plus their JSON arrays; shared between requests, so never mutate"""
+    safe_moves: List[str]
+    unsafe_moves: List[str]
+    safe_json: bytes
+    unsafe_json: bytes
+
+
+class KnowledgeBase:
+    def __init__(self, db: List[Dict], version: str):
+        """
+        The technique store with its bitset index and injury canonicalizer
+
+        The similarity index is built on first use: it needs NumPy, which is
+        only worth importing once a recommendation prompt is actually built.
+        """
+        self.db = TechniqueStore(db)
+        self.version = version
+        self.technique_index = TechniqueIndex(self.db)
+        self.canonicalizer = InjuryCanonicalizer(self.db)
+        self._similarity = None
+        self._partitions: "OrderedDict[int, Partition]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_json(cls, json_path: str) -> "KnowledgeBase":
+        with open(json_path, "r") as f:
+            db = json.load(f)
+        return cls(db, knowledge_base_hash(json_path))
+
+    @property
+    def similarity(self):
+        if self._similarity is None:
+            with self._lock:
+                if self._similarity is None:
+                    from similarity_index import TechniqueSimilarityIndex
+                    self._similarity = TechniqueSimilarityIndex(self.db)
+        return self._similarity
+
+    def partition(self, injury_tags: Iterable[str]) -> Partition:
+        """Safe/unsafe split for already-expanded injury tags, memoized per unsafe mask"""
+        index = self.technique_index
+        mask = index.unsafe_mask(injury_tags)
+        with self._lock:
+            partition = self._partitions.get(mask)
+            if partition is not None:
+                self._partitions.move_to_end(mask)
+                return partition
+
+        names = self.db.name_json
+        partition = Partition(
+            index.select(mask, invert=True),
+            index.select(mask),
+            b"[" + b",".join(index.select(mask, invert=True, items=names)) + b"]",
+            b"[" + b",".join(index.select(mask, items=names)) + b"]",
+        )
+        with self._lock:
+            self._partitions[mask] = partition
+            if len(self._partitions) > PARTITION_CACHE_SIZE:
+                self._partitions.popitem(last=False)
+        return partition
+
+    def __getstate__(self):
+        # Snapshots hold only the pure-Python structures, so loading one never imports NumPy
+        state = self.__dict__.copy()
+        state["_similarity"] = None
+        state["_partitions"] = OrderedDict()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class CurrentSimilarity:
+    def __init__(self, get_knowledge_base):
+        """Similarity lookups against whichever knowledge base ``get_knowledge_base()`` returns"""
+        self.get_knowledge_base = get_knowledge_base
+
+    def similar_alternatives(self, unsafe_moves, k: int = 3):
+        return self.get_knowledge_base().similarity.similar_alternatives(unsafe_moves, k)
+
+
+class ReloadingKnowledgeBase:
+    def __init__(self, json_path: str, snapshot_path: Optional[str] = None, check_interval: float = 2.0):
+        """
+        The current KnowledgeBase, loaded on first use and replaced when ``json_path`` changes
+
+        At most every ``check_interval`` seconds (0 disables reloading) a caller
+        stats the file; a changed mtime or size rebuilds the knowledge base on a
+        background thread, and the new one is swapped in with a single reference
+        assignment. A request that takes ``get()`` once sees one consistent
+        version throughout. If the edited file fails to load, the old version
+        keeps serving until the file changes again. Attribute access is forwarded
+        to the current knowledge base.
+        """
+        self.json_path = json_path
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._current: Optional[KnowledgeBase] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._next_check = 0.0
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def _file_stamp(self) -> Tuple[int, int]:
+        stat = os.stat(self.json_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    @property
+    def loaded(self) -> bool:
+        return self._current is not None
+
+    def get(self) -> KnowledgeBase:
+        current = self._current
+        if current is None:
+            with self._lock:
+                if self._current is None:
+                    self._stamp = self._file_stamp()
+                    self._current = load_knowledge_base(self.json_path, self.snapshot_path)
+                    self._next_check = time.monotonic() + self.check_interval
+                return self._current
+        if self.check_interval > 0 and time.monotonic() >= self._next_check:
+            self._check_for_changes()
+        return current
+
+    def _check_for_changes(self):
+        with self._lock:
+            if self._reloading or time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                stamp = self._file_stamp()
+            except OSError:
+                return
+            if stamp == self._stamp:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, args=(stamp,), daemon=True, name="bjj-kb-reload").start()
+
+    def _reload(self, stamp: Tuple[int, int]):
+        previous = self._current
+        try:
+            kb = KnowledgeBase.from_json(self.json_path)
+            if previous is not None and previous._similarity is not None:
+                kb.similarity  # built before the swap, so no request pays for it
+            self._current = kb
+            self.reloads += 1
+            print(f"Reloaded knowledge base: {len(kb.db)} techniques, version {kb.version[:12]}")
+        except Exception as e:
+            print(f"Knowledge base reload failed, still serving version {previous.version[:12]}: {e}")
+        finally:
+            with self._lock:
+                self._stamp = stamp
+                self._reloading = False
+
+    def __getattr__(self, name: str):
+        # Only reached for names not defined on the holder itself
+        return getattr(self.get(), name)
+
+
+def save_snapshot(kb: KnowledgeBase, path: str):
+    """Pickle the built knowledge base (atomically) for faster cold starts"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump((SNAPSHOT_FORMAT_VERSION, kb.version, kb), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str, version: str) -> Optional[KnowledgeBase]:
+    """
+    The snapshot at ``path`` if it was built from this knowledge-base version, else None
+
+    Snapshots are pickles: only load files produced by this repo's build step.
+    """
+    try:
+        with open(path, "rb") as f:
+            format_version, snapshot_version, kb = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Could not read knowledge base snapshot {path}: {e}")
+        return None
+    if format_version != SNAPSHOT_FORMAT_VERSION or snapshot_version != version:
+        print(f"Ignoring stale knowledge base snapshot {path}")
+        return None
+    return kb
+
+
+def load_knowledge_base(json_path: str, snapshot_path: Optional[str] = None) -> KnowledgeBase:
+    """Load from a matching snapshot when one is given, else parse and index bjj_moves.json"""
+    if snapshot_path:
+        kb = load_snapshot(snapshot_path, knowledge_base_hash(json_path))
+        if kb is not None:
+            return kb
+    return KnowledgeBase.from_json(json_path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Precompile the knowledge base snapshot loaded by BJJ_KB_SNAPSHOT")
+    parser.add_argument("--kb", default=os.path.join(here, "bjj_moves.json"), help="knowledge base JSON")
+    parser.add_argument("--output", default=os.path.join(here, "kb_snapshot.pickle"), help="snapshot path")
+    args = parser.parse_args(argv)
+
+    kb = KnowledgeBase.from_json(args.kb)
+    save_snapshot(kb, args.output)
+    print(f"Wrote snapshot of {len(kb.db)} techniques (version {kb.version[:12]}) to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
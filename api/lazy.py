@@ -0,0 +1,39 @@
+import threading
+from typing import Any, Callable, Dict
+
+# Deferred construction of expensive module-level objects
+
+
+class Lazy:
+    def __init__(self, factory: Callable[[], Any]):
+        """
+        Proxy that calls ``factory`` on first attribute access and forwards to the result
+
+        Construction happens once even under concurrent first use; ``get()``
+        returns the real object and ``loaded`` reports whether it exists yet.
+        """
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def get(self) -> Any:
+        target = self._target
+        if target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+                target = self._target
+        return target
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for names not defined on the proxy itself
+        return getattr(self.get(), name)
+
+
+def when_loaded(lazy: Lazy, fn: Callable[[Any], Dict]) -> Callable[[], Dict]:
+    """Stats collector calling ``fn`` on the target only once it exists; empty before, so reading never builds it"""
+    return lambda: fn(lazy.get()) if lazy.loaded else {}
@@ -0,0 +1,387 @@
+import json
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from circuit_breaker import create_circuit_breaker
+from metrics import debug_sampled, metrics
+from rate_limiter import PRIORITY_RECOMMENDATIONS, create_rate_limiter
+from response_cleaner import StreamingCleaner, clean_response
+
+if TYPE_CHECKING:
+    import requests
+
+# Completion backends behind llm_router.BackendRouter
+
+# Default upstream endpoint (override with NVIDIA_API_URL, e.g. to point at benchmarks/fake_nvidia.py)
+DEFAULT_API_URL = "https://integrate.api.nvidia.com/v1/chat/completions"
+
+# Default upstream model
+MODEL_NAME = "nvidia/nvidia-nemotron-nano-9b-v2"
+
+# Tasks a call is routed by: short chat turns, the two long-form reports and background chat summaries
+TASK_CHAT = "chat"
+TASK_RECOMMENDATIONS = "recommendations"
+TASK_RECOVERY = "recovery"
+TASK_SUMMARY = "summary"
+
+
+class LLMCall(NamedTuple):
+    """One completion request: the task it serves, chat messages and sampling params"""
+    task: str
+    messages: List[Dict[str, str]]
+    params: Dict[str, Any]
+    # Structured inputs (injuries, safe/unsafe moves) for backends that do not read prompts
+    context: Optional[Dict[str, Any]] = None
+
+
+def clean_text(text: str) -> str:
+    """Clean up reasoning model responses to remove internal thinking"""
+    with metrics.span("clean"):
+        return clean_response(text)
+
+
+def completion_text(response: "requests.Response") -> str:
+    """
+    Cleaned reply text from a chat-completions response (requests or httpx)
+
+    Raises on an HTTP error or a non-JSON body.
+    """
+    if debug_sampled():
+        try:
+            print("[NVIDIA API] status:", response.status_code)
+            print("[NVIDIA API] body preview:", response.text[:500])
+        except Exception:
+            pass
+
+    response.raise_for_status()
+
+    with metrics.span("parse"):
+        try:
+            result = response.json()
+        except Exception as e:
+            print("[NVIDIA API] JSON parse error:", e)
+            raise
+
+        try:
+            choices = result.get("choices", [])
+            first = choices[0] if choices else {}
+            message = first.get("message", {}) or {}
+
+            # Candidate fields in order of preference
+            candidates = [
+                message.get("content"),
+                message.get("reasoning_content"),
+                first.get("text"),
+                (first.get("delta") or {}).get("content"),
+                (result.get("output") or {}).get("text"),
+            ]
+            text = next((c.strip() for c in candidates if isinstance(c, str) and c.strip()), None)
+        except Exception as e:
+            print("[NVIDIA API] Parse error:", e)
+            return "AI response received but could not be parsed."
+
+    if text is not None:
+        return clean_text(text)
+
+    # Last-resort: dump minimal info for debugging
+    print("[NVIDIA API] Unrecognized content structure keys:", {
+        "message_keys": list(message.keys()) if isinstance(message, dict) else type(message),
+        "first_keys": list(first.keys()) if isinstance(first, dict) else type(first),
+    })
+    return "AI response received but content was empty."
+
+
+# Returned by stream_delta for the end-of-stream marker
+STREAM_DONE = ("done", "")
+
+
+def stream_delta(raw: Optional[str]) -> Optional[Tuple[str, str]]:
+    """("content" | "reasoning", text) from one line of an OpenAI-style SSE stream, STREAM_DONE at its end, else None"""
+    if not raw or not raw.startswith("data:"):
+        return None
+    data = raw[len("data:"):].strip()
+    if data == "[DONE]":
+        return STREAM_DONE
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        print("[NVIDIA API] Skipping malformed stream chunk:", data[:200])
+        return None
+    choices = chunk.get("choices") or [{}]
+    delta = choices[0].get("delta") or {}
+    if isinstance(delta.get("content"), str) and delta["content"]:
+        return "content", delta["content"]
+    if isinstance(delta.get("reasoning_content"), str) and delta["reasoning_content"]:
+        return "reasoning", delta["reasoning_content"]
+    return None
+
+
+class StreamAssembler:
+    def __init__(self, clean=clean_text):
+        """
+        Turn streamed deltas into cleaned text chunks
+
+        Reasoning-only output is held back and cleaned (with ``clean``) at the
+        end, matching the content-then-reasoning_content preference of the
+        non-streaming path.
+        """
+        self.clean = clean
+        self.cleaner = StreamingCleaner()
+        self.reasoning: List[str] = []
+        self.saw_content = False
+
+    def feed(self, kind: str, text: str) -> str:
+        if kind == "content":
+            self.saw_content = True
+            return self.cleaner.feed(text)
+        if not self.saw_content:
+            self.reasoning.append(text)
+        return ""
+
+    def finish(self) -> List[str]:
+        """Remaining chunks once the stream has ended"""
+        if self.saw_content:
+            cleaned = self.cleaner.flush()
+            return [cleaned] if cleaned else []
+        reasoning = "".join(self.reasoning).strip()
+        if reasoning:
+            return [self.clean(reasoning)]
+        return ["AI response received but content was empty."]
+
+
+class ChatCompletionsBackend:
+    # Calls go over the network: the router times them, hedges them and fails over between them
+    remote = True
+    # Answers are model output, so they may be cached and pre-warmed
+    cacheable = True
+
+    def __init__(
+        self,
+        name: str,
+        api_url: str,
+        model: str,
+        api_key: Optional[str],
+        limiter=None,
+        breaker=None,
+        max_retries: int = 5,
+        timeout: float = 25,
+        async_max_connections: int = 1000,
+    ):
+        """
+        An OpenAI-compatible chat-completions endpoint (NVIDIA Cloud by default)
+
+        Each backend has its own keep-alive pool, admission controller and
+        circuit breaker. The asyncio client and admission queue used by the
+        ASGI app are created on first async use and draw on the same token
+        bucket and breaker, so both servers share the endpoint's rate and health.
+        """
+        self.name = name
+        self.api_url = api_url
+        self.model = model
+        self.api_key = api_key
+        # Keep-alive session reused across upstream calls; requests (~40 ms to import) loads only here
+        from http_client import PooledHTTPClient
+        self.http = PooledHTTPClient()
+        # Token bucket + priority queue in front of every upstream attempt
+        self.limiter = limiter if limiter is not None else create_rate_limiter()
+        # Fails fast while the upstream keeps failing
+        self.breaker = breaker if breaker is not None else create_circuit_breaker()
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.async_max_connections = async_max_connections
+        self._async_http = None
+        self._async_limiter = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def supports(self, task: str) -> bool:
+        return True
+
+    def payload(self, call: LLMCall, stream: bool = False) -> Dict[str, Any]:
+        """Chat-completions request body"""
+        payload = {"model": self.model, "messages": call.messages, **call.params}
+        if stream:
+            payload["stream"] = True
+        payload["extra_body"] = {
+            "min_thinking_tokens": 0,
+            "max_thinking_tokens": 2000
+        }
+        return payload
+
+    def headers(self, stream: bool = False) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream" if stream else "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    def complete(self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS) -> str:
+        """Cleaned reply text; ``deadline`` is a time.monotonic() value bounding retries"""
+        response = self._post(self.payload(call), self.headers(), deadline, priority)
+        return completion_text(response)
+
+    def stream(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> Iterator[str]:
+        """Request a streamed completion and yield cleaned text as each line completes"""
+        response = self._post(self.payload(call, stream=True), self.headers(stream=True), deadline, priority, stream=True)
+        if debug_sampled():
+            print("[NVIDIA API] stream status:", response.status_code)
+        response.raise_for_status()
+
+        assembler = StreamAssembler()
+        with response:
+            response.encoding = "utf-8"
+            for raw in response.iter_lines(decode_unicode=True):
+                delta = stream_delta(raw)
+                if delta is STREAM_DONE:
+                    break
+                if delta is not None:
+                    cleaned = assembler.feed(*delta)
+                    if cleaned:
+                        yield cleaned
+        yield from assembler.finish()
+
+    def _post(
+        self,
+        json_payload: Dict[str, Any],
+        headers: Dict[str, str],
+        deadline: Optional[float],
+        priority: int,
+        stream: bool = False,
+    ) -> "requests.Response":
+        """
+        POST through the pooled client with jittered backoff, Retry-After and an optional monotonic deadline
+
+        Every attempt first waits for admission at ``priority``; AdmissionRejected
+        is raised if the queue is full or the wait would pass the deadline.
+        CircuitOpen is raised without any upstream contact while the circuit
+        breaker is open; calls that end in a connection error, timeout or a
+        retryable status count as breaker failures, but a deadline that runs
+        out before any attempt failed upstream does not.
+        """
+        import requests
+        from http_client import RETRY_STATUSES, DeadlineExceeded
+
+        self.breaker.before_call()
+        try:
+            response = self.http.post(
+                self.api_url, json_payload, headers, max_retries=self.max_retries, backoff=1.5, timeout=self.timeout,
+                deadline=deadline, stream=stream, admit=lambda: self.limiter.acquire(priority, deadline)
+            )
+        except DeadlineExceeded as e:
+            # Only an attempt that itself failed upstream says anything about upstream health
+            if isinstance(e.__cause__, (requests.ConnectionError, requests.Timeout)):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            raise
+        except (requests.ConnectionError, requests.Timeout):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Not admitted, or failed before reaching upstream: says nothing about upstream health
+            self.breaker.release()
+            raise
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _async_parts(self):
+        """(AsyncPooledHTTPClient, AsyncAdmissionController), created on first use; needs httpx"""
+        if self._async_http is None:
+            from async_http_client import AsyncPooledHTTPClient
+            from rate_limiter import AsyncAdmissionController
+
+            self._async_limiter = AsyncAdmissionController(self.limiter.bucket, max_queue=self.limiter.max_queue)
+            self._async_http = AsyncPooledHTTPClient(max_connections=self.async_max_connections)
+        return self._async_http, self._async_limiter
+
+    async def acomplete(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> str:
+        """Awaitable form of complete"""
+        response = await self._apost(self.payload(call), self.headers(), deadline, priority)
+        return completion_text(response)
+
+    async def astream(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> AsyncIterator[str]:
+        """Awaitable form of stream"""
+        response = await self._apost(
+            self.payload(call, stream=True), self.headers(stream=True), deadline, priority, stream=True
+        )
+        try:
+            if debug_sampled():
+                print("[NVIDIA API] stream status:", response.status_code)
+            response.raise_for_status()
+
+            assembler = StreamAssembler()
+            async for raw in response.aiter_lines():
+                delta = stream_delta(raw)
+                if delta is STREAM_DONE:
+                    break
+                if delta is not None:
+                    cleaned = assembler.feed(*delta)
+                    if cleaned:
+                        yield cleaned
+        finally:
+            await response.aclose()
+        for cleaned in assembler.finish():
+            yield cleaned
+
+    async def _apost(
+        self,
+        json_payload: Dict[str, Any],
+        headers: Dict[str, str],
+        deadline: Optional[float],
+        priority: int,
+        stream: bool = False,
+    ):
+        """Awaitable form of _post, with the same admission and circuit breaker rules"""
+        import httpx
+        from async_http_client import DeadlineExceeded
+        from http_client import RETRY_STATUSES
+
+        http, limiter = self._async_parts()
+        self.breaker.before_call()
+        try:
+            response = await http.post(
+                self.api_url, json_payload, headers, max_retries=self.max_retries, backoff=1.5, timeout=self.timeout,
+                deadline=deadline, stream=stream, admit=lambda: limiter.acquire(priority, deadline)
+            )
+        except DeadlineExceeded as e:
+            if isinstance(e.__cause__, httpx.TransportError):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            raise
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def aclose(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "upstream": self.http.stats(),
+            "admission": self.limiter.stats(),
+            "circuit": self.breaker.stats(),
+        }
+        if self._async_http is not None:
+            stats["async_upstream"] = self._async_http.stats()
+            stats["async_admission"] = self._async_limiter.stats()
+        return stats
@@ -0,0 +1,523 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from circuit_breaker import OPEN, CircuitOpen
+from llm_backends import (
+    DEFAULT_API_URL, MODEL_NAME, TASK_CHAT, TASK_RECOMMENDATIONS, TASK_RECOVERY, TASK_SUMMARY,
+    ChatCompletionsBackend, LLMCall
+)
+from metrics import metrics
+from rate_limiter import PRIORITY_RECOMMENDATIONS, AdmissionRejected
+
+# Per-call choice of completion backend: task routes, health, latency hedging and a local fallback
+
+# Seconds of call outcomes that count towards a backend's error rate
+ERROR_WINDOW_SECONDS = 60.0
+
+# Successful calls whose latency is kept per (backend, task)
+LATENCY_WINDOW = 200
+
+metrics.describe("bjj_backend_call_seconds", "Latency of successful completion calls by backend and task")
+
+
+class NoBackendAvailable(Exception):
+    """Raised when no backend is configured for a task and there is no fallback"""
+
+
+class Completion(NamedTuple):
+    """A reply and where it came from; only cacheable replies may be stored"""
+    text: str
+    backend: str
+    cacheable: bool
+
+
+class BackendHealth:
+    def __init__(self):
+        """Recent outcomes and latencies of one backend for one task"""
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes: deque = deque()
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, seconds: Optional[float] = None):
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self.outcomes.append((now, ok))
+            if ok and seconds is not None:
+                self.latencies.append(seconds)
+
+    def error_rate(self, min_samples: int) -> float:
+        """Share of failed calls in the last ERROR_WINDOW_SECONDS (0 until ``min_samples`` calls were seen)"""
+        cutoff = time.monotonic() - ERROR_WINDOW_SECONDS
+        with self._lock:
+            while self.outcomes and self.outcomes[0][0] < cutoff:
+                self.outcomes.popleft()
+            if len(self.outcomes) < min_samples:
+                return 0.0
+            return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+    def percentile(self, pct: float, min_samples: int) -> Optional[float]:
+        """Latency percentile of recent successful calls; None with fewer than ``min_samples``"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies or len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(pct / 100 * (len(latencies) - 1))))]
+
+    def snapshot(self, min_samples: int) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.error_rate(min_samples),
+            "p50_seconds": self.percentile(50, 1),
+            "p95_seconds": self.percentile(95, 1),
+        }
+
+
+class BackendRouter:
+    def __init__(
+        self,
+        backends: List[Any],
+        routes: Optional[Dict[str, List[str]]] = None,
+        fallback=None,
+        hedge_percentile: float = 95.0,
+        min_samples: int = 10,
+        max_error_rate: float = 0.5,
+        slow_factor: float = 2.0,
+        hedge_workers: int = 32,
+    ):
+        """
+        Pick a completion backend per call and fail over between them
+
+        Candidates for a task are the backends named in ``routes[task]`` (all
+        backends when the task has no route) that are configured and support
+        the task, in route order, except that backends whose circuit is open or
+        whose recent error rate exceeds ``max_error_rate`` go last, and healthy
+        ones slower at p50 than ``slow_factor`` times the fastest go after the
+        rest. A failed call moves on to the next candidate, then to
+        ``fallback``; admission rejections and open circuits fail over but do
+        not count as errors.
+
+        Once a remote backend has ``min_samples`` latencies for the task, a
+        complete() call still running at its ``hedge_percentile`` latency is
+        hedged: the same call goes to the next candidate and whichever answers
+        first wins. Streams are never hedged; they fail over only before their
+        first chunk.
+        """
+        self.backends = list(backends)
+        self.routes = routes or {}
+        self.fallback = fallback
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.slow_factor = slow_factor
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.fallbacks = 0
+        self._health: Dict[Tuple[str, str], BackendHealth] = {}
+        # Runs both sides of hedged calls; unhedged calls stay on the caller's thread
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="bjj-hedge")
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        """First remote backend; its model names cache keys and its stats back the legacy upstream metrics"""
+        return next((backend for backend in self.backends if backend.remote), None)
+
+    @property
+    def model_name(self) -> str:
+        primary = self.primary
+        return primary.model if primary is not None else MODEL_NAME
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def health(self, backend, task: str) -> BackendHealth:
+        key = (backend.name, task)
+        health = self._health.get(key)
+        if health is None:
+            with self._lock:
+                health = self._health.setdefault(key, BackendHealth())
+        return health
+
+    def _healthy(self, backend, task: str) -> bool:
+        breaker = getattr(backend, "breaker", None)
+        if breaker is not None and breaker.state == OPEN:
+            return False
+        return self.health(backend, task).error_rate(self.min_samples) <= self.max_error_rate
+
+    def candidates(self, task: str) -> List[Any]:
+        """Configured backends for ``task`` in the order they will be tried (the fallback excluded)"""
+        names = self.routes.get(task)
+        routed = [b for b in self.backends if b.name in names] if names else self.backends
+        if names:
+            routed.sort(key=lambda b: names.index(b.name))
+        usable = [b for b in routed if b.configured and b.supports(task)]
+        healthy = {b.name: self._healthy(b, task) for b in usable}
+        p50 = {b.name: self.health(b, task).percentile(50, self.min_samples) for b in usable}
+        observed = [p50[b.name] for b in usable if healthy[b.name] and p50[b.name] is not None]
+        fastest = min(observed) if observed else None
+
+        def slow(backend) -> bool:
+            latency = p50[backend.name]
+            return fastest is not None and latency is not None and latency > self.slow_factor * fastest
+
+        return sorted(usable, key=lambda b: (not healthy[b.name], slow(b)))
+
+    def configured(self, task: str) -> bool:
+        """A backend whose answers may be cached is configured for ``task``"""
+        return any(backend.cacheable for backend in self.candidates(task))
+
+    def available(self, task: str) -> bool:
+        """Some backend, the fallback included, can answer ``task``"""
+        return bool(self.candidates(task)) or (self.fallback is not None and self.fallback.supports(task))
+
+    def _hedge_delay(self, backend, task: str) -> Optional[float]:
+        if self.hedge_percentile <= 0 or not backend.remote:
+            return None
+        return self.health(backend, task).percentile(self.hedge_percentile, self.min_samples)
+
+    def _record_failure(self, backend, task: str, error: BaseException):
+        # Not admitted or short-circuited: the call never reached the backend
+        if not isinstance(error, (AdmissionRejected, CircuitOpen)):
+            self.health(backend, task).record(False)
+
+    def _record_success(self, backend, task: str, started: float):
+        elapsed = time.perf_counter() - started
+        self.health(backend, task).record(True, elapsed)
+        metrics.observe("bjj_backend_call_seconds", elapsed, backend=backend.name, task=task)
+
+    def _fallback_for(self, call: LLMCall, error: Optional[BaseException], tried: List[Any]):
+        """The fallback backend, or raise ``error`` when there is none to use"""
+        if self.fallback is None or self.fallback in tried or not self.fallback.supports(call.task):
+            if error is None:
+                raise NoBackendAvailable(f"No backend configured for {call.task}")
+            raise error
+        if error is not None:
+            print(f"Answering {call.task} from the {self.fallback.name} backend after: {error}")
+        self._count("fallbacks")
+        return self.fallback
+
+    def _failed_over(self, backend, call: LLMCall, error: BaseException):
+        self._count("failovers")
+        print(f"Backend {backend.name} failed for {call.task}, trying the next one: {error}")
+
+    def _call(self, backend, call: LLMCall, deadline: Optional[float], priority: int) -> Completion:
+        started = time.perf_counter()
+        try:
+            text = backend.complete(call, deadline, priority)
+        except Exception as e:
+            self._record_failure(backend, call.task, e)
+            raise
+        self._record_success(backend, call.task, started)
+        return Completion(text, backend.name, backend.cacheable)
+
+    def complete(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> Completion:
+        """Answer ``call`` from the best candidate, failing over and hedging as described above"""
+        candidates = self.candidates(call.task)
+        tried: List[Any] = []
+        error: Optional[BaseException] = None
+        while candidates:
+            backend = candidates.pop(0)
+            tried.append(backend)
+            try:
+                delay = self._hedge_delay(backend, call.task) if candidates else None
+                if delay is not None:
+                    return self._hedged(backend, candidates, tried, delay, call, deadline, priority)
+                return self._call(backend, call, deadline, priority)
+            except Exception as e:
+                error = e
+                if candidates:
+                    self._failed_over(backend, call, e)
+        return self._call(self._fallback_for(call, error, tried), call, deadline, priority)
+
+    def _hedged(
+        self, backend, candidates: List[Any], tried: List[Any], delay: float, call: LLMCall,
+        deadline: Optional[float], priority: int,
+    ) -> Completion:
+        """Run ``call`` on ``backend``; past ``delay`` seconds, also on the next candidate and take the first answer"""
+        first = self._executor.submit(self._call, backend, call, deadline, priority)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        hedge_backend = candidates.pop(0)
+        tried.append(hedge_backend)
+        self._count("hedges")
+        hedge = self._executor.submit(self._call, hedge_backend, call, deadline, priority)
+        pending = {first, hedge}
+        error: Optional[BaseException] = None
+        # The slower call keeps running to completion; its outcome still feeds the health stats
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stream(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> Iterator[Completion]:
+        """Streamed reply chunks; fails over only while no chunk has been yielded"""
+        tried: List[Any] = []
+        error: Optional[BaseException] = None
+        candidates = self.candidates(call.task)
+        while True:
+            if candidates:
+                backend = candidates.pop(0)
+            else:
+                backend = self._fallback_for(call, error, tried)
+            tried.append(backend)
+            chunks = backend.stream(call, deadline, priority)
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                self._record_failure(backend, call.task, e)
+                error = e
+                if candidates:
+                    self._failed_over(backend, call, e)
+                continue
+
+            try:
+                if first is not None:
+                    yield Completion(first, backend.name, backend.cacheable)
+                for chunk in chunks:
+                    yield Completion(chunk, backend.name, backend.cacheable)
+            except Exception as e:
+                self._record_failure(backend, call.task, e)
+                raise
+            finally:
+                chunks.close()
+            # Stream latency depends on the reply length, so only the outcome is recorded
+            self.health(backend, call.task).record(True)
+            return
+
+    async def _acall(self, backend, call: LLMCall, deadline: Optional[float], priority: int) -> Completion:
+        started = time.perf_counter()
+        try:
+            text = await backend.acomplete(call, deadline, priority)
+        except Exception as e:
+            self._record_failure(backend, call.task, e)
+            raise
+        self._record_success(backend, call.task, started)
+        return Completion(text, backend.name, backend.cacheable)
+
+    async def acomplete(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> Completion:
+        """Awaitable form of complete; a hedge's losing call is cancelled"""
+        candidates = self.candidates(call.task)
+        tried: List[Any] = []
+        error: Optional[BaseException] = None
+        while candidates:
+            backend = candidates.pop(0)
+            tried.append(backend)
+            try:
+                delay = self._hedge_delay(backend, call.task) if candidates else None
+                if delay is not None:
+                    return await self._ahedged(backend, candidates, tried, delay, call, deadline, priority)
+                return await self._acall(backend, call, deadline, priority)
+            except Exception as e:
+                error = e
+                if candidates:
+                    self._failed_over(backend, call, e)
+        return await self._acall(self._fallback_for(call, error, tried), call, deadline, priority)
+
+    async def _ahedged(
+        self, backend, candidates: List[Any], tried: List[Any], delay: float, call: LLMCall,
+        deadline: Optional[float], priority: int,
+    ) -> Completion:
+        # Imported here so the WSGI app never loads asyncio
+        import asyncio
+
+        tasks = [asyncio.ensure_future(self._acall(backend, call, deadline, priority))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+
+            hedge_backend = candidates.pop(0)
+            tried.append(hedge_backend)
+            self._count("hedges")
+            tasks.append(asyncio.ensure_future(self._acall(hedge_backend, call, deadline, priority)))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def astream(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> AsyncIterator[Completion]:
+        """Awaitable form of stream"""
+        tried: List[Any] = []
+        error: Optional[BaseException] = None
+        candidates = self.candidates(call.task)
+        while True:
+            if candidates:
+                backend = candidates.pop(0)
+            else:
+                backend = self._fallback_for(call, error, tried)
+            tried.append(backend)
+            chunks = backend.astream(call, deadline, priority)
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                self._record_failure(backend, call.task, e)
+                error = e
+                if candidates:
+                    self._failed_over(backend, call, e)
+                continue
+
+            try:
+                if first is not None:
+                    yield Completion(first, backend.name, backend.cacheable)
+                async for chunk in chunks:
+                    yield Completion(chunk, backend.name, backend.cacheable)
+            except Exception as e:
+                self._record_failure(backend, call.task, e)
+                raise
+            finally:
+                await chunks.aclose()
+            self.health(backend, call.task).record(True)
+            return
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        backends = {}
+        everyone = self.backends + ([self.fallback] if self.fallback is not None and self.fallback not in self.backends else [])
+        for backend in everyone:
+            entry = dict(backend.stats())
+            entry["tasks"] = {
+                task: health.snapshot(self.min_samples)
+                for (name, task), health in list(self._health.items()) if name == backend.name
+            }
+            backends[backend.name] = entry
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "fallbacks": self.fallbacks,
+            "backends": backends,
+        }
+
+
+def create_backend(name: str, api_url: Optional[str] = None, limiter=None, knowledge_base=None, **options):
+    """
+    One backend by name: "local" is the template backend, "nvidia" the NVIDIA
+    Cloud endpoint, and any other name an OpenAI-compatible endpoint read from
+    BJJ_LLM_<NAME>_URL, BJJ_LLM_<NAME>_MODEL and BJJ_LLM_<NAME>_API_KEY
+    """
+    if name == "local":
+        from template_backend import LocalTemplateBackend
+        return LocalTemplateBackend(knowledge_base)
+
+    prefix = f"BJJ_LLM_{name.upper()}_"
+    if name == "nvidia":
+        url = api_url or os.getenv("NVIDIA_API_URL", DEFAULT_API_URL)
+        model = os.getenv(prefix + "MODEL", MODEL_NAME)
+        api_key = os.getenv("NVIDIA_API_KEY")
+        bucket = "upstream"
+    else:
+        url = api_url or os.getenv(prefix + "URL")
+        model = os.getenv(prefix + "MODEL")
+        api_key = os.getenv(prefix + "API_KEY")
+        bucket = f"upstream_{name}"
+        if not url or not model:
+            print(f"Skipping LLM backend {name}: set {prefix}URL and {prefix}MODEL")
+            return None
+    from rate_limiter import create_rate_limiter
+    return ChatCompletionsBackend(
+        name, url, model, api_key, limiter=limiter if limiter is not None else create_rate_limiter(bucket), **options
+    )
+
+
+def backend_names(value: Optional[str]) -> List[str]:
+    return [name.strip().lower() for name in (value or "").split(",") if name.strip()]
+
+
+def create_router(
+    api_url: Optional[str] = None, limiter=None, knowledge_base=None, fallback: Optional[str] = None
+) -> BackendRouter:
+    """
+    Build the backend router from environment settings
+
+    BJJ_LLM_BACKENDS: backends in preference order (default: nvidia; "local" is the template backend)
+    BJJ_LLM_CHAT_BACKENDS: route for chat turns and summaries (default: BJJ_LLM_BACKENDS order)
+    BJJ_LLM_REPORT_BACKENDS: route for recommendation and recovery reports (default: BJJ_LLM_BACKENDS order)
+    BJJ_LLM_FALLBACK: backend answering when every routed backend failed (default: none; "local" opts in to templates)
+    BJJ_LLM_HEDGE_PERCENTILE: latency percentile after which a call is hedged (default: 95; 0 disables)
+    BJJ_LLM_MAX_ERROR_RATE: error rate above which a backend is tried last (default: 0.5)
+    BJJ_ASYNC_MAX_CONNECTIONS: upstream connections per backend for the ASGI app (default: 1000)
+
+    ``api_url`` and ``limiter`` apply to the first remote backend, ``knowledge_base``
+    (a callable returning the current KnowledgeBase) to the template backend, and
+    ``fallback`` overrides BJJ_LLM_FALLBACK.
+    """
+    order = backend_names(os.getenv("BJJ_LLM_BACKENDS", "nvidia"))
+    routes = {}
+    for tasks, variable in (((TASK_CHAT, TASK_SUMMARY), "BJJ_LLM_CHAT_BACKENDS"),
+                            ((TASK_RECOMMENDATIONS, TASK_RECOVERY), "BJJ_LLM_REPORT_BACKENDS")):
+        names = backend_names(os.getenv(variable))
+        for task in tasks:
+            if names:
+                routes[task] = names
+        order += [name for name in names if name not in order]
+
+    # Opt-in: by default users see "not configured" or a degraded reply rather than templated advice
+    fallback_name = (fallback or os.getenv("BJJ_LLM_FALLBACK", "none")).lower()
+    options = {"async_max_connections": int(os.getenv("BJJ_ASYNC_MAX_CONNECTIONS", "1000"))}
+    backends = []
+    for name in order:
+        first_remote = name != "local" and not any(b.remote for b in backends)
+        backend = create_backend(
+            name, api_url if first_remote else None, limiter if first_remote else None, knowledge_base,
+            **({} if name == "local" else options)
+        )
+        if backend is not None:
+            backends.append(backend)
+
+    fallback_backend = None
+    if fallback_name != "none":
+        fallback_backend = next((b for b in backends if b.name == fallback_name), None)
+        if fallback_backend is None:
+            fallback_backend = create_backend(fallback_name, knowledge_base=knowledge_base, **(
+                {} if fallback_name == "local" else options
+            ))
+    return BackendRouter(
+        backends,
+        routes=routes,
+        fallback=fallback_backend,
+        hedge_percentile=float(os.getenv("BJJ_LLM_HEDGE_PERCENTILE", "95")),
+        max_error_rate=float(os.getenv("BJJ_LLM_MAX_ERROR_RATE", "0.5")),
+    )
@@ -0,0 +1,194 @@
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# In-process counters, latency histograms and timing spans, rendered in Prometheus text format
+
+# Bucket upper bounds (seconds): sub-millisecond filter spans up to minute-long upstream calls
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Characters not allowed in a Prometheus metric name
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Per-bucket (non-cumulative) counts; the last slot is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Thread-safe metric store
+
+        Counters and histograms are created on first use; ``collect`` adds
+        callbacks whose numeric stats (e.g. the existing ``stats()`` dicts) are
+        read at scrape time instead of being tracked twice.
+        """
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Tuple[str, Callable[[], Dict], Optional[str]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time a block into the bjj_span_seconds histogram under ``span=name``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("bjj_span_seconds", time.perf_counter() - start, span=name)
+
+    def collect(self, prefix: str, fn: Callable[[], Dict], label: Optional[str] = None):
+        """
+        Expose the numeric entries of ``fn()`` (nested dicts flattened with "_") as gauges
+
+        With ``label``, ``fn()`` maps label values (e.g. backend names from
+        configuration) to stats dicts, and the value becomes that label instead
+        of part of the metric name.
+        """
+        self._collectors.append((prefix, fn, label))
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(_label_key(labels))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        for name in sorted(counters):
+            self._header(lines, name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            self._header(lines, name, "histogram")
+            for key, (counts, total, count, buckets) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {repr(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        gauges: Dict[str, List[Tuple[LabelKey, float]]] = {}
+        for prefix, fn, label in self._collectors:
+            try:
+                stats = fn()
+                groups = stats.items() if label else [(None, stats)]
+                values = [
+                    (name, ((label, str(group)),) if label else (), value)
+                    for group, group_stats in groups for name, value in _flatten(prefix, group_stats)
+                ]
+            except Exception as e:
+                print(f"Metrics collector {prefix} failed: {e}")
+                continue
+            for name, key, value in values:
+                gauges.setdefault(name, []).append((key, value))
+        # One TYPE line per name, however many collectors or label values report it
+        for name, series in gauges.items():
+            self._header(lines, name, "gauge")
+            for key, value in series:
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, kind: str):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _flatten(prefix: str, values: Dict) -> List[Tuple[str, float]]:
+    flat = []
+    for key, value in values.items():
+        name = _INVALID_NAME_CHARS.sub("_", f"{prefix}_{key}")
+        if isinstance(value, dict):
+            flat.extend(_flatten(name, value))
+        elif isinstance(value, bool):
+            flat.append((name, int(value)))
+        elif isinstance(value, (int, float)):
+            flat.append((name, value))
+    return flat
+
+
+# Process-wide registry shared by the advisor, HTTP client and Flask routes
+metrics = MetricsRegistry()
+metrics.describe("bjj_span_seconds", "Time spent in each hot-path stage")
+metrics.describe("bjj_upstream_attempt_seconds", "Latency of each upstream HTTP attempt, retries included")
+metrics.describe("bjj_http_request_seconds", "Flask request latency by route")
+metrics.describe("bjj_http_requests_total", "Flask requests by route and status")
+metrics.describe("bjj_cache_lookups_total", "AI cache lookups by result")
+
+# Fraction of upstream responses whose status and body preview are printed (off unless set)
+DEBUG_SAMPLE_RATE = float(os.getenv("BJJ_DEBUG_UPSTREAM_SAMPLE", "0"))
+
+
+def debug_sampled() -> bool:
+    """Whether this upstream response should be logged in full"""
+    return DEBUG_SAMPLE_RATE > 0 and random.random() < DEBUG_SAMPLE_RATE
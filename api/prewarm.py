@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai_cache import MemoryCache
+from ai_service import PROMPT_TEMPLATE_VERSION, BJJAIAdvisor
+from injury_canonical import InjuryCanonicalizer, display_name
+from llm_backends import TASK_RECOMMENDATIONS
+from llm_router import create_router
+from rate_limiter import PRIORITY_BACKGROUND, AdmissionController, TokenBucket
+from technique_index import TechniqueIndex
+
+# Offline pre-warming of AI answers over the knowledge-base injury vocabulary
+#
+#   python api/prewarm.py --output api/prewarm_cache.json
+#
+# Progress is appended to a checkpoint file as each answer lands, so an
+# interrupted run picks up where it stopped when started again.
+
+# 2: cache keys include the knowledge-base version
+ARTIFACT_FORMAT_VERSION = 2
+
+KINDS = ("rec", "recov")
+
+
+def knowledge_base_hash(path: str) -> str:
+    """Answers depend on the safe/unsafe move lists, so artifacts are tied to the knowledge base content"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def artifact_meta(model_name: str, kb_hash: str) -> Dict[str, Any]:
+    return {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model": model_name,
+        "prompt_version": PROMPT_TEMPLATE_VERSION,
+        "knowledge_base": kb_hash,
+    }
+
+
+def enumerate_profiles(db: List[Dict], canonicalizer: InjuryCanonicalizer, max_pairs: int = 200) -> List[Tuple[str, ...]]:
+    """
+    Injury profiles worth pre-generating, as sorted tuples of canonical terms
+
+    Every tag and body-region group on its own, then pairs: tags that are
+    unsafe for the same techniques (most shared techniques first) followed by
+    pairs of body regions, up to ``max_pairs``.
+    """
+    singles = sorted(canonicalizer.vocabulary | set(canonicalizer.groups))
+    co_occurring = Counter(
+        pair for move in db for pair in itertools.combinations(sorted(set(move.get("unsafe_for", []))), 2)
+    )
+    pairs = [pair for pair, _ in sorted(co_occurring.items(), key=lambda item: (-item[1], item[0]))]
+    pairs += list(itertools.combinations(sorted(canonicalizer.groups), 2))
+    profiles = [(term,) for term in singles] + list(dict.fromkeys(pairs))[:max_pairs]
+    return profiles
+
+
+def load_checkpoint(path: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Entries from a previous run; a checkpoint written for another model/prompt/knowledge base is ignored"""
+    if not os.path.exists(path):
+        return {}
+    entries = {}
+    with open(path, "r") as f:
+        lines = f.read().splitlines()
+    if not lines or json.loads(lines[0]) != meta:
+        print(f"Checkpoint {path} does not match the current model, prompt or knowledge base; starting over")
+        return {}
+    for line in lines[1:]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # A run killed mid-write leaves at most one partial line
+            continue
+        entries[record["key"]] = record["value"]
+    return entries
+
+
+def write_artifact(path: str, meta: Dict[str, Any], entries: Dict[str, Any]):
+    """Write the artifact atomically so a running API never reads a half-written file"""
+    artifact = dict(meta, created=time.time(), entries=entries)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(artifact, f)
+    os.replace(tmp_path, path)
+
+
+def load_artifact(path: str, model_name: str, kb_hash: str) -> Dict[str, Any]:
+    """Cache entries from a pre-warm artifact, or {} if it is missing or stale"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read pre-warm artifact {path}: {e}")
+        return {}
+    meta = artifact_meta(model_name, kb_hash)
+    if any(artifact.get(name) != value for name, value in meta.items()):
+        print(f"Ignoring stale pre-warm artifact {path} (model, prompt or knowledge base changed)")
+        return {}
+    entries = artifact.get("entries", {})
+    print(f"Loaded {len(entries)} pre-warmed AI answers from {path}")
+    return entries
+
+
+def run_prewarm(
+    advisor: BJJAIAdvisor,
+    index: TechniqueIndex,
+    canonicalizer: InjuryCanonicalizer,
+    profiles: List[Tuple[str, ...]],
+    checkpoint_path: str,
+    meta: Dict[str, Any],
+    concurrency: int = 4,
+) -> Dict[str, Any]:
+    """
+    Generate every missing (profile, kind) answer and return all entries
+
+    Profiles are sent to the advisor exactly as /api/recommendations sends
+    them (display names of the canonical terms), so the cache keys match.
+    Calls run at background priority with no deadline, so they queue behind
+    live traffic on the advisor's rate limiter.
+    """
+    entries = load_checkpoint(checkpoint_path, meta)
+    if entries:
+        print(f"Resuming from checkpoint with {len(entries)} answers")
+
+    jobs = []
+    for terms in profiles:
+        injuries = [display_name(t) for t in terms]
+        for kind in KINDS:
+            key = advisor._cache_key(kind, injuries)
+            if key not in entries:
+                jobs.append((kind, key, injuries, terms))
+    print(f"{len(profiles)} profiles, {len(jobs)} answers to generate")
+
+    fresh = not os.path.exists(checkpoint_path) or not entries
+    checkpoint = open(checkpoint_path, "w" if fresh else "a")
+    if fresh:
+        checkpoint.write(json.dumps(meta) + "\n")
+        checkpoint.flush()
+
+    def generate(kind: str, key: str, injuries: List[str], terms: Tuple[str, ...]) -> Optional[Any]:
+        if kind == "rec":
+            safe_moves, unsafe_moves = index.partition(canonicalizer.expand(terms))
+            advisor.get_ai_recommendations(injuries, safe_moves, unsafe_moves, priority=PRIORITY_BACKGROUND)
+        else:
+            advisor.get_recovery_advice(injuries, priority=PRIORITY_BACKGROUND)
+        # Failed calls return fallback text without caching it, so only cached answers are kept
+        return advisor.cache.get(key)
+
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(generate, *job): job for job in jobs}
+            for done, future in enumerate(as_completed(futures), 1):
+                kind, key, injuries, _ = futures[future]
+                value = future.result()
+                if value is None:
+                    failed += 1
+                    print(f"[{done}/{len(jobs)}] {kind} {injuries}: failed, will retry on the next run")
+                    continue
+                entries[key] = value
+                checkpoint.write(json.dumps({"key": key, "value": value}) + "\n")
+                checkpoint.flush()
+                print(f"[{done}/{len(jobs)}] {kind} {injuries}")
+    finally:
+        checkpoint.close()
+
+    if failed:
+        print(f"{failed} answers failed; re-run to resume from the checkpoint")
+    return entries
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Pre-generate AI answers for common injury profiles")
+    parser.add_argument("--kb", default=os.path.join(current_dir, "bjj_moves.json"), help="knowledge base JSON")
+    parser.add_argument("--output", default=os.path.join(current_dir, "prewarm_cache.json"), help="artifact path")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint path (default: <output>.checkpoint.jsonl)")
+    parser.add_argument("--max-pairs", type=int, default=200, help="number of two-injury profiles")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel upstream calls")
+    parser.add_argument(
+        "--rate", type=float, default=None,
+        help="upstream calls per second (default: the shared BJJ_UPSTREAM_* limiter settings)"
+    )
+    args = parser.parse_args(argv)
+    from similarity_index import TechniqueSimilarityIndex
+
+    with open(args.kb, "r") as f:
+        db = json.load(f)
+    # A private cache keeps every answer for the artifact instead of the API's eviction policy
+    limiter = AdmissionController(TokenBucket(args.rate, burst=1)) if args.rate else None
+    # Same prompt context and cache keys as the API, so the pre-generated answers match what it would ask for
+    kb_hash = knowledge_base_hash(args.kb)
+    # Only model answers are worth keeping, so there is no template fallback
+    advisor = BJJAIAdvisor(
+        cache=MemoryCache(max_entries=100000, ttl=None), similarity=TechniqueSimilarityIndex(db),
+        knowledge_version=lambda: kb_hash, router=create_router(limiter=limiter, fallback="none"),
+    )
+    if not advisor.configured(TASK_RECOMMENDATIONS):
+        print("NVIDIA_API_KEY is not set; nothing to pre-warm")
+        return 1
+
+    canonicalizer = InjuryCanonicalizer(db)
+    profiles = enumerate_profiles(db, canonicalizer, args.max_pairs)
+    meta = artifact_meta(advisor.model_name, kb_hash)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint.jsonl"
+
+    entries = run_prewarm(
+        advisor, TechniqueIndex(db), canonicalizer, profiles, checkpoint_path, meta, args.concurrency
+    )
+    write_artifact(args.output, meta, entries)
+    print(f"Wrote {len(entries)} answers to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Admission control for upstream LLM calls: a token bucket behind a bounded priority queue
+
+# Lower value = served first
+PRIORITY_CHAT = 0
+PRIORITY_RECOMMENDATIONS = 1
+PRIORITY_BACKGROUND = 2  # pre-warm jobs and chat summaries
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing when the queue is full or the wait would outlast the caller's deadline"""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        """In-process token bucket refilling ``rate`` tokens per second up to ``burst``"""
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Take one token and return 0, or return the seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def time_until(self, count: int) -> float:
+        """Seconds until ``count`` tokens will have accumulated, ignoring other consumers"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (count - self._tokens) / self.rate)
+
+
+class SQLiteTokenBucket:
+    def __init__(self, path: str, rate: float, burst: float, name: str = "upstream"):
+        """
+        Token bucket whose state lives in a SQLite row, shared by every worker process
+
+        Each acquire is one short write transaction, so the upstream rate limit
+        holds for the whole host rather than per process. Wall-clock time is
+        used because monotonic clocks are not comparable across processes.
+        """
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.name = name
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, burst, time.time())
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread, reopened after fork"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _update(self, take: bool) -> float:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, updated = conn.execute(
+                "SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            taken = take and tokens >= 1
+            if taken:
+                tokens -= 1
+            conn.execute("UPDATE token_buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return -1.0 if taken else tokens
+
+    def try_acquire(self) -> float:
+        tokens = self._update(take=True)
+        return 0.0 if tokens < 0 else (1 - tokens) / self.rate
+
+    def time_until(self, count: int) -> float:
+        return max(0.0, (count - self._update(take=False)) / self.rate)
+
+
+class AdmissionController:
+    def __init__(self, bucket, max_queue: int = 64):
+        """
+        Gate every upstream attempt on a token bucket, serving waiters by priority
+
+        Callers queue in (priority, arrival) order and only the head of the
+        queue takes tokens, so interactive chat overtakes recommendation calls,
+        which overtake background work. A caller is rejected up front when the
+        queue already holds ``max_queue`` waiters or when the estimated wait
+        for its turn would pass its deadline; it is also dropped if the
+        deadline passes while waiting.
+        """
+        self.bucket = bucket
+        self.max_queue = max_queue
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.total_wait = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority: int = PRIORITY_RECOMMENDATIONS, deadline: Optional[float] = None):
+        """Block until the call may go upstream; ``deadline`` is a time.monotonic() value"""
+        started = time.monotonic()
+        with self._cond:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected("Upstream queue is full")
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiters[0] == entry:
+                        wait_seconds = self.bucket.try_acquire()
+                        if wait_seconds == 0:
+                            heapq.heappop(self._waiters)
+                            self.admitted += 1
+                            self.total_wait += now - started
+                            self._cond.notify_all()
+                            return
+                    else:
+                        ahead = sum(1 for waiter in self._waiters if waiter < entry)
+                        wait_seconds = self.bucket.time_until(ahead + 1)
+                    if deadline is not None and now + wait_seconds > deadline:
+                        self.rejected_deadline += 1
+                        raise AdmissionRejected("Upstream queue wait would exceed the deadline")
+                    # The head polls the bucket (other processes may share it); the rest wake when it moves
+                    if self._waiters[0] == entry:
+                        timeout = wait_seconds
+                    else:
+                        timeout = None if deadline is None else max(0.0, deadline - now)
+                    self._cond.wait(timeout=timeout)
+            except BaseException:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+
+    def _queue_length(self) -> int:
+        with self._cond:
+            return len(self._waiters)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_per_second": self.bucket.rate,
+            "burst": self.bucket.burst,
+            "queued": self._queue_length(),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_deadline": self.rejected_deadline,
+            "avg_wait_seconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+        }
+
+
+class AsyncAdmissionController(AdmissionController):
+    def __init__(self, bucket, max_queue: int = 64):
+        """
+        asyncio form of AdmissionController: waiters await their turn instead of blocking a thread
+
+        Same priority order, queue bound and deadline rejections. Passing the
+        sync controller's ``bucket`` makes both share one upstream rate. Must be
+        used from a single event loop.
+        """
+        # asyncio is imported on use so the WSGI app's cold start does not pay for it
+        import asyncio
+
+        super().__init__(bucket, max_queue)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, priority: int = PRIORITY_RECOMMENDATIONS, deadline: Optional[float] = None):
+        """Wait until the call may go upstream; ``deadline`` is a time.monotonic() value"""
+        import asyncio
+
+        started = time.monotonic()
+        async with self._cond:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected("Upstream queue is full")
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiters[0] == entry:
+                        wait_seconds = self.bucket.try_acquire()
+                        if wait_seconds == 0:
+                            heapq.heappop(self._waiters)
+                            self.admitted += 1
+                            self.total_wait += now - started
+                            self._cond.notify_all()
+                            return
+                    else:
+                        ahead = sum(1 for waiter in self._waiters if waiter < entry)
+                        wait_seconds = self.bucket.time_until(ahead + 1)
+                    if deadline is not None and now + wait_seconds > deadline:
+                        self.rejected_deadline += 1
+                        raise AdmissionRejected("Upstream queue wait would exceed the deadline")
+                    if self._waiters[0] == entry:
+                        timeout = wait_seconds
+                    else:
+                        timeout = None if deadline is None else max(0.0, deadline - now)
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+
+    def _queue_length(self) -> int:
+        # Read from scrape threads; len() of the list needs no lock
+        return len(self._waiters)
+
+
+def create_token_bucket(name: str = "upstream"):
+    """Token bucket for upstream calls from environment settings (see create_rate_limiter)"""
+    rate = float(os.getenv("BJJ_UPSTREAM_RPM", "40")) / 60.0
+    burst = float(os.getenv("BJJ_UPSTREAM_BURST", "5"))
+    if os.getenv("BJJ_LIMITER_BACKEND", "memory").lower() == "sqlite":
+        return SQLiteTokenBucket(os.getenv("BJJ_LIMITER_PATH", "/tmp/bjj_rate_limit.sqlite3"), rate, burst, name=name)
+    return TokenBucket(rate, burst)
+
+
+def create_rate_limiter(name: str = "upstream") -> AdmissionController:
+    """
+    Build the upstream admission controller from environment settings
+
+    ``name`` keys the shared SQLite bucket, so each upstream backend gets its own rate.
+
+    BJJ_UPSTREAM_RPM: upstream requests per minute (default: 40)
+    BJJ_UPSTREAM_BURST: requests allowed back to back after an idle period (default: 5)
+    BJJ_UPSTREAM_QUEUE: max callers waiting for a slot (default: 64)
+    BJJ_LIMITER_BACKEND: "memory" (default, per process) or "sqlite" (shared by all workers)
+    BJJ_LIMITER_PATH: SQLite file path (default: /tmp/bjj_rate_limit.sqlite3)
+    """
+    return AdmissionController(create_token_bucket(name), max_queue=int(os.getenv("BJJ_UPSTREAM_QUEUE", "64")))
@@ -0,0 +1,138 @@
+import re
+from typing import Callable, Dict, List, Optional
+
+# Compiled filter that strips internal reasoning from model responses
+
+# Lines starting with one of these (case-sensitive) are candidates for removal
+_PREFIX = re.compile(r"The user asks|We can do:|Let me|Let's|I need to|I'll|I should|First,|Okay,|Now,|\*\*")
+
+# What the lowercased line must also contain for each prefix to be dropped (None: always dropped).
+# Plain substring tests beat regex alternation in CPython, so the conditions stay as small functions.
+_PREFIX_CONDITIONS: Dict[str, Optional[Callable[[str], bool]]] = {
+    "The user asks": None,
+    "We can do:": None,
+    "Let me": lambda lower: "think" in lower or "analyze" in lower,
+    "Let's": lambda lower: "produce" in lower,
+    "I need to": lambda lower: "recall" in lower or "consider" in lower,
+    "I'll": lambda lower: "think" in lower or "analyze" in lower,
+    "I should": lambda lower: "think" in lower or "consider" in lower,
+    "First,": lambda lower: "need to" in lower,
+    "Okay,": lambda lower: "tackle" in lower,
+    "Now,": lambda lower: "let me" in lower,
+    "**": lambda lower: (
+        "final answer" in lower or "thinking" in lower or "analysis" in lower
+        or ("response" in lower and "planning" in lower)
+    ),
+}
+_PREFIXES = tuple(_PREFIX_CONDITIONS)
+
+# Reasoning markers that drop a line wherever they appear in it (matched on lowercase text)
+_ANYWHERE = re.compile(r"let me think|let me analyze|internal.*reasoning|reasoning.*internal")
+
+# Leftover markers are removed, then filler phrases rewritten, in the legacy order
+_MARKERS = ("**Final Answer:**", "**Response:**", "**Thinking:**", "**Analysis:**")
+_FILLERS = ("Let me provide", "I'll provide", "Let me give you", "I'll give you")
+
+
+def _keep_lines(lines: List[str], lowers: List[str]) -> List[str]:
+    """
+    Drop reasoning lines; ``lowers`` holds the matching lowercased lines
+
+    Each line costs one C-level startswith over the prefix tuple and two
+    substring tests; the prefix regex and condition only run on lines that
+    pass those gates. The legacy "Based on ... I can" / "To answer ... I'll" / "I need to
+    think" checks compared mixed-case needles against lowercased text and could
+    never match, so they are intentionally absent.
+    """
+    kept = []
+    for line, lower in zip(lines, lowers):
+        if line.startswith(_PREFIXES):
+            condition = _PREFIX_CONDITIONS[_PREFIX.match(line).group()]
+            if condition is None or condition(lower):
+                continue
+        # Every anywhere-pattern contains one of these substrings
+        if ("let me " in lower or "internal" in lower) and _ANYWHERE.search(lower):
+            continue
+        kept.append(line)
+    return kept
+
+
+def is_reasoning_line(line: str) -> bool:
+    """True for a stripped line that is internal reasoning or planning rather than advice"""
+    return not _keep_lines([line], [line.lower()])
+
+
+def rewrite_markers(text: str) -> str:
+    """Drop leftover reasoning markers and rewrite filler phrases; patterns never span lines"""
+    if "**" in text:
+        for marker in _MARKERS:
+            text = text.replace(marker, "")
+    if "Let me " in text or "I'll " in text:
+        for phrase in _FILLERS:
+            text = text.replace(phrase, "Here's")
+    return text
+
+
+def clean_response(response: str) -> str:
+    """Clean up reasoning model responses to remove internal thinking"""
+    # Lowercase the whole response once; str.lower() never adds or removes line breaks
+    lines = list(map(str.strip, response.split("\n")))
+    lowers = list(map(str.strip, response.lower().split("\n")))
+    return rewrite_markers("\n".join(_keep_lines(lines, lowers)).strip())
+
+
+class StreamingCleaner:
+    def __init__(self):
+        """
+        Incremental form of clean_response for token streams
+
+        Tokens are buffered until a line completes, since the reasoning filters
+        look at whole lines. Joining everything returned by feed() and flush()
+        yields exactly what clean_response returns for the full text.
+        """
+        self._buffer = ""
+        self._started = False
+        self._blank_lines = 0
+        self._joined = False
+
+    def _emit(self, raw_line: str) -> List[str]:
+        line = raw_line.strip()
+        if is_reasoning_line(line):
+            return []
+        if not line:
+            # Leading blank lines are dropped, interior ones held until more text follows
+            if self._started:
+                self._blank_lines += 1
+            return []
+        lines = [""] * self._blank_lines + [rewrite_markers(line)]
+        self._started = True
+        self._blank_lines = 0
+        return lines
+
+    def feed_lines(self, chunk: str) -> List[str]:
+        """Add raw text; return the cleaned lines completed by it"""
+        self._buffer += chunk
+        if "\n" not in chunk:
+            return []
+        *complete, self._buffer = self._buffer.split("\n")
+        return [out for line in complete for out in self._emit(line)]
+
+    def flush_lines(self) -> List[str]:
+        """Finish the stream; trailing blank lines are dropped like str.strip() would"""
+        line, self._buffer = self._buffer, ""
+        return self._emit(line)
+
+    def _join(self, lines: List[str]) -> str:
+        if not lines:
+            return ""
+        text = "\n".join(lines)
+        if self._joined:
+            text = "\n" + text
+        self._joined = True
+        return text
+
+    def feed(self, chunk: str) -> str:
+        return self._join(self.feed_lines(chunk))
+
+    def flush(self) -> str:
+        return self._join(self.flush_lines())
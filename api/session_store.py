@@ -0,0 +1,237 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Chat session stores for /api/chat
+
+# Rough per-message framing cost (role, separators) on top of the content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def count_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(message_tokens(m) for m in messages)
+
+
+def trim_to_token_budget(messages: List[Dict[str, str]], budget: int) -> List[Dict[str, str]]:
+    """
+    Keep the system prompt plus the most recent messages that fit in ``budget`` tokens
+
+    The latest message is always kept, even if it alone exceeds the budget.
+    """
+    system = [m for m in messages[:1] if m.get("role") == "system"]
+    rest = messages[len(system):]
+    used = count_tokens(system)
+    kept: List[Dict[str, str]] = []
+    for message in reversed(rest):
+        cost = message_tokens(message)
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return system + kept
+
+
+def cap_messages(messages: List[Dict[str, str]], max_messages: int) -> List[Dict[str, str]]:
+    """Cap stored history length without dropping the system prompt"""
+    if len(messages) <= max_messages:
+        return messages
+    system = [m for m in messages[:1] if m.get("role") == "system"]
+    return system + messages[len(messages) - (max_messages - len(system)):]
+
+
+class MemorySessionStore:
+    def __init__(self, max_sessions: int = 1000, idle_ttl: float = 3600, max_messages: int = 50):
+        """
+        In-process session store with idle-TTL expiry and LRU eviction past ``max_sessions``
+
+        Each session may also hold a JSON-serializable summary (see
+        chat_summary.HistoryCompactor), kept across saves and dropped with the session.
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.evictions = 0
+        self.expirations = 0
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        """Return a copy of the session's messages (empty for unknown or idle-expired sessions)"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            messages, last_access, _ = entry
+            if time.time() - last_access > self.idle_ttl:
+                del self._sessions[session_id]
+                self.expirations += 1
+                return []
+            return list(messages)
+
+    def save(self, session_id: str, messages: List[Dict[str, str]]):
+        with self._lock:
+            previous = self._sessions.get(session_id)
+            summary = previous[2] if previous is not None else None
+            self._sessions[session_id] = (cap_messages(list(messages), self.max_messages), time.time(), summary)
+            self._sessions.move_to_end(session_id)
+            self._expire_idle()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def _expire_idle(self):
+        # Least recently used sessions sit at the front, so stop at the first live one
+        cutoff = time.time() - self.idle_ttl
+        while self._sessions:
+            session_id, (_, last_access, _) = next(iter(self._sessions.items()))
+            if last_access >= cutoff:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def get_summary(self, session_id: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or time.time() - entry[1] > self.idle_ttl:
+                return None
+            return entry[2]
+
+    def save_summary(self, session_id: str, summary: Any):
+        """Attach ``summary`` to a stored session without touching its idle timer (no-op for unknown sessions)"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                self._sessions[session_id] = (entry[0], entry[1], summary)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, int]:
+        return {"backend": "memory", "sessions": len(self), "evictions": self.evictions, "expirations": self.expirations}
+
+
+class SQLiteSessionStore:
+    def __init__(self, path: str, max_sessions: int = 10000, idle_ttl: float = 3600, max_messages: int = 50):
+        """Session store in a SQLite file so every worker process sees the same conversation and its summary"""
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.evictions = 0
+        self.expirations = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            "session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, updated REAL NOT NULL, summary TEXT)"
+        )
+        # Files created before summaries were stored lack the column
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_sessions)")]
+        if "summary" not in columns:
+            conn.execute("ALTER TABLE chat_sessions ADD COLUMN summary TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS chat_sessions_updated ON chat_sessions (updated)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread, reopened after fork"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        row = self._conn().execute(
+            "SELECT messages, updated FROM chat_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.idle_ttl:
+            return []
+        return json.loads(row[0])
+
+    def save(self, session_id: str, messages: List[Dict[str, str]]):
+        conn = self._conn()
+        now = time.time()
+        # An upsert rather than INSERT OR REPLACE, which would drop the stored summary
+        conn.execute(
+            "INSERT INTO chat_sessions (session_id, messages, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET messages = excluded.messages, updated = excluded.updated",
+            (session_id, json.dumps(cap_messages(list(messages), self.max_messages)), now),
+        )
+        expired = conn.execute("DELETE FROM chat_sessions WHERE updated < ?", (now - self.idle_ttl,)).rowcount
+        self.expirations += max(0, expired)
+        (size,) = conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()
+        overflow = size - self.max_sessions
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM chat_sessions WHERE session_id IN "
+                "(SELECT session_id FROM chat_sessions ORDER BY updated LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+        conn.commit()
+
+    def get_summary(self, session_id: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT summary, updated FROM chat_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or row[0] is None or time.time() - row[1] > self.idle_ttl:
+            return None
+        return json.loads(row[0])
+
+    def save_summary(self, session_id: str, summary: Any):
+        conn = self._conn()
+        conn.execute("UPDATE chat_sessions SET summary = ? WHERE session_id = ?", (json.dumps(summary), session_id))
+        conn.commit()
+
+    def delete(self, session_id: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    def __len__(self) -> int:
+        (size,) = self._conn().execute("SELECT COUNT(*) FROM chat_sessions").fetchone()
+        return size
+
+    def stats(self) -> Dict[str, int]:
+        return {"backend": "sqlite", "sessions": len(self), "evictions": self.evictions, "expirations": self.expirations}
+
+
+def create_session_store():
+    """
+    Build the chat session store from environment settings
+
+    BJJ_SESSION_BACKEND: "memory" (default) or "sqlite"
+    BJJ_SESSION_PATH: SQLite file path (default: /tmp/bjj_chat_sessions.sqlite3)
+    BJJ_SESSION_MAX / BJJ_SESSION_TTL: session cap and idle TTL in seconds
+    """
+    backend = os.getenv("BJJ_SESSION_BACKEND", "memory").lower()
+    kwargs = {}
+    if os.getenv("BJJ_SESSION_MAX"):
+        kwargs["max_sessions"] = int(os.getenv("BJJ_SESSION_MAX"))
+    if os.getenv("BJJ_SESSION_TTL"):
+        kwargs["idle_ttl"] = float(os.getenv("BJJ_SESSION_TTL"))
+
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("BJJ_SESSION_PATH", "/tmp/bjj_chat_sessions.sqlite3"), **kwargs)
+    return MemorySessionStore(**kwargs)
@@ -0,0 +1,101 @@
+import math
+import re
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from technique_index import joint_terms, normalize_injury, normalize_term
+
+# In-process technique similarity for the similar_techniques prompt context
+
+# Relative weight of each feature block in the cosine similarity
+BLOCK_WEIGHTS = {"name": 1.0, "joint": 0.8, "stress": 0.8, "body_type": 0.4}
+
+# Past this many unsafe moves, candidates are scored against their centroid to keep queries O(techniques)
+MAX_EXACT_QUERIES = 32
+
+
+def name_tokens(name: str) -> List[str]:
+    return re.findall(r"[a-z]+", name.lower())
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class TechniqueSimilarityIndex:
+    def __init__(self, db: List[Dict]):
+        """
+        Unit-length feature vectors for every technique, built once from the knowledge base
+
+        Each vector concatenates TF-IDF over the technique name with one-hot
+        blocks for primary joint, stress types and safe_for body types. Blocks
+        are normalized separately and weighted (BLOCK_WEIGHTS), so the dot
+        product of two rows is their cosine similarity.
+        """
+        self.records = db
+        self.ids_by_name: Dict[str, List[int]] = {}
+        for i, move in enumerate(db):
+            self.ids_by_name.setdefault(move["technique"], []).append(i)
+
+        blocks = {
+            "name": self._tfidf([name_tokens(move["technique"]) for move in db]),
+            "joint": self._one_hot([joint_terms(move.get("primary_joint", "")) for move in db]),
+            "stress": self._one_hot([[normalize_term(s) for s in move.get("stress_type", [])] for move in db]),
+            "body_type": self._one_hot([[normalize_injury(t) for t in move.get("safe_for", [])] for move in db]),
+        }
+        weighted = [_normalize_rows(block) * math.sqrt(BLOCK_WEIGHTS[name]) for name, block in blocks.items()]
+        self.vectors = _normalize_rows(np.hstack(weighted)).astype(np.float32)
+        # Contiguous feature-major copy: query @ vectors_t reduces along contiguous rows
+        self.vectors_t = np.ascontiguousarray(self.vectors.T)
+
+    @staticmethod
+    def _counts(values: List[List[str]]) -> np.ndarray:
+        """Row x vocabulary matrix of how often each value occurs in each row"""
+        vocabulary = {v: i for i, v in enumerate(sorted({v for row in values for v in row}))}
+        matrix = np.zeros((len(values), len(vocabulary)), dtype=np.float32)
+        for row, row_values in enumerate(values):
+            for v in row_values:
+                matrix[row, vocabulary[v]] += 1.0
+        return matrix
+
+    @staticmethod
+    def _one_hot(values: List[List[str]]) -> np.ndarray:
+        return np.minimum(TechniqueSimilarityIndex._counts(values), 1.0)
+
+    @staticmethod
+    def _tfidf(documents: List[List[str]]) -> np.ndarray:
+        counts = TechniqueSimilarityIndex._counts(documents)
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1.0
+        return counts * idf.astype(np.float32)
+
+    def similar_alternatives(self, unsafe_moves: Sequence[str], k: int = 3) -> List[Dict]:
+        """
+        Top-k safe techniques most similar to any of the unsafe ones
+
+        Every technique not named in ``unsafe_moves`` is a candidate (the safe
+        side of TechniqueIndex.partition); a candidate's score is its best
+        cosine similarity to an unsafe move, or its similarity to the unsafe
+        moves' centroid once there are more than MAX_EXACT_QUERIES of them.
+
+        Returns:
+            [{"id", "score", "metadata": technique record}], best first
+        """
+        unsafe_ids = [i for name in unsafe_moves for i in self.ids_by_name.get(name, ())]
+        if not unsafe_ids:
+            return []
+
+        queries = self.vectors[unsafe_ids]
+        if len(unsafe_ids) > MAX_EXACT_QUERIES:
+            queries = queries.mean(axis=0, keepdims=True)
+        scores = (queries @ self.vectors_t).max(axis=0)
+        scores[unsafe_ids] = -np.inf
+        k = min(k, len(scores) - len(set(unsafe_ids)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [{"id": int(i), "score": float(scores[i]), "metadata": self.records[i]} for i in top]
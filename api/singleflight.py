@@ -0,0 +1,246 @@
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    import asyncio
+
+# Request coalescing for identical in-flight upstream calls
+
+
+class FlightTimeout(TimeoutError):
+    """Raised when a caller's deadline passes while it waits on another caller's call for the same key"""
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, cache=None, lease_ttl: float = 180.0, poll_interval: float = 0.25):
+        """
+        Coalesce concurrent calls that share a key into one execution
+
+        Threads in this process wait on the leader's result directly. When the
+        cache supports leases (SQLiteCache), the leader also claims a lease so
+        other worker processes wait for the value to land in the shared cache
+        instead of calling upstream themselves.
+        """
+        self.cache = cache
+        self.leases = cache if hasattr(cache, "acquire_lease") else None
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_hits = 0
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any], deadline: Optional[float] = None) -> Any:
+        """
+        Run ``fn`` once per key at a time; concurrent callers share its result or exception
+
+        ``deadline`` (a time.monotonic() value) bounds how long this caller
+        waits on another thread's or process's call: FlightTimeout is raised
+        once it passes, while that call carries on and still fills the cache.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(_remaining(deadline)):
+                raise FlightTimeout(f"still waiting on the in-flight call for {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_leader(key, fn, deadline)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def claim(self, key: str) -> Optional[_Call]:
+        """
+        Lead ``key`` for a caller that runs the call itself (e.g. streams it); None if a call is in flight
+
+        Concurrent ``do`` callers follow the claim until ``finish`` hands them
+        its result or error. No cross-process lease is taken.
+        """
+        with self._lock:
+            if key in self._calls:
+                return None
+            call = _Call()
+            self._calls[key] = call
+            self.leaders += 1
+            return call
+
+    def finish(self, key: str, call: _Call, result: Any = None, error: Optional[BaseException] = None):
+        """Release a claim, passing ``result`` (or ``error``) to the callers that followed it"""
+        call.result, call.error = result, error
+        with self._lock:
+            self._calls.pop(key, None)
+        call.done.set()
+
+    def _peek(self, key: str) -> Optional[Any]:
+        """Read a finished value without counting a miss for every poll"""
+        if self.cache is None or key not in self.cache:
+            return None
+        return self.cache.get(key)
+
+    def _run_leader(self, key: str, fn: Callable[[], Any], deadline: Optional[float] = None) -> Any:
+        # A previous leader may have filled the cache between our lookup and now
+        value = self._peek(key)
+        if value is not None:
+            return value
+
+        if self.leases is None:
+            return fn()
+
+        give_up = time.monotonic() + self.lease_ttl
+        acquired = self.leases.acquire_lease(key, self.lease_ttl)
+        while not acquired:
+            # Another process is computing this key; wait for it to land in the shared cache
+            value = self._peek(key)
+            if value is not None:
+                self.remote_hits += 1
+                return value
+            if deadline is not None and time.monotonic() >= deadline:
+                raise FlightTimeout(f"still waiting on another worker's call for {key}")
+            if time.monotonic() >= give_up:
+                break
+            time.sleep(min(self.poll_interval, _remaining(deadline) or self.poll_interval))
+            acquired = self.leases.acquire_lease(key, self.lease_ttl)
+
+        try:
+            if acquired:
+                # The previous lease holder may have finished just before we took over
+                value = self._peek(key)
+                if value is not None:
+                    self.remote_hits += 1
+                    return value
+            return fn()
+        finally:
+            if acquired:
+                self.leases.release_lease(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "remote_hits": self.remote_hits,
+        }
+
+
+class AsyncSingleFlight(SingleFlight):
+    def __init__(self, cache=None, lease_ttl: float = 180.0, poll_interval: float = 0.25):
+        """
+        asyncio form of SingleFlight for one event loop
+
+        The leader's call runs as its own task that every caller awaits
+        without owning it, so a cancelled request (e.g. a client
+        disconnect) neither cancels the others nor abandons the upstream call;
+        its result still lands in the cache.
+        """
+        super().__init__(cache, lease_ttl, poll_interval)
+        self._calls: Dict[str, "asyncio.Future"] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        """Run ``fn()`` once per key at a time; concurrent callers share its result or exception until ``deadline``"""
+        # asyncio is imported on use so the WSGI app's cold start does not pay for it
+        import asyncio
+
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(self._run_leader(key, fn, deadline))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        # asyncio.wait never cancels the task, so a caller giving up or going away leaves the call running
+        done, _ = await asyncio.wait({task}, timeout=_remaining(deadline))
+        if not done:
+            raise FlightTimeout(f"still waiting on the in-flight call for {key}")
+        return task.result()
+
+    def claim(self, key: str) -> Optional["asyncio.Future"]:
+        """SingleFlight.claim for a caller on the event loop; followers await the returned future"""
+        import asyncio
+
+        if key in self._calls:
+            return None
+        self.leaders += 1
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def finish(self, key: str, call: "asyncio.Future", result: Any = None, error: Optional[BaseException] = None):
+        if call.done():
+            return
+        if error is not None:
+            call.set_exception(error)
+        else:
+            call.set_result(result)
+
+    def _finished(self, key: str, task: "asyncio.Task"):
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller has gone away
+            task.exception()
+
+    async def _run_leader(self, key: str, fn: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        import asyncio
+
+        value = self._peek(key)
+        if value is not None:
+            return value
+
+        if self.leases is None:
+            return await fn()
+
+        give_up = time.monotonic() + self.lease_ttl
+        acquired = self.leases.acquire_lease(key, self.lease_ttl)
+        while not acquired:
+            value = self._peek(key)
+            if value is not None:
+                self.remote_hits += 1
+                return value
+            if deadline is not None and time.monotonic() >= deadline:
+                raise FlightTimeout(f"still waiting on another worker's call for {key}")
+            if time.monotonic() >= give_up:
+                break
+            await asyncio.sleep(min(self.poll_interval, _remaining(deadline) or self.poll_interval))
+            acquired = self.leases.acquire_lease(key, self.lease_ttl)
+
+        try:
+            if acquired:
+                value = self._peek(key)
+                if value is not None:
+                    self.remote_hits += 1
+                    return value
+            return await fn()
+        finally:
+            if acquired:
+                self.leases.release_lease(key)
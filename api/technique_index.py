@@ -0,0 +1,204 @@
+import re
+from itertools import compress
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Precompiled injury -> technique index for the BJJ knowledge base
+
+# Translation tables turning a '0'/'1' bit string into selector bytes for compress()
+_SET_BITS = bytes.maketrans(b"01", b"\x00\x01")
+_CLEAR_BITS = bytes.maketrans(b"01", b"\x01\x00")
+
+
+# Words in primary_joint that do not name a body part ("hip and base knee")
+_JOINT_STOPWORDS = {"and", "base"}
+
+
+def normalize_injury(text: str) -> str:
+    return re.sub(r"\s+", "_", text.strip().lower())
+
+
+def normalize_term(text: str) -> str:
+    """Lowercase with "_" and runs of whitespace folded to one space: "Rotational_Torque" -> "rotational torque" """
+    return " ".join(text.replace("_", " ").lower().split())
+
+
+def joint_terms(text: str) -> List[str]:
+    """Body parts named by a primary_joint value: "knees/ankles" -> ["knee", "ankle"]"""
+    terms = []
+    for word in re.findall(r"[a-z]+", text.lower()):
+        if word in _JOINT_STOPWORDS:
+            continue
+        if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class TechniqueIndex:
+    def __init__(self, db: List[Dict]):
+        """
+        Build the injury -> technique bitset index once from the knowledge base
+
+        Bit i of every mask corresponds to technique i of ``db``, so partitioning
+        an injury profile is an OR over a handful of integers instead of a scan
+        over every technique.
+        """
+        self.techniques: List[str] = [move["technique"] for move in db]
+        self.size = len(self.techniques)
+
+        positions: Dict[str, List[int]] = {}
+        for i, move in enumerate(db):
+            for tag in move.get("unsafe_for", []):
+                positions.setdefault(normalize_injury(tag), []).append(i)
+
+        self.unsafe_masks: Dict[str, int] = {
+            tag: self._mask_from_positions(ids) for tag, ids in positions.items()
+        }
+        self._matrix = None
+
+        # Inverted indexes for technique queries, one bitset per field value
+        self.records = db
+        self.all_mask = (1 << self.size) - 1
+        self.field_masks: Dict[str, Dict[str, int]] = {
+            "joint": self._build_masks(db, lambda move: joint_terms(move.get("primary_joint", ""))),
+            "stress": self._build_masks(db, lambda move: [normalize_term(s) for s in move.get("stress_type", [])]),
+            "body_type": self._build_masks(db, lambda move: [normalize_injury(t) for t in move.get("safe_for", [])]),
+            "injury": self.unsafe_masks,
+        }
+
+    def _mask_from_positions(self, ids: List[int]) -> int:
+        """Pack technique ids into an int bitset in O(n) via a bytearray"""
+        buf = bytearray((self.size + 7) // 8)
+        for i in ids:
+            buf[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(buf, "little")
+
+    def _build_masks(self, db: List[Dict], values_of) -> Dict[str, int]:
+        positions: Dict[str, List[int]] = {}
+        for i, move in enumerate(db):
+            for value in values_of(move):
+                positions.setdefault(value, []).append(i)
+        return {value: self._mask_from_positions(ids) for value, ids in positions.items()}
+
+    def field_mask(self, field: str, values: Iterable[str]) -> int:
+        """
+        Techniques matching any of ``values`` (already normalized) for one field
+
+        Stress types are free-text phrases, so a stress value also matches every
+        indexed phrase containing it ("rotational torque" covers "knee rotational torque").
+        """
+        masks = self.field_masks[field]
+        mask = 0
+        for value in values:
+            if field == "stress":
+                needle = f" {value} "
+                for phrase, phrase_mask in masks.items():
+                    if needle in f" {phrase} ":
+                        mask |= phrase_mask
+            else:
+                mask |= masks.get(value, 0)
+        return mask
+
+    def query(self, include: Dict[str, Iterable[str]], exclude: Dict[str, Iterable[str]]) -> int:
+        """
+        Bitset of techniques matching a compound filter
+
+        Values within one field are OR-ed; fields are AND-ed, and every
+        ``exclude`` field removes the techniques matching any of its values.
+        """
+        mask = self.all_mask
+        for field, values in include.items():
+            mask &= self.field_mask(field, values)
+        for field, values in exclude.items():
+            mask &= ~self.field_mask(field, values)
+        return mask
+
+    @staticmethod
+    def count(mask: int) -> int:
+        return bin(mask).count("1")
+
+    @staticmethod
+    def page(mask: int, after: int = -1, limit: int = 20) -> Tuple[List[int], Optional[int]]:
+        """
+        Technique ids in ``mask`` after id ``after``, in db order
+
+        Returns:
+            (ids, cursor) where cursor is the ``after`` for the next page, or None on the last page
+        """
+        if after < -1:
+            raise ValueError(f"after must be -1 or a technique id, got {after}")
+        remaining = mask >> (after + 1) << (after + 1)
+        ids = []
+        while remaining and len(ids) < limit:
+            lowest = remaining & -remaining
+            ids.append(lowest.bit_length() - 1)
+            remaining ^= lowest
+        return ids, (ids[-1] if remaining else None)
+
+    def unsafe_mask(self, injury_tags: Iterable[str]) -> int:
+        """OR together the masks of already-normalized injury tags"""
+        mask = 0
+        for tag in injury_tags:
+            mask |= self.unsafe_masks.get(tag, 0)
+        return mask
+
+    def select(self, mask: int, invert: bool = False, items: Optional[Sequence] = None) -> List:
+        """
+        Return technique names whose bit is set (or clear when ``invert``), in db order
+
+        ``items`` selects from a parallel per-technique sequence instead of the names.
+        """
+        bits = format(mask, "b").zfill(self.size)[::-1].encode("ascii")
+        selectors = bits.translate(_CLEAR_BITS if invert else _SET_BITS)
+        return list(compress(self.techniques if items is None else items, selectors))
+
+    def partition(self, injury_tags: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Split techniques into (safe, unsafe) for a set of normalized injury tags"""
+        mask = self.unsafe_mask(injury_tags)
+        if not mask:
+            return list(self.techniques), []
+        return self.select(mask, invert=True), self.select(mask)
+
+    def injury_matrix(self) -> Tuple[List[str], "np.ndarray"]:
+        """Boolean technique x injury matrix (built lazily from the bitsets) and its column tags"""
+        # NumPy is only needed for batch partitioning, so it stays off the single-request import path
+        import numpy as np
+
+        if self._matrix is None:
+            tags = sorted(self.unsafe_masks)
+            nbytes = (self.size + 7) // 8
+            matrix = np.zeros((self.size, len(tags)), dtype=np.float32)
+            for col, tag in enumerate(tags):
+                raw = np.frombuffer(self.unsafe_masks[tag].to_bytes(nbytes, "little"), dtype=np.uint8)
+                matrix[:, col] = np.unpackbits(raw, bitorder="little")[: self.size]
+            self._matrix = (tags, matrix)
+        return self._matrix
+
+    def partition_many(self, profiles: Sequence[Sequence[str]]) -> List[Tuple[List[str], List[str]]]:
+        """
+        Partition many injury profiles in one pass
+
+        Args:
+            profiles: Lists of already-normalized injury tags
+
+        Returns:
+            (safe, unsafe) technique name lists, one pair per profile
+        """
+        import numpy as np
+
+        tags, matrix = self.injury_matrix()
+        column = {tag: i for i, tag in enumerate(tags)}
+        profile_matrix = np.zeros((len(profiles), len(tags)), dtype=np.float32)
+        for row, profile in enumerate(profiles):
+            for tag in profile:
+                col = column.get(tag)
+                if col is not None:
+                    profile_matrix[row, col] = 1.0
+
+        # profile x technique: a technique is unsafe if it is flagged for any of the profile's injuries
+        unsafe = (profile_matrix @ matrix.T) > 0
+        names = np.array(self.techniques, dtype=object)
+        return [(names[~row].tolist(), names[row].tolist()) for row in unsafe]
@@ -0,0 +1,88 @@
+import sys
+from typing import Any, Dict, Iterator, List, Sequence
+
+from http_cache import encode_json
+
+# Compact, pre-serialized in-memory form of the technique knowledge base
+
+# Record fields stored in slots; any other keys in bjj_moves.json go to ``extra``
+RECORD_FIELDS = ("technique", "primary_joint", "stress_type", "unsafe_for", "safe_for")
+
+
+def _intern(value: Any) -> Any:
+    """Intern strings (and lists of strings, as tuples) so repeated tags share one object"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return tuple(sys.intern(v) for v in value)
+    return value
+
+
+class TechniqueRecord:
+    __slots__ = RECORD_FIELDS + ("extra",)
+
+    def __init__(self, move: Dict[str, Any]):
+        """One technique; reads like the original dict (``record["technique"]``, ``record.get(...)``)"""
+        for field in RECORD_FIELDS:
+            setattr(self, field, _intern(move[field]) if field in move else None)
+        extra = {k: v for k, v in move.items() if k not in RECORD_FIELDS}
+        self.extra = extra or None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in RECORD_FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The original JSON object (tags as lists)"""
+        move = {}
+        for field in RECORD_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                move[field] = list(value) if isinstance(value, tuple) else value
+        if self.extra:
+            move.update(self.extra)
+        return move
+
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            setattr(self, field, value)
+
+
+class TechniqueStore:
+    def __init__(self, db: List[Dict[str, Any]]):
+        """
+        Slotted technique records plus their encoded names, built once per knowledge-base version
+
+        Behaves as a read-only sequence of records, so it can stand in for the
+        parsed ``bjj_moves.json`` list. ``name_json[i]`` is technique i's name
+        already encoded, so safe/unsafe lists splice bytes instead of
+        re-serializing the same names on every request. Full records are only
+        encoded when a page of them is requested, so each technique is held once.
+        """
+        self.records: List[TechniqueRecord] = [TechniqueRecord(move) for move in db]
+        self.names: List[str] = [record.technique for record in self.records]
+        self.name_json: List[bytes] = [encode_json(name) for name in self.names]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[TechniqueRecord]:
+        return iter(self.records)
+
+    def __getitem__(self, i: int) -> TechniqueRecord:
+        return self.records[i]
+
+    def records_json(self, ids: Sequence[int]) -> bytes:
+        """JSON array of the given techniques' full records"""
+        return b"[" + b",".join(encode_json(self.records[i].to_dict()) for i in ids) + b"]"
@@ -0,0 +1,300 @@
+import os
+import threading
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from injury_canonical import body_regions, display_name, phrase_key
+from llm_backends import TASK_CHAT, TASK_RECOMMENDATIONS, TASK_RECOVERY, LLMCall
+from rate_limiter import PRIORITY_RECOMMENDATIONS
+
+# Deterministic, network-free answers built from the technique knowledge base
+
+# Closing line of every templated answer, so it is never mistaken for model output
+TEMPLATE_NOTE = "_Generated from the technique database without an AI model._"
+
+# BJJ movement drills used to fill the drill list when too few safe techniques are known
+GENERIC_DRILLS = ("Shrimp Drills", "Technical Stand-up", "Bridge and Roll")
+
+# Words in a technique name that mark it as a submission, never offered as a rehab drill
+SUBMISSION_WORDS = frozenset({
+    "lock", "bar", "armbar", "choke", "hook", "hold", "slicer", "crank", "kimura", "americana",
+    "omoplata", "triangle", "guillotine", "twister",
+})
+
+# Longest injury phrase (in words) looked up when scanning a chat message
+MAX_PHRASE_WORDS = 4
+
+
+class LocalTemplateBackend:
+    # Runs in-process: the router never hedges it or waits on it
+    remote = False
+    # Templated answers are served but never cached, so the next request asks a model again
+    cacheable = False
+    configured = True
+
+    def __init__(self, get_knowledge_base: Optional[Callable[[], Any]] = None, name: str = "local"):
+        """
+        Answer report and chat calls with markdown templates filled from the knowledge base
+
+        Reports follow the section layout the prompts ask the model for, so the
+        section parser and frontend handle them unchanged. Answers depend only
+        on the call's context and the knowledge base, which makes the backend a
+        zero-latency fallback and a fixed reference in tests.
+        ``get_knowledge_base`` returns the current KnowledgeBase; by default
+        bjj_moves.json next to this module is loaded on first use.
+        """
+        self.name = name
+        self.get_knowledge_base = get_knowledge_base or self._load_default
+        self.answers = 0
+        self._default = None
+        self._records: Tuple[Optional[str], Dict[str, Any]] = (None, {})
+        self._lock = threading.Lock()
+
+    def _load_default(self):
+        if self._default is None:
+            with self._lock:
+                if self._default is None:
+                    from knowledge_base import KnowledgeBase
+                    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bjj_moves.json")
+                    self._default = KnowledgeBase.from_json(path)
+        return self._default
+
+    def supports(self, task: str) -> bool:
+        return task in (TASK_CHAT, TASK_RECOMMENDATIONS, TASK_RECOVERY)
+
+    def complete(self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS) -> str:
+        self.answers += 1
+        context = call.context or {}
+        if call.task == TASK_RECOMMENDATIONS:
+            return self.recommendations(
+                context.get("injuries", []), context.get("safe_moves", []), context.get("unsafe_moves", [])
+            )
+        if call.task == TASK_RECOVERY:
+            return self.recovery(context.get("injuries", []))
+        user_messages = [m["content"] for m in call.messages if m.get("role") == "user"]
+        return self.chat(user_messages[-1] if user_messages else "")
+
+    def stream(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> Iterator[str]:
+        yield self.complete(call, deadline, priority)
+
+    async def acomplete(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> str:
+        return self.complete(call, deadline, priority)
+
+    async def astream(
+        self, call: LLMCall, deadline: Optional[float] = None, priority: int = PRIORITY_RECOMMENDATIONS
+    ) -> AsyncIterator[str]:
+        yield self.complete(call, deadline, priority)
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"answers": self.answers}
+
+    def _records_by_name(self) -> Dict[str, Any]:
+        """Technique name -> record for the current knowledge base, rebuilt when its version changes"""
+        kb = self.get_knowledge_base()
+        version, records = self._records
+        if version != kb.version:
+            records = {record["technique"]: record for record in kb.db}
+            self._records = (kb.version, records)
+        return records
+
+    def _injured_joints(self, unsafe_moves: List[str], limit: Optional[int] = 3) -> List[str]:
+        """Primary joints of the unsafe techniques, most often loaded first"""
+        records = self._records_by_name()
+        joints = Counter(records[name].get("primary_joint") for name in unsafe_moves if name in records)
+        return [joint for joint, _ in joints.most_common() if joint][:limit]
+
+    def _stresses(self, moves: List[str]) -> List[str]:
+        records = self._records_by_name()
+        return unique(stress for name in moves if name in records for stress in records[name].get("stress_type", ()))
+
+    def _injured_regions(self, injuries: List[str], unsafe_moves: List[str]) -> Set[str]:
+        """Body regions the injuries name, else those of the joint the unsafe techniques load most"""
+        regions = set().union(*(body_regions(phrase_key(injury)) for injury in injuries))
+        return regions or set().union(*(body_regions(phrase_key(j)) for j in self._injured_joints(unsafe_moves, 1)))
+
+    def _drills(self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str]) -> List[str]:
+        """Three safe, non-submission techniques away from the injured region, padded with GENERIC_DRILLS"""
+        records = self._records_by_name()
+        injured = self._injured_regions(injuries, unsafe_moves)
+        drills = [
+            name for name in unique(safe_moves)
+            if not SUBMISSION_WORDS & set(phrase_key(name).split())
+            and not injured & body_regions(phrase_key(records.get(name, {}).get("primary_joint") or ""))
+        ][:3]
+        return drills + [d for d in GENERIC_DRILLS if d not in drills][:3 - len(drills)]
+
+    def _describe(self, name: str) -> Tuple[str, str]:
+        """(stress types, primary joint) of a technique, in words"""
+        record = self._records_by_name().get(name)
+        if record is None:
+            return "controlled, low-intensity movement", "whole body"
+        return " and ".join(record.get("stress_type", ())) or "general movement", record.get("primary_joint") or "whole body"
+
+    def recommendations(self, injuries: List[str], safe_moves: List[str], unsafe_moves: List[str]) -> str:
+        """Report in the recommendation prompt's section layout"""
+        injury_text = join_words(injuries) or "the reported injury"
+        joints = join_words(self._injured_joints(unsafe_moves)) or "injured area"
+        stresses = self._stresses(unsafe_moves)
+        stress_text = join_words(stresses[:3]) or "loaded end-range positions"
+        drills = self._drills(injuries, safe_moves, unsafe_moves)
+
+        lines = [
+            "## INITIAL ASSESSMENT",
+            f"**Primary concern:** {capitalized(injury_text)}; techniques that load the {joints} through {stress_text} aggravate it.",
+            "**Pain level:** Not assessed here; train only in pain-free ranges and rate pain before and after each session.",
+            f"**Functional limitations:** {capitalized(', '.join(stresses[:3])) or 'Loaded end-range positions'} under resistance.",
+            "",
+            "## TOP 3 RECOMMENDED JIU JITSU DRILLS WITH EXPLANATIONS",
+        ]
+        for i, drill in enumerate(drills, 1):
+            stress, joint = self._describe(drill)
+            lines += [
+                "",
+                f"### Drill {i}: {drill} - 3 rounds of 2 minutes",
+                f"**Reasoning:** Not flagged for {injury_text} in the technique database; its main demand is "
+                f"{stress} through the {joint}.",
+                f"**Target:** {drill} at a controlled pace with a cooperative partner.",
+            ]
+        lines += [
+            "",
+            "## SAFETY ANALYSIS",
+            f"**Why these moves are SAFE:** None of the recommended drills is tagged unsafe for {injury_text}.",
+            "**Why these moves are UNSAFE:** " + (
+                "; ".join(f"{name} ({self._describe(name)[0]} on the {self._describe(name)[1]})" for name in unsafe_moves[:4])
+                or "No technique in the database is flagged for these injuries."
+            ),
+            "",
+            "## TRAINING MODIFICATIONS",
+            f"**Avoid:** {', '.join(unsafe_moves[:5]) or 'Any movement that reproduces pain'}.",
+            "**Warm-up:** Shrimp drills and bridge-and-roll reps at low intensity, staying clear of painful ranges.",
+            "",
+            "## PROGRESSION CRITERIA",
+            "**Ready to advance when:** The drills above feel pain-free for two sessions in a row, "
+            "with no pain or swelling the next day.",
+            "**Stop if:** Pain increases during training; swelling or instability appears; range of motion decreases.",
+            "",
+            f"**Focus on:** {join_words(drills)}, building skill around the injury instead of through it.",
+            "",
+            TEMPLATE_NOTE,
+        ]
+        return "\n".join(lines)
+
+    def recovery(self, injuries: List[str]) -> str:
+        """Plan in the recovery prompt's section layout"""
+        kb = self.get_knowledge_base()
+        tags = kb.canonicalizer.expand(kb.canonicalizer.canonicalize_all(injuries))
+        safe_moves, unsafe_moves = kb.partition(tags)[:2]
+        injury_text = join_words(injuries) or "the reported injury"
+        joints = join_words(self._injured_joints(unsafe_moves)) or "injured area"
+        stresses = self._stresses(unsafe_moves)
+        drill = self._drills(injuries, safe_moves, unsafe_moves)[0]
+
+        return "\n".join([
+            "## CLINICAL ASSESSMENT",
+            f"**Injury mechanism:** {capitalized(injury_text)}, aggravated by {join_words(stresses[:3]) or 'loaded end-range positions'}.",
+            "**Current pain pattern:** Not assessed here; have it examined by a healthcare professional.",
+            f"**Functional deficits:** {capitalized(', '.join(stresses[:3])) or 'Loaded end-range positions'} under resistance.",
+            "",
+            "## REHABILITATION PROTOCOL",
+            f"**Phase 1 (Weeks 1-2):** Protect the {joints}: pain-free range of motion only and no live rolling.",
+            f"**Phase 2 (Weeks 3-4):** Gradually load the {joints} and drill {drill} at low intensity.",
+            # No return-to-play steps for the unsafe techniques: that call belongs to a clinician
+            "**Phase 3 (Weeks 5-6):** Keep avoiding the techniques listed as unsafe; return to them, and to live "
+            "rolling, only once a healthcare professional has cleared you.",
+            "",
+            "## TREATMENT EXERCISES WITH EXPLANATIONS",
+            "",
+            "### Exercise 1: Pain-free range of motion - 2x10 - daily",
+            f"**Reasoning:** Keeps the {joints} mobile without loading the injured tissue.",
+            f"**Target tissue/function:** Mobility of the {joints}.",
+            "",
+            "### Exercise 2: Isometric holds - 3x5 - 10 seconds each",
+            f"**Reasoning:** Builds strength around the {joints} without moving through painful ranges.",
+            f"**Target tissue/function:** Muscles stabilizing the {joints}.",
+            "",
+            f"### Exercise 3: {drill} - 3x1 - 1 minute",
+            "**Reasoning:** Keeps BJJ movement patterns sharp with a technique not flagged for this injury.",
+            "**Target tissue/function:** Coordination and conditioning away from the injured area.",
+            "",
+            "## PROGRESSION MONITORING",
+            "**Daily assessment:** Pain at rest and during exercises; range of motion compared with the uninjured side.",
+            f"**Weekly milestones:** Three rounds of {drill} without pain the next day.",
+            "**Red flags:** Sharp or worsening pain; swelling or giving way; numbness or tingling.",
+            "",
+            f"**Focus on:** Protecting the {joints} and getting a healthcare professional's assessment before full training.",
+            "",
+            TEMPLATE_NOTE,
+        ])
+
+    def chat(self, message: str) -> str:
+        """Safe and unsafe techniques for the injuries named in a chat message"""
+        kb = self.get_knowledge_base()
+        terms = mentioned_injuries(message, kb.canonicalizer.phrases)
+        if not terms:
+            return (
+                "Tell me which injury you are training around (for example \"torn meniscus\" or \"shoulder pain\") "
+                "and I will list the techniques to avoid and safer alternatives.\n\n" + TEMPLATE_NOTE
+            )
+        safe_moves, unsafe_moves = kb.partition(kb.canonicalizer.expand(terms))[:2]
+        drills = self._drills(terms, safe_moves, unsafe_moves)
+        injury_text = join_words([display_name(t) for t in terms])
+        lines = [f"With {injury_text}:", ""]
+        if unsafe_moves:
+            lines.append("**Avoid:** " + "; ".join(
+                f"{name} ({self._describe(name)[0]} on the {self._describe(name)[1]})" for name in unsafe_moves[:5]
+            ))
+        else:
+            lines.append("**Avoid:** No technique in the database is flagged for this injury; stop anything that hurts.")
+        lines += [
+            f"**Safer options:** {', '.join(drills)}",
+            "",
+            "Check with a healthcare professional before returning to full training.",
+            "",
+            TEMPLATE_NOTE,
+        ]
+        return "\n".join(lines)
+
+
+def unique(items) -> List:
+    """Items in first-seen order without duplicates or empty values"""
+    seen = []
+    for item in items:
+        if item and item not in seen:
+            seen.append(item)
+    return seen
+
+
+def capitalized(text: str) -> str:
+    return text[:1].upper() + text[1:]
+
+
+def join_words(words: List[str]) -> str:
+    """["a", "b", "c"] -> "a, b and c" """
+    words = list(words)
+    if len(words) < 2:
+        return "".join(words)
+    return f"{', '.join(words[:-1])} and {words[-1]}"
+
+
+def mentioned_injuries(message: str, phrases: Dict[str, str]) -> List[str]:
+    """Canonical terms whose phrases (tags or aliases) appear in ``message``, longest phrase first"""
+    words = phrase_key(message).split()
+    found = []
+    i = 0
+    while i < len(words):
+        for n in range(min(MAX_PHRASE_WORDS, len(words) - i), 0, -1):
+            term = phrases.get(" ".join(words[i:i + n]))
+            if term:
+                found.append(term)
+                i += n
+                break
+        else:
+            i += 1
+    return sorted(set(found))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark: legacy _clean_response vs the compiled single-pass cleaner
+
+Runs both over benchmarks/data/recorded_responses.json, checks they agree
+(including the streaming cleaner fed in small chunks), and reports timings.
+"""
+import json
+import os
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "api"))
+
+from response_cleaner import StreamingCleaner, clean_response
+
+
+def legacy_clean_response(response: str) -> str:
+    """The original line-by-line cleaner, kept here as the baseline"""
+    # Remove common reasoning patterns
+    lines = response.split('\n')
+    cleaned_lines = []
+    
+    for line in lines:
+        line = line.strip()
+        # Skip internal reasoning patterns
+        if (line.startswith("The user asks") or 
+            line.startswith("We can do:") or 
+            line.startswith("Let me") and ("think" in line.lower() or "analyze" in line.lower()) or
+            line.startswith("I need to") and ("recall" in line.lower() or "consider" in line.lower()) or
+            line.startswith("First,") and "need to" in line.lower() or
+            line.startswith("Okay,") and "tackle" in line.lower() or
+            line.startswith("Let's") and "produce" in line.lower() or
+            line.startswith("I'll") and ("think" in line.lower() or "analyze" in line.lower()) or
+            line.startswith("Now,") and ("let me" in line.lower() or "I'll" in line.lower()) or
+            "internal" in line.lower() and "reasoning" in line.lower() or
+            line.startswith("Based on") and "I can" in line.lower() or
+            line.startswith("To answer") and "I'll" in line.lower() or
+            line.startswith("I should") and ("think" in line.lower() or "consider" in line.lower()) or
+            "let me think" in line.lower() or
+            "I need to think" in line.lower() or
+            "let me analyze" in line.lower()):
+            continue
+        
+        # Skip lines that are clearly internal planning
+        if (line.startswith("**") and "final answer" in line.lower() or
+            line.startswith("**") and "response" in line.lower() and "planning" in line.lower() or
+            line.startswith("**") and "thinking" in line.lower() or
+            line.startswith("**") and "analysis" in line.lower()):
+            continue
+            
+        cleaned_lines.append(line)
+    
+    # Join and clean up
+    cleaned = '\n'.join(cleaned_lines).strip()
+    
+    # Remove any remaining internal reasoning markers
+    cleaned = cleaned.replace("**Final Answer:**", "").replace("**Response:**", "")
+    cleaned = cleaned.replace("**Thinking:**", "").replace("**Analysis:**", "")
+    
+    # Remove repetitive phrases
+    cleaned = cleaned.replace("Let me provide", "Here's").replace("I'll provide", "Here's")
+    cleaned = cleaned.replace("Let me give you", "Here's").replace("I'll give you", "Here's")
+    
+    return cleaned
+
+
+def stream_clean(text, chunk_size=4):
+    cleaner = StreamingCleaner()
+    out = [cleaner.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    out.append(cleaner.flush())
+    return "".join(out)
+
+
+def best_of(fn, repeat=7):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    with open(os.path.join(here, "data", "recorded_responses.json")) as f:
+        responses = [r.strip() for r in json.load(f)["responses"]]
+
+    for text in responses:
+        expected = legacy_clean_response(text)
+        assert clean_response(text) == expected
+        assert stream_clean(text) == expected
+
+    # Scale the corpus up so each run takes a measurable amount of time
+    corpus = responses * 200
+    chars = sum(len(r) for r in corpus)
+    legacy = best_of(lambda: [legacy_clean_response(r) for r in corpus])
+    compiled = best_of(lambda: [clean_response(r) for r in corpus])
+    streamed = best_of(lambda: [stream_clean(r, 16) for r in corpus], repeat=3)
+
+    print(f"{len(corpus)} responses, {chars / 1e6:.2f} MB")
+    print(f"{'implementation':>22} {'total ms':>9} {'us/response':>12} {'speedup':>8}")
+    for name, seconds in (("legacy", legacy), ("compiled", compiled), ("streaming (16-char)", streamed)):
+        print(f"{name:>22} {seconds * 1e3:>9.1f} {seconds / len(corpus) * 1e6:>12.1f} {legacy / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
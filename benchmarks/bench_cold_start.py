@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Cold-start profile of api/index.py: eager vs lazy init vs lazy init + knowledge-base snapshot
+
+Each mode runs in fresh interpreters (like a serverless cold start) and
+reports the import time of the app, the latency of the first filter
+request and of the first POST /api/recommendations (no API key, so no
+upstream call), plus process wall time. A -X importtime run per mode
+lists the slowest top-level imports.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api")
+sys.path.insert(0, API_DIR)
+
+RUNS = 15
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+client = index.app.test_client()
+client.get("/api/recommendations?injuries=meniscus_tear")
+first_get = time.perf_counter()
+client.post("/api/recommendations", json={"injuries": ["torn meniscus"]})
+first_post = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1e3,
+    "first_get_ms": (first_get - imported) * 1e3,
+    "first_post_ms": (first_post - first_get) * 1e3,
+}))
+"""
+
+
+def child_env(mode, snapshot_path):
+    env = {k: v for k, v in os.environ.items() if k not in ("NVIDIA_API_KEY", "BJJ_KB_SNAPSHOT", "VERCEL")}
+    env["BJJ_LAZY_INIT"] = "0" if mode == "eager" else "1"
+    if mode == "lazy+snapshot":
+        env["BJJ_KB_SNAPSHOT"] = snapshot_path
+    return env
+
+
+def run_child(env):
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=API_DIR, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1e3
+    return result
+
+
+def timed_process(args):
+    started = time.perf_counter()
+    subprocess.run(args, check=True)
+    return (time.perf_counter() - started) * 1e3
+
+
+def import_breakdown(env, top=8):
+    """Slowest modules imported directly by index (cumulative ms) from one -X importtime run"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import index"], cwd=API_DIR, env=env, capture_output=True, text=True
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Depth 1 under index: two spaces of indentation after the column separator
+        name = name[1:]
+        if name.startswith("   ") or not name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        rows.append((int(cumulative) / 1e3, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    from knowledge_base import KnowledgeBase, save_snapshot
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, "kb_snapshot.pickle")
+        save_snapshot(KnowledgeBase.from_json(os.path.join(API_DIR, "bjj_moves.json")), snapshot_path)
+
+        baseline = statistics.median([timed_process([sys.executable, "-c", "pass"]) for _ in range(RUNS)])
+        print(f"bare interpreter start: {baseline:.1f} ms (median of {RUNS})\n")
+        print(f"{'mode':>14} {'import ms':>10} {'1st GET ms':>11} {'1st POST ms':>12} {'process ms':>11}")
+        modes = ("eager", "lazy", "lazy+snapshot")
+        envs = {mode: child_env(mode, snapshot_path) for mode in modes}
+        # Interleave the modes so machine noise affects them alike
+        results = {mode: [] for mode in modes}
+        for _ in range(RUNS):
+            for mode in modes:
+                results[mode].append(run_child(envs[mode]))
+        for mode in modes:
+            row = {key: statistics.median(r[key] for r in results[mode]) for key in results[mode][0]}
+            print(f"{mode:>14} {row['import_ms']:>10.1f} {row['first_get_ms']:>11.2f} "
+                  f"{row['first_post_ms']:>12.2f} {row['process_ms']:>11.1f}")
+        breakdowns = {mode: import_breakdown(envs[mode]) for mode in modes}
+
+        for mode, rows in breakdowns.items():
+            print(f"\nslowest imports by index ({mode}):")
+            for ms, name in rows:
+                print(f"  {ms:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: linear filter_moves scan vs the precompiled bitset index
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from technique_index import TechniqueIndex, normalize_injury
+
+INJURY_TAGS = [
+    "acl_reconstruction", "meniscus_tear", "mcl_sprain", "pcl_injury", "patellofemoral_pain",
+    "labrum_tear", "rotator_cuff_injury", "shoulder_instability", "lower_back_pain",
+    "spinal_disc_injury", "neck_injury", "recent_wrist_fracture", "ankle_instability",
+    "hip_labrum_injury", "elbow_ligament_injury", "achilles_tendonitis",
+]
+
+
+def synthetic_db(size, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "technique": f"Technique {i}",
+            "unsafe_for": rng.sample(INJURY_TAGS, rng.randint(0, 3)),
+        }
+        for i in range(size)
+    ]
+
+
+def linear_filter(injuries, db):
+    """The original per-request scan, kept here as the baseline"""
+    injury_norms = [normalize_injury(i) for i in injuries]
+    safe_moves, unsafe_moves = [], []
+    for move in db:
+        if any(injury in move["unsafe_for"] for injury in injury_norms):
+            unsafe_moves.append(move["technique"])
+        else:
+            safe_moves.append(move["technique"])
+    return safe_moves, unsafe_moves
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    profiles = [["meniscus tear"], ["ACL reconstruction", "labrum tear"], ["neck injury", "lower back pain", "mcl sprain"]]
+    print(f"{'techniques':>10} {'build ms':>9} {'linear ms':>10} {'index ms':>9} {'speedup':>8}")
+    for size in (40, 10_000, 100_000):
+        db = synthetic_db(size)
+        start = time.perf_counter()
+        index = TechniqueIndex(db)
+        build = time.perf_counter() - start
+
+        for injuries in profiles:
+            norms = [normalize_injury(i) for i in injuries]
+            assert index.partition(norms) == linear_filter(injuries, db)
+
+        repeat = 20 if size <= 10_000 else 5
+        linear = best_of(lambda: [linear_filter(p, db) for p in profiles], repeat) / len(profiles)
+        indexed = best_of(
+            lambda: [index.partition([normalize_injury(i) for i in p]) for p in profiles], repeat
+        ) / len(profiles)
+        print(f"{size:>10} {build * 1e3:>9.2f} {linear * 1e3:>10.3f} {indexed * 1e3:>9.3f} {linear / indexed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
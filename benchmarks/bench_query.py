@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: compound technique query, linear scan vs the inverted bitset indexes
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from bench_filter import INJURY_TAGS, best_of
+from technique_index import TechniqueIndex
+
+JOINTS = ["knee", "shoulder", "elbow", "wrist", "ankle", "neck", "spine", "hip"]
+STRESSES = ["rotational torque", "deep flexion", "hyperextension", "cervical compression", "valgus knee pressure"]
+BODY_TYPES = ["lanky", "short_stocky", "flexible", "explosive", "balanced"]
+
+
+def synthetic_db(size, seed=11):
+    rng = random.Random(seed)
+    return [
+        {
+            "technique": f"Technique {i}",
+            "primary_joint": rng.choice(JOINTS),
+            "stress_type": rng.sample(STRESSES, rng.randint(1, 2)),
+            "unsafe_for": rng.sample(INJURY_TAGS, rng.randint(0, 3)),
+            "safe_for": rng.sample(BODY_TYPES, rng.randint(0, 2)),
+        }
+        for i in range(size)
+    ]
+
+
+def linear_query(db, limit):
+    """Safe for acl_reconstruction, good for lanky, no rotational torque: first ``limit`` matches and the total"""
+    matches = [
+        move for move in db
+        if "acl_reconstruction" not in move["unsafe_for"]
+        and "lanky" in move["safe_for"]
+        and "rotational torque" not in move["stress_type"]
+    ]
+    return matches[:limit], len(matches)
+
+
+def indexed_query(index, limit):
+    mask = index.query({"body_type": ["lanky"]}, {"injury": ["acl_reconstruction"], "stress": ["rotational torque"]})
+    ids, _ = index.page(mask, limit=limit)
+    return [index.records[i] for i in ids], index.count(mask)
+
+
+def main():
+    print(f"{'techniques':>10} {'build ms':>9} {'linear ms':>10} {'index ms':>9} {'speedup':>8}")
+    for size in (40, 10_000, 100_000):
+        db = synthetic_db(size)
+        start = time.perf_counter()
+        index = TechniqueIndex(db)
+        build = time.perf_counter() - start
+        assert indexed_query(index, 20) == linear_query(db, 20)
+
+        repeat = 20 if size <= 10_000 else 5
+        linear = best_of(lambda: linear_query(db, 20), repeat)
+        indexed = best_of(lambda: indexed_query(index, 20), repeat)
+        print(f"{size:>10} {build * 1e3:>9.2f} {linear * 1e3:>10.3f} {indexed * 1e3:>9.3f} {linear / indexed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
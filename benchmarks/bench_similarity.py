@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: top-3 safe alternatives from the in-process similarity index
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from bench_filter import best_of
+from bench_query import synthetic_db
+from similarity_index import TechniqueSimilarityIndex
+from technique_index import TechniqueIndex
+
+NAME_WORDS = ["Knee", "Arm", "Leg", "Heel", "Toe", "Guard", "Mount", "Pass", "Lock", "Bar", "Hook", "Sweep", "Choke"]
+
+
+def named_db(size, seed=5):
+    rng = random.Random(seed)
+    db = synthetic_db(size)
+    for move in db:
+        move["technique"] = f"{' '.join(rng.sample(NAME_WORDS, 2))} {move['technique']}"
+    return db
+
+
+def main():
+    print(f"{'techniques':>10} {'unsafe':>7} {'build ms':>9} {'query us':>9}")
+    for size in (40, 1_000, 5_000, 20_000):
+        db = named_db(size)
+        start = time.perf_counter()
+        index = TechniqueSimilarityIndex(db)
+        build = time.perf_counter() - start
+        _, unsafe = TechniqueIndex(db).partition(["acl_reconstruction", "meniscus_tear"])
+        # A realistic profile flags a handful of moves; larger sets fall back to the centroid query
+        unsafe = unsafe[:10]
+        query = best_of(lambda: [index.similar_alternatives(unsafe, 3) for _ in range(100)], 5) / 100
+        print(f"{size:>10} {len(unsafe):>7} {build * 1e3:>9.2f} {query * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: list-of-dicts knowledge base + json.dumps per response vs the
+slotted TechniqueStore with pre-encoded partition JSON
+
+Reports bytes held by the technique data alone (tracemalloc): the parsed dict
+list vs a TechniqueStore built from it, with no index or canonicalizer. Also
+times building one recommendation body for a repeated injury set.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from bench_filter import INJURY_TAGS, best_of, synthetic_db
+from http_cache import RawJSON, json_body
+from knowledge_base import KnowledgeBase
+from technique_store import TechniqueStore
+
+
+def allocated(build):
+    """Bytes still allocated by ``build()``'s result"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    tags = INJURY_TAGS[:2]
+    print(f"{'techniques':>10} {'dicts KB':>9} {'store KB':>9} {'dumps us':>9} {'spliced us':>11} {'speedup':>8}")
+    for size in (40, 10_000, 100_000):
+        # Round-trip through JSON so each record owns its strings, as after json.load
+        raw = json.dumps(synthetic_db(size))
+        db, dicts_bytes = allocated(lambda: json.loads(raw))
+        # Only the store survives the build; the dicts it was made from are freed
+        _, store_bytes = allocated(lambda: TechniqueStore(json.loads(raw)))
+        kb = KnowledgeBase(db, "bench")
+        del db
+
+        def baseline():
+            safe, unsafe = kb.technique_index.partition(tags)
+            return json.dumps({"injuries": tags, "safe_moves": safe, "unsafe_moves": unsafe}).encode()
+
+        def spliced():
+            partition = kb.partition(tags)
+            return json_body({
+                "injuries": tags,
+                "safe_moves": RawJSON(partition.safe_json),
+                "unsafe_moves": RawJSON(partition.unsafe_json),
+            })
+
+        assert json.loads(baseline()) == json.loads(spliced())
+        repeat = max(5, 200_000 // size)
+        dumps_s = best_of(baseline, repeat)
+        spliced_s = best_of(spliced, repeat)
+        print(f"{size:>10} {dicts_bytes / 1024:>9.0f} {store_bytes / 1024:>9.0f} {dumps_s * 1e6:>9.1f} "
+              f"{spliced_s * 1e6:>11.1f} {dumps_s / spliced_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the NVIDIA chat-completions API, for offline load tests
+
+Replies with the recorded model responses in benchmarks/data (reasoning
+preambles included), after a configurable latency, optionally streamed as
+SSE chunks, with 429 and 5xx responses injected at configurable rates.
+
+	python benchmarks/fake_nvidia.py --port 8001 --latency 0.8 --rate-limit 0.05 --errors 0.02
+	NVIDIA_API_URL=http://127.0.0.1:8001/v1/chat/completions NVIDIA_API_KEY=fake flask --app api/index run --port 5000
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECORDED_RESPONSES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "recorded_responses.json")
+
+
+class FakeNVIDIA:
+    def __init__(
+        self,
+        latency=0.5,
+        jitter=0.2,
+        rate_limit=0.0,
+        errors=0.0,
+        retry_after=1.0,
+        chunk_delay=0.01,
+        seed=None,
+    ):
+        """
+        Args:
+            latency: Mean seconds before the first byte of a reply
+            jitter: Latency is drawn uniformly from latency +/- jitter
+            rate_limit: Fraction of requests answered 429 with a Retry-After of ``retry_after``
+            errors: Fraction of requests answered 500/502/503
+            chunk_delay: Seconds between SSE chunks of a streamed reply
+        """
+        with open(RECORDED_RESPONSES) as f:
+            self.responses = json.load(f)["responses"]
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.errors = errors
+        self.retry_after = retry_after
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.counts = {"requests": 0, "ok": 0, "streamed": 0, "rate_limited": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self.server = None
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _draw(self):
+        """(latency seconds, injected status or None) for one request"""
+        with self._lock:
+            delay = max(0.0, self.rng.uniform(self.latency - self.jitter, self.latency + self.jitter))
+            roll = self.rng.random()
+        if roll < self.rate_limit:
+            return delay, 429
+        if roll < self.rate_limit + self.errors:
+            return delay, (500, 502, 503)[int(roll * 1000) % 3]
+        return delay, None
+
+    def reply_for(self, payload):
+        """Deterministic recorded reply chosen by the last message, so identical prompts get identical answers"""
+        messages = payload.get("messages") or [{}]
+        digest = hashlib.sha256(str(messages[-1].get("content", "")).encode("utf-8")).digest()
+        return self.responses[digest[0] % len(self.responses)]
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                fake._count("requests")
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                delay, status = fake._draw()
+                time.sleep(delay)
+                if status is not None:
+                    fake._count("rate_limited" if status == 429 else "errors")
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header("Retry-After", str(fake.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                text = fake.reply_for(payload)
+                if payload.get("stream"):
+                    fake._count("streamed")
+                    self.stream(text)
+                else:
+                    fake._count("ok")
+                    body = json.dumps({"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]})
+                    self.send_json(body.encode("utf-8"))
+
+            def send_json(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def stream(self, text):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for piece in text.splitlines(keepends=True):
+                    chunk = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(fake.chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve on a background thread; returns the chat-completions URL"""
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_port}/v1/chat/completions"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.5, help="mean upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency is uniform in latency +/- jitter")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--errors", type=float, default=0.0, help="fraction of requests answered 5xx")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="seconds between streamed chunks")
+
+
+def from_arguments(args):
+    return FakeNVIDIA(
+        latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit, errors=args.errors,
+        retry_after=args.retry_after, chunk_delay=args.chunk_delay, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--seed", type=int, default=None)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = from_arguments(args)
+    url = fake.start(args.host, args.port)
+    print(f"Fake NVIDIA API listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(fake.counts))
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Load test: drive /api/recommendations and /api/chat at a fixed concurrency
+
+By default runs fully offline: starts benchmarks/fake_nvidia.py and the
+Flask app in this process, with the upstream rate limit lifted so the app
+itself is measured. Reports throughput, p50/p95/p99 latency per endpoint
+(to the full body, streamed or not) and the AI cache hit ratio; --json
+saves the report and --baseline prints the change against an earlier one.
+
+	python benchmarks/load_test.py --concurrency 16 --requests 400 --profiles 20 --chat 0.3
+	python benchmarks/load_test.py --asgi --latency 2 --concurrency 200   # api/asgi.py under uvicorn
+	python benchmarks/load_test.py --url http://localhost:5000   # an already running server
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "api"))
+
+import fake_nvidia
+from bench_filter import INJURY_TAGS
+
+CHAT_MESSAGES = [
+    "I have a knee injury, what can I drill?",
+    "Is closed guard OK with lower back pain?",
+    "How should I warm up my shoulders before rolling?",
+    "Which submissions are safest with a neck injury?",
+    "Can I still play De La Riva with an ankle sprain?",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def injury_profiles(count, rng):
+    """``count`` distinct free-text injury sets of one or two knowledge-base tags"""
+    profiles = set()
+    while len(profiles) < count:
+        tags = rng.sample(INJURY_TAGS, rng.choice((1, 2)))
+        profiles.add(tuple(sorted(tag.replace("_", " ") for tag in tags)))
+    return [list(p) for p in sorted(profiles)]
+
+
+def configure_local_app(upstream_url, prewarm):
+    os.environ["NVIDIA_API_URL"] = upstream_url
+    os.environ.setdefault("NVIDIA_API_KEY", "fake-key")
+    # Measure the app, not the production upstream quota
+    os.environ.setdefault("BJJ_UPSTREAM_RPM", "1000000")
+    os.environ.setdefault("BJJ_UPSTREAM_BURST", "1000")
+    os.environ.setdefault("BJJ_UPSTREAM_QUEUE", "10000")
+    if not prewarm:
+        # A missing artifact is skipped silently, so every answer starts cold
+        os.environ["BJJ_PREWARM_ARTIFACT"] = os.path.join(HERE, "no-prewarm-artifact.json")
+
+
+def start_local_app(upstream_url, prewarm):
+    """Import the Flask app against the fake upstream and serve it on a background thread; returns (stop, url)"""
+    configure_local_app(upstream_url, prewarm)
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import index
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, index.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown, f"http://127.0.0.1:{server.server_port}"
+
+
+def start_local_asgi(upstream_url, prewarm):
+    """Serve api/asgi.py with uvicorn on a background thread; returns (stop, url)"""
+    configure_local_app(upstream_url, prewarm)
+    import socket
+
+    import uvicorn
+
+    import asgi
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(asgi.app, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    return stop, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def run_load(base_url, args):
+    rng = random.Random(args.seed)
+    profiles = injury_profiles(args.profiles, rng)
+    plan = [
+        ("chat", rng.choice(CHAT_MESSAGES)) if rng.random() < args.chat else ("recommendations", rng.choice(profiles))
+        for _ in range(args.requests)
+    ]
+    local = threading.local()
+    latencies = {"recommendations": [], "chat": []}
+    failures = {"recommendations": 0, "chat": 0}
+    lock = threading.Lock()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.chat_id = f"load-{threading.get_ident()}"
+        return local.session
+
+    def one(item):
+        kind, value = item
+        http = session()
+        started = time.perf_counter()
+        try:
+            if kind == "chat":
+                url, body = f"{base_url}/api/chat", {"message": value, "session_id": local.chat_id}
+            else:
+                url, body = f"{base_url}/api/recommendations", {"injuries": value}
+            if args.stream:
+                body["stream"] = True
+            response = http.post(url, json=body, timeout=args.timeout)
+            # Streamed replies report failures in-band, as an error event
+            ok = response.status_code == 200 and not (args.stream and "event: error" in response.text)
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies[kind].append(elapsed)
+            if not ok:
+                failures[kind] += 1
+
+    before = requests.get(f"{base_url}/api/cache/stats", timeout=10).json()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, plan))
+    wall = time.perf_counter() - started
+    after = requests.get(f"{base_url}/api/cache/stats", timeout=10).json()
+
+    hits = after["hits"] + after.get("stale_hits", 0) - before["hits"] - before.get("stale_hits", 0)
+    misses = after["misses"] - before["misses"]
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(args.requests / wall, 2),
+        "cache_hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "endpoints": {},
+    }
+    for kind, values in latencies.items():
+        if values:
+            report["endpoints"][kind] = {
+                "count": len(values),
+                "failures": failures[kind],
+                "p50_ms": round(percentile(values, 50) * 1e3, 2),
+                "p95_ms": round(percentile(values, 95) * 1e3, 2),
+                "p99_ms": round(percentile(values, 99) * 1e3, 2),
+            }
+    return report
+
+
+def print_report(report, baseline=None):
+    def delta(now, then):
+        return f" ({(now - then) / then * 100:+.1f}%)" if then else ""
+
+    base = baseline or {}
+    print(f"throughput: {report['throughput_rps']} req/s{delta(report['throughput_rps'], base.get('throughput_rps'))}"
+          f" over {report['wall_seconds']} s at concurrency {report['concurrency']}")
+    print(f"cache hit ratio: {report['cache_hit_ratio']}")
+    print(f"{'endpoint':>16} {'count':>6} {'fail':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, row in report["endpoints"].items():
+        then = base.get("endpoints", {}).get(kind, {})
+        print(f"{kind:>16} {row['count']:>6} {row['failures']:>5} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+              + (f"   p95{delta(row['p95_ms'], then.get('p95_ms'))}" if then else ""))
+    if "upstream" in report:
+        print(f"fake upstream: {json.dumps(report['upstream'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="target a running server instead of the in-process app + fake upstream")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--profiles", type=int, default=20, help="distinct injury sets in the recommendation mix")
+    parser.add_argument("--chat", type=float, default=0.3, help="fraction of requests sent to /api/chat")
+    parser.add_argument("--timeout", type=float, default=120, help="client timeout per request in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stream", action="store_true", help="request Server-Sent Events replies")
+    parser.add_argument("--prewarm", action="store_true", help="keep the pre-warmed answer artifact (in-process only)")
+    parser.add_argument("--asgi", action="store_true", help="serve api/asgi.py with uvicorn instead of the Flask app")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier --json report to compare against")
+    fake_nvidia.add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = None
+    base_url = args.url
+    if base_url is None:
+        fake = fake_nvidia.from_arguments(args)
+        start = start_local_asgi if args.asgi else start_local_app
+        stop_app, base_url = start(fake.start(), args.prewarm)
+
+    report = run_load(base_url.rstrip("/"), args)
+    if fake is not None:
+        report["upstream"] = dict(fake.counts)
+        stop_app()
+        fake.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
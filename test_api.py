@@ -24,6 +24,65 @@ def test_api():
     except Exception as e:
         print(f"❌ Connection error: {e}")
     
+    # Test batch recommendations endpoint
+    print("\nTesting /api/recommendations/batch...")
+    try:
+        response = requests.post(f"{base_url}/api/recommendations/batch",
+                               json={"profiles": [["knee injury"], {"id": "athlete-2", "injuries": ["knee injury"]}],
+                                     "include_ai": False},
+                               headers={"Content-Type": "application/json"})
+        print(f"Status: {response.status_code}")
+        if response.status_code == 200:
+            data = response.json()
+            print(f"Results: {len(data['results'])}, unique profiles: {data['unique_profiles']}")
+            print("✅ Batch recommendations endpoint working")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    # Test cacheable GET recommendations (redirects to the canonical query, then revalidates with the ETag)
+    print("\nTesting GET /api/recommendations...")
+    try:
+        response = requests.get(f"{base_url}/api/recommendations", params={"injuries": "knee injury"})
+        print(f"Status: {response.status_code}, ETag: {response.headers.get('ETag')}")
+        if response.status_code == 200:
+            revalidated = requests.get(response.url, headers={"If-None-Match": response.headers["ETag"]})
+            print(f"Revalidation status: {revalidated.status_code}")
+            print("✅ GET recommendations endpoint working")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    # Test async recommendation jobs (submit, then poll the status URL)
+    print("\nTesting /api/recommendations/jobs...")
+    try:
+        response = requests.post(f"{base_url}/api/recommendations/jobs",
+                               json={"injuries": ["knee injury"]},
+                               headers={"Content-Type": "application/json"})
+        print(f"Status: {response.status_code}")
+        if response.status_code == 202:
+            job = requests.get(f"{base_url}{response.json()['status_url']}").json()
+            print(f"Job status: {job['status']}, pending: {job['pending']}")
+            print("✅ Recommendation jobs endpoint working")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    # Test Prometheus metrics endpoint
+    print("\nTesting /api/metrics...")
+    try:
+        response = requests.get(f"{base_url}/api/metrics")
+        print(f"Status: {response.status_code}")
+        if response.status_code == 200 and "bjj_http_requests_total" in response.text:
+            print("✅ Metrics endpoint working")
+        else:
+            print(f"❌ Error: {response.text[:200]}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
     # Test chat endpoint
     print("\nTesting /api/chat...")
     try:
@@ -40,5 +99,26 @@ def test_api():
     except Exception as e:
         print(f"❌ Connection error: {e}")
 
+def test_chat_stream():
+    base_url = "http://localhost:5000"  # Change this to your deployed URL
+    
+    # Test streaming chat (Server-Sent Events)
+    print("\nTesting /api/chat streaming...")
+    try:
+        response = requests.post(f"{base_url}/api/chat",
+                               json={"message": "Hello, I have a knee injury", "stream": True},
+                               headers={"Content-Type": "application/json"},
+                               stream=True)
+        print(f"Status: {response.status_code}")
+        if response.status_code == 200:
+            events = [line for line in response.iter_lines(decode_unicode=True) if line.startswith("event:")]
+            print(f"Events: {len(events)}, last: {events[-1] if events else None}")
+            print("✅ Chat streaming working")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+
 if __name__ == "__main__":
     test_api()
+    test_chat_stream()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the upstream circuit breaker's closed -> open -> half-open -> closed cycle
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+def open_breaker(reset_timeout=0.05):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    return breaker
+
+
+def test_consecutive_failures_open_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    # A success in between resets the count
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.times_opened == 1
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    assert breaker.short_circuited == 1
+
+
+def test_one_probe_after_the_reset_timeout_then_close_on_success():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # Only the probe goes upstream
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.times_opened == 2
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def test_released_probe_frees_the_slot_without_changing_state():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    # The next caller becomes the probe
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Regression checks for free-text injury canonicalization (no server needed)
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+
+from injury_canonical import InjuryCanonicalizer
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api", "bjj_moves.json")) as f:
+    canonicalizer = InjuryCanonicalizer(json.load(f))
+
+
+def test_generic_words_do_not_pick_the_body_part():
+    # Each of these used to fuzzy-match another region through "injury", "fracture" or "sprain"
+    assert canonicalizer.canonicalize("sprained knee") == "knee_injury"
+    assert canonicalizer.canonicalize("ankle fracture") == "ankle_injury"
+    assert canonicalizer.canonicalize("knee ligament injury") == "knee_injury"
+
+
+def test_unknown_body_parts_stay_unmatched():
+    assert canonicalizer.canonicalize("broken toe") == "broken_toe"
+    assert canonicalizer.canonicalize("finger injury") == "finger_injury"
+    assert canonicalizer.canonicalize("rib injury") == "rib_injury"
+    assert canonicalizer.canonicalize("toe injury") == "toe_injury"
+
+
+def test_aliases_and_typos_still_resolve():
+    assert canonicalizer.canonicalize("torn meniscus") == "meniscus_tear"
+    assert canonicalizer.canonicalize("menicsus tear") == "meniscus_tear"
+    assert canonicalizer.canonicalize("hip labrum tear") == "hip_labrum_injury"
+    assert canonicalizer.canonicalize("shoulder instabilty") == "shoulder_instability"
+
+
+if __name__ == "__main__":
+    test_generic_words_do_not_pick_the_body_part()
+    test_unknown_body_parts_stay_unmatched()
+    test_aliases_and_typos_still_resolve()
+    print("✅ Injury canonicalization checks passed")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Offline checks for backend routing: failover, the opt-in template fallback, ordering and hedging
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+
+from circuit_breaker import CircuitBreaker
+from llm_backends import TASK_CHAT, TASK_RECOMMENDATIONS, LLMCall
+from llm_router import BackendRouter, NoBackendAvailable, create_router
+from template_backend import SUBMISSION_WORDS, TEMPLATE_NOTE, LocalTemplateBackend
+
+CHAT_CALL = LLMCall(TASK_CHAT, [{"role": "user", "content": "I have a knee injury"}], {})
+
+template = LocalTemplateBackend()
+
+
+class StubBackend:
+    """Remote-looking backend answering with fixed text after ``delay`` seconds, or failing"""
+    remote = True
+    cacheable = True
+    configured = True
+
+    def __init__(self, name, text="model answer", delay=0.0, fail=False):
+        self.name = name
+        self.model = f"{name}-model"
+        self.text = text
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def supports(self, task):
+        return True
+
+    def complete(self, call, deadline=None, priority=0):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError(f"{self.name} is down")
+        return self.text
+
+    def stats(self):
+        return {}
+
+
+def test_failover_to_the_next_backend():
+    down, up = StubBackend("down", fail=True), StubBackend("up")
+    router = BackendRouter([down, up])
+    completion = router.complete(CHAT_CALL)
+    assert (completion.text, completion.backend, completion.cacheable) == ("model answer", "up", True)
+    assert down.calls == 1 and router.failovers == 1
+
+
+def test_template_fallback_is_opt_in():
+    down = StubBackend("down", fail=True)
+    with pytest.raises(ConnectionError):
+        BackendRouter([down]).complete(CHAT_CALL)
+
+    router = BackendRouter([down], fallback=template)
+    completion = router.complete(CHAT_CALL)
+    assert completion.backend == "local" and not completion.cacheable
+    assert completion.text.endswith(TEMPLATE_NOTE) and router.fallbacks == 1
+
+    with pytest.raises(NoBackendAvailable):
+        BackendRouter([]).complete(CHAT_CALL)
+
+
+def test_create_router_has_no_fallback_unless_asked(monkeypatch):
+    monkeypatch.delenv("BJJ_LLM_FALLBACK", raising=False)
+    monkeypatch.setenv("BJJ_LLM_BACKENDS", "nvidia")
+    assert create_router().fallback is None
+    assert create_router(fallback="local").fallback.name == "local"
+    monkeypatch.setenv("BJJ_LLM_FALLBACK", "local")
+    assert create_router().fallback.name == "local"
+
+
+def test_unhealthy_and_slow_backends_are_tried_last():
+    first, second, third = StubBackend("first"), StubBackend("second"), StubBackend("third")
+    router = BackendRouter([first, second, third], min_samples=3)
+    assert [b.name for b in router.candidates(TASK_CHAT)] == ["first", "second", "third"]
+
+    # Error rate above max_error_rate
+    for _ in range(3):
+        router.health(first, TASK_CHAT).record(False)
+    assert [b.name for b in router.candidates(TASK_CHAT)] == ["second", "third", "first"]
+
+    # More than slow_factor times the fastest healthy p50
+    for _ in range(3):
+        router.health(second, TASK_CHAT).record(True, 1.0)
+        router.health(third, TASK_CHAT).record(True, 0.1)
+    assert [b.name for b in router.candidates(TASK_CHAT)] == ["third", "second", "first"]
+
+    # An open circuit counts as unhealthy; other tasks keep their own statistics
+    third.breaker.record_failure()
+    third.breaker.record_failure()
+    assert [b.name for b in router.candidates(TASK_CHAT)] == ["second", "first", "third"]
+    assert [b.name for b in router.candidates(TASK_RECOMMENDATIONS)][0] == "first"
+
+
+def test_routes_restrict_and_order_backends():
+    first, second = StubBackend("first"), StubBackend("second")
+    router = BackendRouter([first, second, template], routes={TASK_CHAT: ["local", "second"]})
+    assert [b.name for b in router.candidates(TASK_CHAT)] == ["local", "second"]
+    assert [b.name for b in router.candidates(TASK_RECOMMENDATIONS)] == ["first", "second", "local"]
+
+
+def test_slow_call_is_hedged_to_the_next_backend():
+    slow, fast = StubBackend("slow", text="slow answer", delay=0.5), StubBackend("fast", text="fast answer")
+    router = BackendRouter([slow, fast], min_samples=3)
+    for _ in range(3):
+        router.health(slow, TASK_CHAT).record(True, 0.05)
+    completion = router.complete(CHAT_CALL)
+    assert completion.text == "fast answer"
+    assert router.hedges == 1 and router.hedge_wins == 1
+
+
+def test_template_drills_avoid_submissions_and_the_injured_region():
+    report = template.complete(LLMCall(TASK_RECOMMENDATIONS, [], {}, {
+        "injuries": ["knee injury"],
+        "safe_moves": ["Estima Lock", "Straight Ankle Lock", "Leg Drag Pass", "Toreando Pass"],
+        "unsafe_moves": ["Knee Slice Pass", "Heel Hook"],
+    }))
+    drills = [line.split(": ", 1)[1].split(" - ")[0] for line in report.splitlines() if line.startswith("### Drill")]
+    assert drills[0] == "Toreando Pass" and "Leg Drag Pass" not in drills
+    assert not any(SUBMISSION_WORDS & set(drill.lower().split()) for drill in drills)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Offline checks for admission control: priority order, queue bound and deadline rejections
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+
+from rate_limiter import (
+    PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_RECOMMENDATIONS, AdmissionController, AdmissionRejected, TokenBucket
+)
+
+
+def test_burst_is_admitted_without_waiting():
+    limiter = AdmissionController(TokenBucket(rate=1.0, burst=3))
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+    assert time.monotonic() - started < 0.1 and limiter.admitted == 3
+
+
+def test_wait_past_the_deadline_is_rejected_up_front():
+    limiter = AdmissionController(TokenBucket(rate=1.0, burst=1))
+    limiter.acquire()
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        limiter.acquire(deadline=time.monotonic() + 0.2)
+    # Rejected from the estimate, not after sleeping until the deadline
+    assert time.monotonic() - started < 0.1
+    assert limiter.rejected_deadline == 1 and limiter.stats()["queued"] == 0
+
+
+def test_full_queue_rejects_new_callers():
+    limiter = AdmissionController(TokenBucket(rate=5.0, burst=1), max_queue=1)
+    limiter.acquire()
+    waiter = threading.Thread(target=limiter.acquire)
+    waiter.start()
+    while limiter.stats()["queued"] < 1:
+        time.sleep(0.01)
+    with pytest.raises(AdmissionRejected):
+        limiter.acquire()
+    waiter.join(5)
+    assert limiter.rejected_queue_full == 1 and limiter.admitted == 2
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    limiter = AdmissionController(TokenBucket(rate=5.0, burst=1))
+    limiter.acquire()
+    order = []
+
+    def wait_for_turn(name, priority):
+        limiter.acquire(priority)
+        order.append(name)
+
+    # Queue them all within one refill interval, lowest priority first
+    threads = []
+    for name, priority in (("background", PRIORITY_BACKGROUND), ("report-1", PRIORITY_RECOMMENDATIONS),
+                           ("report-2", PRIORITY_RECOMMENDATIONS), ("chat", PRIORITY_CHAT)):
+        thread = threading.Thread(target=wait_for_turn, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        while limiter.stats()["queued"] < len(threads):
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["chat", "report-1", "report-2", "background"]
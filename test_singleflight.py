@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Offline checks for request coalescing in SingleFlight and AsyncSingleFlight
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+
+from ai_cache import MemoryCache
+from singleflight import AsyncSingleFlight, FlightTimeout, SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(flight.do, "key", fetch) for _ in range(5)]
+        while flight.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert results == ["answer"] * 5 and len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4, "remote_hits": 0}
+
+
+def test_followers_share_the_leaders_error():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        raise ConnectionError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "key", fetch)
+        started.wait(5)
+        follower = pool.submit(flight.do, "key", fetch)
+        while flight.coalesced < 1:
+            time.sleep(0.01)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ConnectionError):
+                future.result(5)
+
+
+def test_follower_gives_up_at_its_deadline_while_the_leader_finishes():
+    cache = MemoryCache()
+    flight = SingleFlight(cache)
+    started = threading.Event()
+
+    def fetch():
+        started.set()
+        time.sleep(0.3)
+        cache.set("key", "answer")
+        return "answer"
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flight.do, "key", fetch)
+        started.wait(5)
+        waited = time.monotonic()
+        with pytest.raises(FlightTimeout):
+            flight.do("key", fetch, deadline=time.monotonic() + 0.05)
+        assert time.monotonic() - waited < 0.25
+        assert leader.result(5) == "answer"
+    assert cache.get("key") == "answer"
+
+
+def test_leader_reuses_a_value_cached_since_the_callers_lookup():
+    cache = MemoryCache()
+    cache.set("key", "cached")
+    assert SingleFlight(cache).do("key", lambda: pytest.fail("must not call upstream")) == "cached"
+
+
+def test_claimed_key_is_followed_until_finished():
+    flight = SingleFlight()
+    call = flight.claim("key")
+    assert call is not None and flight.claim("key") is None
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        follower = pool.submit(flight.do, "key", lambda: pytest.fail("must follow the claim"))
+        while flight.coalesced < 1:
+            time.sleep(0.01)
+        flight.finish("key", call, "streamed answer")
+        assert follower.result(5) == "streamed answer"
+    assert flight.claim("key") is not None
+
+
+def test_async_callers_share_one_call_and_time_out_alone():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return "answer"
+
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        with pytest.raises(FlightTimeout):
+            await flight.do("key", fetch, deadline=time.monotonic() + 0.05)
+        results = await asyncio.gather(leader, flight.do("key", fetch))
+        return results, calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == ["answer", "answer"] and len(calls) == 1